@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""
+ecmwf_derived
+quantities derived from the raw forecast parameters, computed once per forecast
+run over entire series and stored next to the raw parameters in forecast.json
+"""
+
+import numpy as np
+from datetime import datetime, timezone
+
+
+def wind_speed(
+        u: np.ndarray,
+        v: np.ndarray
+) -> np.ndarray:
+    return np.hypot(u, v)
+
+
+def wind_direction(
+        u: np.ndarray,
+        v: np.ndarray
+) -> np.ndarray:
+    """
+    meteorological convention, direction the wind blows from, 0° is north
+    """
+    return (180. + np.degrees(np.arctan2(u, v))) % 360.
+
+
+def relative_humidity(
+        t: np.ndarray,
+        td: np.ndarray
+) -> np.ndarray:
+    """
+    Magnus formula over water (Alduchov and Eskridge, 1996)
+    :param t: temperature [K]
+    :param td: dew point temperature [K]
+    :return: relative humidity [%]
+    """
+    def saturation(x): return np.exp(17.625 * (x - 273.15) / (x - 30.11))
+
+    return 100. * saturation(td) / saturation(t)
+
+
+def deaccumulate(
+        accumulated: np.ndarray,
+        seconds: np.ndarray
+) -> np.ndarray:
+    """
+    mean rate between consecutive steps of a field accumulated since base time
+    :param accumulated: accumulated values
+    :param seconds: validity times [s]
+    :return: rates per second, one entry less than accumulated
+    """
+    return np.diff(accumulated) / np.diff(seconds)
+
+
+# derived parameter name: unit, raw parameters the formula depends on, formula,
+# scale factor, and whether the raw parameter is accumulated since base time
+REGISTRY = {
+    "10 metre wind speed": {
+        "unit": "m s**-1",
+        "depends": ["10 metre U wind component", "10 metre V wind component"],
+        "formula": wind_speed
+    },
+    "10 metre wind direction": {
+        "unit": "Degree true",
+        "depends": ["10 metre U wind component", "10 metre V wind component"],
+        "formula": wind_direction
+    },
+    "2 metre relative humidity": {
+        "unit": "%",
+        "depends": ["2 metre temperature", "2 metre dewpoint temperature"],
+        "formula": relative_humidity
+    },
+    "Mean surface downward short-wave radiation flux": {
+        "unit": "W m**-2",
+        "depends": ["Surface short-wave (solar) radiation downwards"],
+        "formula": deaccumulate,
+        "accumulated": True
+    },
+    "Mean total precipitation rate": {
+        "unit": "kg m**-2 s**-1",
+        "depends": ["Total precipitation"],  # [m]
+        "formula": deaccumulate,
+        "scale": 1000.,  # density of water
+        "accumulated": True
+    }
+}
+
+
+def derive(forecast: dict) -> dict:
+    """
+    compute all derived parameters whose raw parameters are available
+    :param forecast: raw parameters of a single forecast run
+    :return: derived parameters in the format of forecast.json
+    """
+    result = dict()
+
+    for name, spec in REGISTRY.items():
+        if not all(i in forecast for i in spec['depends']):
+            continue
+        time = forecast[spec['depends'][0]]['time']
+        if any(forecast[i]['time'] != time for i in spec['depends'][1:]):
+            print("Validity times of {} differ. Skipping {} ..."
+                  .format(spec['depends'], name))
+            continue
+        order = np.argsort(time)
+        time = [time[i] for i in order]
+        args = [np.asarray(forecast[i]['value'], dtype=float)[order]
+                for i in spec['depends']]
+        if spec.get('accumulated'):
+            if len(time) < 2:
+                continue
+            args.append(np.array([
+                datetime.strptime(i, "%Y%m%d%H%M")
+                .replace(tzinfo=timezone.utc).timestamp() for i in time
+            ]))
+            time = time[1:]  # rate valid for the interval ending at time
+        result[name] = {
+            "unit": spec['unit'],
+            "time": time,
+            "value": (spec['formula'](*args) * spec.get('scale', 1.)).tolist()
+        }
+        print("Derived parameter: {}".format(name))
+
+    return result
@@ -15,44 +15,146 @@ pygrib docu
 https://jswhit.github.io/pygrib/index.html
 """
 
-from ecmwf.opendata import Client
-import pygrib
 import os
+import sys
 import argparse
-from scipy.interpolate import RegularGridInterpolator
 import numpy as np
 import json
+import re
 import math
+import resource
+from time import sleep
+from random import uniform
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+# internal
+from ecmwf_derived import derive
+from ecmwf_series import ForecastSeries, to_datetime64, to_json
+from ecmwf_cube import CubeWriter, box_indices, cell_indices, BOX
+from ecmwf_profile import (ProfileSeries, TYPE_OF_LEVEL, SHORT_NAMES, stack,
+                           fill, pwv, save)
+from ecmwf_ensemble import EnsembleSeries, save as save_ensemble
+from ecmwf_decode import run, messages_of
+from ecmwf_notify import summary, publish
 
 SPATIAL_RESOLUTION: float = 0.25
 # data directory relative to source
 DATA_DIR = "{}/../data".format(os.path.dirname(os.path.realpath(__file__)))
+LOG_FILE = "{}/forecast.json".format(DATA_DIR)
+CUBE_DIR = "{}/cube".format(DATA_DIR)
+PROFILE_DIR = "{}/profile".format(DATA_DIR)
+ENSEMBLE_DIR = "{}/ensemble".format(DATA_DIR)
+INDEX_DIR = "{}/indices".format(DATA_DIR)
+EVENT_DIR = "{}/events".format(DATA_DIR)
+PROVIDER = "ECMWF"
+# ENS: control (0) and perturbed members
+MEMBERS = list(range(51))
+MAX_RETRIES = 5  # of incomplete downloads
+BACKOFF = 10.  # base of the jittered backoff [s]
+BANDWIDTH = 10.  # assumed download rate of the plan [MB/s]
+# IFS cycle 50r1: 06 and 18 UTC runs of HRES in stream oper instead of scda
+IFS_50R1 = datetime(2026, 5, 12)
+# forecast.json as last written by this process, e.g. by the daemon, to skip
+# parsing it again on the next write
+_STORE: dict = dict()
+# interpolation weights per grid cell
+_WEIGHTS: dict = dict()
 
 
 def write_log(
         datetimestr: str,
-        forecast: dict
+        forecast: dict,
+        retention: dict = None
 ) -> None:
     """
-    update log.json
+    update forecast.json atomically, i.e. write a temporary file and replace,
+    apply retention policy if provided
     :param datetimestr: YYYYMMDDHH
     :param forecast:
+    :param retention: retention policy, see compact()
     :return: None
     """
-    log_file = "{}/forecast.json".format(DATA_DIR)
-    if not os.path.exists(log_file):
-        with open(log_file, "w") as create_empty:
-            json.dump({}, create_empty)
-            os.chmod(log_file, 0o666)  # docker owner is root, anyone can delete
-    with open(log_file, "r+") as jsonFile:
-        data = json.load(jsonFile)
+    data = dict()
+    size = 0
+    if os.path.exists(LOG_FILE):
+        stat = os.stat(LOG_FILE)
+        size = stat.st_size
+        if _STORE.get('version') == (stat.st_mtime_ns, stat.st_size):
+            data = _STORE['data']  # unchanged since last write
+        else:
+            with open(LOG_FILE, "r") as jsonFile:
+                data = json.load(jsonFile)
+    if datetimestr:
         data[datetimestr] = forecast
-        jsonFile.seek(0)  # rewind
+    if retention:
+        data = compact(data=data, retention=retention)
+    with open(LOG_FILE + ".tmp", "w") as jsonFile:
         json.dump(data,
                   jsonFile,
                   indent=2,
                   sort_keys=True)
-        jsonFile.truncate()
+    os.chmod(LOG_FILE + ".tmp", 0o666)  # docker owner is root, anyone can delete
+    os.replace(LOG_FILE + ".tmp", LOG_FILE)
+    stat = os.stat(LOG_FILE)
+    _STORE['version'] = (stat.st_mtime_ns, stat.st_size)
+    _STORE['data'] = data
+    print("File '{}' size: {} -> {} bytes".format(
+        os.path.basename(LOG_FILE), size, stat.st_size))
+    if datetimestr:
+        # subscribers notified once the run is committed
+        publish(directory=EVENT_DIR,
+                event=summary(provider=PROVIDER,
+                              datetimestr=datetimestr,
+                              forecast=forecast))
+
+
+def compact(
+        data: dict,
+        retention: dict,
+        now: datetime = None
+) -> dict:
+    """
+    apply retention policy on forecast runs: keep full runs for "full_days",
+    then reduce runs to the 00/12 cycles ("reduction": "cycles") or to the
+    first 24 hrs of each run ("reduction": "first24h") until "reduced_days",
+    drop runs thereafter
+    :param data: content of forecast.json
+    :param retention: see parameter.json
+    :param now: reference time, default=current time
+    :return: compacted content
+    """
+    now = now or datetime.now(timezone.utc)
+    full = timedelta(days=retention.get('full_days', 36500))
+    reduced = timedelta(days=retention.get('reduced_days', 0))
+    result = dict()
+    dropped, truncated = 0, 0
+
+    for datetimestr, forecast in data.items():
+        issue = datetime.strptime(datetimestr, "%Y%m%d%H%M") \
+            .replace(tzinfo=timezone.utc)
+        if now - issue <= full:
+            result[datetimestr] = forecast
+        elif now - issue > max(full, reduced):
+            dropped += 1
+        elif retention.get('reduction') == "first24h":
+            until = (issue + timedelta(hours=24)).strftime("%Y%m%d%H%M")
+            result[datetimestr] = dict()
+            for param, values in forecast.items():
+                keep = [i for i, t in enumerate(values['time']) if t <= until]
+                result[datetimestr][param] = {
+                    **values,
+                    "time": [values['time'][i] for i in keep],
+                    "value": [values['value'][i] for i in keep]
+                }
+                truncated += len(values['time']) - len(keep)
+        elif issue.hour in (0, 12):  # reduction "cycles"
+            result[datetimestr] = forecast
+        else:
+            dropped += 1
+    print("Compaction: {} run(s) dropped, {} entries truncated"
+          .format(dropped, truncated))
+
+    return result
 
 
 def create_grid(
@@ -80,18 +182,492 @@ def create_grid(
     }
 
 
+def verify_grib(target: str) -> tuple[int, int]:
+    """
+    walk the GRIB messages of the file: each starts with "GRIB", its total
+    length (section 0) fits into the file, and it ends with "7777"
+    :param target: grib file
+    :return: number of complete messages, bytes up to the end of the last
+    complete message
+    """
+    messages = position = 0
+    size = os.path.getsize(target)
+    with open(target, "rb") as grib_handle:
+        while position < size:
+            grib_handle.seek(position)
+            header = grib_handle.read(16)
+            if len(header) < 16 or header[:4] != b"GRIB":
+                break
+            length = int.from_bytes(header[8:16], "big") if header[7] == 2 \
+                else int.from_bytes(header[4:7], "big")
+            if length < 16 or position + length > size:
+                break
+            grib_handle.seek(position + length - 4)
+            if grib_handle.read(4) != b"7777":
+                break
+            position += length
+            messages += 1
+
+    return messages, position
+
+
+def interpolate(
+        data: np.ndarray,
+        lats: np.ndarray,
+        lons: np.ndarray,
+        coordinates: np.ndarray
+) -> float:
+    """
+    linear interpolation at coordinates within the grid cell, weights are
+    computed once per grid cell and location, e.g. changed in parameter.json
+    between runs of a worker of the daemon
+    :param data: values of the grid cell
+    :param lats:
+    :param lons:
+    :param coordinates:
+    :return: value at coordinates
+    """
+    key = (tuple(lats[:, 0]), tuple(lons[0, :]), tuple(coordinates))
+    if key not in _WEIGHTS:
+        from scipy.interpolate import RegularGridInterpolator
+        # interpolation of unit vectors yields the weight of each grid point
+        _WEIGHTS[key] = RegularGridInterpolator(
+            key[:2],
+            np.eye(data.size).reshape(data.shape + (data.size,)),
+            method='linear'
+        )(coordinates)[0]
+
+    return float(_WEIGHTS[key] @ data.ravel())
+
+
+def peak_memory() -> float:
+    """
+    :return: peak resident set size of the process [MB], i.e. since its start
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def data_url(
+        root: str,
+        date: datetime,
+        step: int,
+        stream: str = "oper",
+        type: str = "fc",
+        model: str = "ifs",
+        resol: str = "0p25"
+) -> str:
+    """
+    grib file of a forecast run and step on the open data portal, as named by
+    ecmwf-opendata, its index file ends with .index instead of .grib2
+    :param root: e.g. Client().url
+    :param date: base time of the forecast run
+    :param step:
+    :param stream: oper | enfo
+    :param type: fc | cf | pf
+    :param model: ifs | aifs-single
+    :param resol: 0p25
+    :return:
+    """
+    if stream == "oper" and date.hour in (6, 18) and date < IFS_50R1:
+        stream = "scda"
+    return "{0}/{1:%Y%m%d}/{1:%H}z/{2}/{3}/{4}/{1:%Y%m%d%H%M%S}-{5}h-{4}-{6}" \
+        ".grib2".format(root, date, model, resol, stream, step,
+                        "ef" if type in ("cf", "pf") else type)
+
+
+def index_parts(
+        session,
+        url: str,
+        params: list[str],
+        group: dict
+) -> list[list[int]]:
+    """
+    byte ranges of the messages of the grib file selected from its index file,
+    as requested by ecmwf-opendata
+    :param session: requests.Session
+    :param url: grib file, see data_url()
+    :param params: shortNames, all if empty
+    :param group: type and optional numbers of the members, see
+    member_groups()
+    :return: [offset, length] per message in file order
+    """
+    response = session.get(url.rsplit(".", 1)[0] + ".index")
+    response.raise_for_status()
+    numbers = {str(i) for i in group.get('number', list())}
+    parts = list()
+    for line in response.iter_lines():
+        entry = json.loads(line)
+        if (params and entry.get('param') not in params) \
+                or entry.get('type') != group['type'] \
+                or (numbers and entry.get('number') not in numbers):
+            continue
+        parts.append([entry['_offset'], entry['_length']])
+
+    return sorted(parts)
+
+
+def member_groups(
+        members: list[int],
+        workers: int
+) -> list[dict]:
+    """
+    control and perturbed members of ENS split into a group per worker, each
+    fetched into a target of its own
+    :param members: 0 = control to 50
+    :param workers: number of groups of perturbed members at most
+    :return: request of ecmwf-opendata per group, i.e. type and numbers
+    """
+    perturbed = [i for i in members if i]
+    size = -(-len(perturbed) // workers) if perturbed else 1
+
+    return ([{"type": "cf"}] if 0 in members else list()) + [
+        {"type": "pf", "number": perturbed[i:i + size]}
+        for i in range(0, len(perturbed), size)]
+
+
+def download(
+        client,
+        target: str,
+        **request
+):
+    """
+    retrieve and verify the GRIB messages, incomplete downloads are retried
+    with a jittered backoff. A corrupt tail is truncated after the last retry.
+    :param client: ecmwf.opendata.Client
+    :param target: grib file
+    :param request: request of ecmwf-opendata, e.g. step, type, param
+    :return: result of the client
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            delay = uniform(0., BACKOFF * 2 ** attempt)  # full jitter
+            print("Download incomplete, retry {} in {:.1f} s".format(
+                attempt, delay))
+            sleep(delay)
+        results = client.retrieve(target=target, **request)
+        # size of all byte ranges of the index vs. size downloaded
+        expected = sum(length for _, parts in results.urls
+                       for _, length in parts)
+        messages, valid = verify_grib(target=target)
+        print("Downloaded {} of {} bytes, {} complete GRIB messages"
+              .format(results.size, expected, messages))
+        if results.size == expected == valid:
+            break
+    else:
+        # keep complete messages only, rather than a corrupt tail
+        os.truncate(target, valid)
+        print("File '{}' truncated to {} bytes".format(
+            os.path.basename(target), valid))
+    print(
+        "Target file: {0}\n"
+        "Forecast Run (base time): {1}\n"
+        "URL(s) requested: {2}\n"
+        .format(results.target, results.datetime, results.urls)
+    )
+
+    return results
+
+
+def fetch_ensemble(
+        config: dict,
+        steps: list,
+        coords: np.ndarray,
+        grid: dict,
+        delete: bool = False,
+        session=None,
+        cycle: dict = None
+) -> None:
+    """
+    ENS: the control and groups of perturbed members are fetched concurrently
+    into a target each, interpolated at the location into member x step series
+    per parameter. Their statistics are stored per forecast run, forecast.json
+    is not affected. See ecmwf_ensemble.
+    :param config: content of parameter.json
+    :param steps:
+    :param coords: latitude, longitude of the location
+    :param grid: grid cell around the location
+    :param delete: no deletion of the temporary grib files, if True
+    :param session: shared requests.Session, e.g. of forecast-daemon
+    :param cycle: date and time of the forecast run, default=most recent
+    :return:
+    """
+    settings = config['ensemble']
+    members = settings.get('members', MEMBERS)
+    groups = member_groups(members=members,
+                           workers=settings.get('workers', 4))
+
+    import pygrib
+    from ecmwf.opendata import Client
+    client = Client()
+    if session is not None:
+        client.session = session  # shared connection pool
+    request = {
+        "stream": "enfo",
+        "step": steps,
+        "param": config['parameter'],
+        "model": "ifs",
+        "resol": "0p25"
+    }
+    # all groups of the same forecast run, even if a new one is published
+    if cycle:
+        request.update(cycle)
+    else:
+        request['date'] = client.latest(stream="enfo",
+                                        type="cf",
+                                        step=steps[-1],
+                                        model="ifs",
+                                        resol="0p25")
+    targets = ["{}/ensemble_{}.grib2".format(DATA_DIR, i)
+               for i in range(len(groups))]
+    with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        results = list(executor.map(
+            lambda x: download(client=client, target=x[0], **request, **x[1]),
+            zip(targets, groups)))
+
+    index = {step: i for i, step in enumerate(steps)}
+    ensemble: dict[str, EnsembleSeries] = dict()
+    for target in targets:
+        os.chmod(target, 0o666)  # docker owner is root, anyone can delete
+        fsss = pygrib.open(target)
+        for item in fsss:
+            if item['endStep'] not in index or item['number'] not in members:
+                continue
+            data, lats, lons = item.data(**grid)
+            if item['name'] not in ensemble:
+                ensemble[item['name']] = EnsembleSeries(unit=item['units'],
+                                                        members=len(members),
+                                                        size=len(steps))
+            series = ensemble[item['name']]
+            series.time[index[item['endStep']]] = to_datetime64(
+                date=item['validityDate'],
+                time=item['validityTime']
+            )
+            series.value[members.index(item['number']),
+                         index[item['endStep']]] = interpolate(
+                data=data,
+                lats=lats,
+                lons=lons,
+                coordinates=coords)
+        fsss.close()
+        if not delete:
+            os.remove(target)
+            print("File '{}' deleted".format(os.path.basename(target)))
+
+    save_ensemble(ensemble=ensemble,
+                  directory=ENSEMBLE_DIR,
+                  datetimestr=results[0].datetime.strftime("%Y%m%d%H%M"),
+                  percentiles=settings.get('percentiles'),
+                  thresholds=settings.get('thresholds'))
+
+
+def decode(
+        target: str,
+        batch: list[tuple[int, int]],
+        grid: dict,
+        coordinates: np.ndarray,
+        steps: list,
+        box: float = None,
+        names: list = None
+) -> list[dict]:
+    """
+    decode a batch of messages one at a time, see ecmwf_decode
+    :param target: grib file
+    :param batch: offset and length of the messages
+    :param grid: grid cell around the location
+    :param coordinates: latitude, longitude of the location
+    :param steps: steps requested, others are skipped prior to decoding
+    :param box: half width of the box of the cube [deg], no box if None
+    :param names: shortNames of the profile, no profile if None
+    :return: records of the messages in file order
+    """
+    records = list()
+    for item in messages_of(target=target, batch=batch):
+        print(item)
+        if item['endStep'] not in steps:
+            print("Step {} not requested. Skipping ...".format(item['endStep']))
+            continue
+        # decoded once for the grid cell and the box
+        values = item.values
+        geometry = (item['gridType'], item['Ni'], item['Nj'],
+                    item['latitudeOfFirstGridPointInDegrees'],
+                    item['longitudeOfFirstGridPointInDegrees'])
+        rows, cols, lats, lons = cell_indices(geometry=geometry,
+                                              item=item,
+                                              grid=grid)
+        data = values[np.ix_(rows, cols)]
+        record = {
+            "name": item['name'],
+            "shortName": item['shortName'],
+            "units": item['units'],
+            "level": item['level'],
+            "step": item['endStep'],
+            "validity": (item['validityDate'], item['validityTime']),
+            "run": "{}{:04d}".format(item['dataDate'], item['dataTime']),
+            "field": item['numberOfValues'] * 8
+        }
+        if names is not None and item['typeOfLevel'] == TYPE_OF_LEVEL \
+                and item['shortName'] in names:
+            record['cell'] = (data, lats, lons)
+        else:
+            record['value'] = interpolate(data=data,
+                                          lats=lats,
+                                          lons=lons,
+                                          coordinates=coordinates)
+            if box is not None:
+                rows, cols, box_lats, box_lons = box_indices(
+                    geometry=geometry,
+                    item=item,
+                    coordinates=coordinates,
+                    box=box
+                )
+                record['box'] = (box_lats, box_lons,
+                                 values[np.ix_(rows, cols)])
+        records.append(record)
+        del data, values
+
+    return records
+
+
+def plan(
+        extended: bool = False,
+        session=None
+) -> None:
+    """
+    dry run: byte ranges of each step resolved from the index files only,
+    which are cached per forecast run and request in INDEX_DIR. Ranges,
+    bytes, and requests are reported per step and in total, nothing is
+    downloaded.
+    :param extended: plan 10-day forecast, 90-hr forecast otherwise
+    :param session: shared requests.Session
+    :return:
+    """
+    from ecmwf.opendata import Client
+
+    config = json.load(open("{}/parameter.json".format(DATA_DIR), "r"))
+    params: list = config.get('parameter', list())
+    if not params:
+        print("Caveat: no parameter selected, entire files are downloaded!")
+    if config.get('profile'):
+        params = params + [
+            i for i in config['profile'].get('shortName', SHORT_NAMES)
+            if i not in params]
+    steps: list = list(range(0, 144, 3)) + list(range(144, 241, 6)) \
+        if extended else list(range(0, 91, 3))
+    request = {
+        "step": steps,
+        "param": params,
+        "model": "ifs",
+        "resol": "0p25"
+    }
+    if config.get('ensemble'):
+        # groups as fetched by fetch_ensemble()
+        groups = member_groups(
+            members=config['ensemble'].get('members', MEMBERS),
+            workers=config['ensemble'].get('workers', 4))
+        request['stream'] = "enfo"
+    else:
+        groups = [{"type": "fc"}]
+
+    client = Client()
+    if session is not None:
+        client.session = session  # shared connection pool
+    request['date'] = client.latest(type=groups[0]['type'],
+                                    step=steps[-1],
+                                    **{k: v for k, v in request.items()
+                                       if k not in ("step", "param")})
+    datetimestr = request['date'].strftime("%Y%m%d%H%M")
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    cache = "{}/{}.json".format(INDEX_DIR, datetimestr)
+    key = json.dumps([request, groups], sort_keys=True, default=str)
+    cached = json.load(open(cache, "r")) if os.path.exists(cache) else dict()
+    if key not in cached:
+        # index files of all steps, a file and range request per group
+        cached[key] = [
+            [url, index_parts(session=client.session,
+                              url=url,
+                              params=params,
+                              group=group)]
+            for group in groups for url in (
+                data_url(root=client.url,
+                         date=request['date'],
+                         step=step,
+                         stream=request.get('stream', "oper"),
+                         type=group['type']) for step in steps)]
+        # files without messages selected are not requested
+        cached[key] = [i for i in cached[key] if i[1]]
+        with open(cache, "w") as f:
+            json.dump(cached, f)
+        os.chmod(cache, 0o666)  # docker owner is root, anyone can delete
+    else:
+        print("Index files of run {} cached".format(datetimestr))
+
+    # one file per step and type, an index and a (multi-)range request each
+    per_step: dict[int, list] = {step: [0, 0, 0] for step in steps}
+    for url, parts in cached[key]:
+        entry = per_step[int(re.search(r"-(\d+)h-", url).group(1))]
+        entry[0] += len(parts)
+        entry[1] += sum(length for _, length in parts)
+        entry[2] += 2
+    print("Plan of forecast run {}, {}".format(
+        datetimestr, " and ".join(i['type'] for i in groups)))
+    for step, (ranges, size, requests) in per_step.items():
+        print("Step {:03d}: {} range(s), {:.2f} MB, {} request(s)".format(
+            step, ranges, size / 1e6, requests))
+    ranges, size, requests = (sum(i) for i in zip(*per_step.values()))
+    print("Total: {} file(s), {} range(s), {:.2f} MB, {} request(s)".format(
+        len(cached[key]), ranges, size / 1e6, requests))
+    bandwidth = config.get("bandwidth", BANDWIDTH)
+    print("Estimated wall time: {:.0f} s at {} MB/s".format(
+        size / (bandwidth * 1e6), bandwidth))
+
+
 def main(
         extended: bool = False,
-        delete: bool = False
+        delete: bool = False,
+        compact_only: bool = False,
+        session=None,
+        workers: int = 1,
+        pool=None,
+        date: str = None,
+        time: int = None
 ) -> None:
+    """
+    :param extended: fetch 10-day forecast, 90-hr forecast otherwise
+    :param delete: no deletion of the temporary grib file, if True
+    :param compact_only: apply retention policy on forecast.json only
+    :param session: shared requests.Session, e.g. of forecast-daemon
+    :param workers: number of processes decoding the grib file
+    :param pool: multiprocessing pool, e.g. of forecast-daemon, overrides
+    workers
+    :param date: YYYYMMDD of the forecast run, e.g. probed by forecast-daemon,
+    default=most recent
+    :param time: hour of the forecast run, default=most recent
+    :return:
+    """
     file_default = "data.grib2"
     date_creation = None
-    dict_x: dict = {}
+    # series of each parameter preallocated by step
+    forecast: dict[str, ForecastSeries] = dict()
 
     config_file = "{}/parameter.json".format(DATA_DIR)
     config = json.load(open(config_file, "r"))
+
+    if compact_only:
+        if not config.get('retention'):
+            print("No retention policy defined in {}".format(config_file))
+            return
+        write_log(datetimestr=None,
+                  forecast=None,
+                  retention=config['retention'])
+        return
+
     target: str = "{}/{}".format(DATA_DIR, file_default)
     params: list = config['parameter']
+    # optional vertical profiles, all pressure levels of the shortNames
+    profile_config = config.get('profile')
+    if profile_config:
+        names = profile_config.get('shortName', SHORT_NAMES)
+        params = params + [i for i in names if i not in params]
 
     if extended:
         # HRES 	00 and 12 	0 to 144 by 3, 144 to 240 by 6
@@ -102,15 +678,36 @@ def main(
         steps: list = list(range(0, 91, 3))
         print("Fetching 90-hr Forecast")
 
+    index = {step: i for i, step in enumerate(steps)}
+    # forecast run, if given
+    cycle = {k: v for k, v in (("date", date), ("time", time))
+             if v is not None}
+
     coords = np.array([config['geo_coordinates']['latitude'],
                        config['geo_coordinates']['longitude']])
     # place a grid cell over the region to be used for forecast
     grid = create_grid(coordinates=coords,
                        resolution=SPATIAL_RESOLUTION)
     # print(coords, grid)
+    if config.get('ensemble'):
+        # neither cube nor profile
+        fetch_ensemble(config=config,
+                       steps=steps,
+                       coords=coords,
+                       grid=grid,
+                       delete=delete,
+                       session=session,
+                       cycle=cycle)
+        return
     if not os.path.exists(target):
+        # multiurl and requests loaded on download only
+        from ecmwf.opendata import Client
         client = Client()
-        results = client.retrieve(
+        if session is not None:
+            client.session = session  # shared connection pool
+        results = download(
+            client=client,
+            target=target,
             step=steps,
             type="fc",  # default
             param=params,
@@ -118,51 +715,92 @@ def main(
             model="ifs",  # ifs for the physics-driven model and aifs for the data-driven model
             resol="0p25",
             # preserve_request_order=True,  # ignored anyway
-            target=target,
-            # date='20241212',
-            # time=00
-        )
-        print(
-            "Target file: {0}\n"
-            "Forecast Run (base time): {1}\n"
-            "URL(s) requested: {2}\n"
-            .format(results.target, results.datetime, results.urls)
+            **cycle  # e.g. date='20241212', time=0
         )
         date_creation = results.datetime.strftime("%Y%m%d%H%M")
     os.chmod(target, 0o666)  # docker owner is root, anyone can delete
 
-    fsss = pygrib.open(target)
-    fss = fsss.read()
-    fsss.close()
-    for item in fss:
-        print(item)
-        data, lats, lons = item.data(**grid)
-        nearest_neighbor = RegularGridInterpolator(
-            (lats[:, 0], lons[0, :]),
-            data,
-            method='linear'
+    # optional box around the location per step, appended to a cube file
+    cube = CubeWriter(directory=CUBE_DIR, size=len(steps)) \
+        if config.get('cube') else None
+    # shortName: series, and cells of the profile messages per step
+    profile: dict[str, ProfileSeries] = dict()
+    cells: dict[int, list] = dict()
+
+    # messages scanned once, batches decoded by a pool of processes if more
+    # than one worker, each field released as soon as its values at the
+    # location (and its box) are taken
+    records = run(function=decode,
+                  target=target,
+                  workers=workers,
+                  pool=pool,
+                  grid=grid,
+                  coordinates=coords,
+                  steps=steps,
+                  box=config['cube'].get('box', BOX) if cube else None,
+                  names=names if profile_config else None)
+    # merged in step order, messages of a step in file order
+    records.sort(key=lambda x: index[x['step']])
+    field = 0  # size of the largest field decoded [bytes]
+    for record in records:
+        step_index = index[record['step']]
+        validity = "{}{:04d}".format(*record['validity'])
+        field = max(field, record['field'])
+        if "cell" in record:
+            # level stack interpolated per step, once all messages are read
+            data, lats, lons = record['cell']
+            cells.setdefault(step_index, list()).append((
+                record['shortName'], record['units'], record['level'], data,
+                validity, lats, lons))
+            continue
+        if cube:
+            cube.append(key=record['name'],
+                        unit=record['units'],
+                        index=step_index,
+                        time=validity,
+                        lats=record['box'][0],
+                        lons=record['box'][1],
+                        values=record['box'][2])
+        if record['name'] not in forecast:
+            forecast[record['name']] = ForecastSeries(unit=record['units'],
+                                                      size=len(steps))
+        forecast[record['name']].time[step_index] = to_datetime64(
+            date=record['validity'][0],
+            time=record['validity'][1]
         )
-        value_at_coordinates = list(nearest_neighbor(coords))[0]
-        dt_str = "{}{:04d}".format(
-                item['validityDate'],
-                item['validityTime']
-            )
-        # create a global dict
-        try:
-            dict_x[item['name']]['time'].append(dt_str)
-            dict_x[item['name']]['value'].append(value_at_coordinates)
-        except KeyError:
-            dict_x[item['name']] = {
-                "unit": item['units'],
-                "time": [dt_str],
-                "value": [value_at_coordinates]
-            }
+        forecast[record['name']].value[step_index] = record['value']
 
         if not date_creation:
-            date_creation = "{}{:04d}".format(
-                item["dataDate"],
-                item["dataTime"]
-            )  # grab from last message if temp file exists
+            # grab from first message if temp file exists
+            date_creation = record['run']
+    print("Peak memory: {:.1f} MB, largest field: {:.1f} MB".format(
+        peak_memory(), field / 2 ** 20))
+    if cube:
+        cube.close(datetimestr=date_creation)
+    for step_index, entries in cells.items():
+        fill(profile=profile,
+             index=step_index,
+             time=entries[0][4],
+             # grid cell of the messages of the step
+             step=stack(entries=entries,
+                        lats=entries[0][5],
+                        lons=entries[0][6],
+                        coordinates=coords),
+             size=len(steps))
+
+    # conversion to JSON at the output boundary only
+    dict_x = to_json(forecast)
+    # derived quantities once per forecast run, stored next to raw parameters
+    dict_x.update(derive(dict_x))
+    if profile:
+        save(profile=profile,
+             directory=PROFILE_DIR,
+             datetimestr=date_creation)
+        if profile_config.get('altitude') is not None:
+            pwv_site = pwv(profile=profile,
+                           altitude=profile_config['altitude'])
+            if pwv_site:
+                dict_x["Precipitable water above site"] = pwv_site
 
     print(
         json.dumps(
@@ -172,7 +810,8 @@ def main(
         )
     )
     write_log(datetimestr=date_creation,
-              forecast=dict_x)
+              forecast=dict_x,
+              retention=config.get('retention'))
 
     if not delete and os.path.exists("{}/{}".format(DATA_DIR, file_default)):
         os.remove("{}/{}".format(DATA_DIR, file_default))
@@ -195,7 +834,50 @@ if __name__ == "__main__":
         help="No deletion of temporary 'data.grib2' file, default=delete)"
     )
 
+    parser.add_argument(
+        '-c',
+        '--compact',
+        action="store_true",
+        help="Apply retention policy on forecast.json only, no download"
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=1,
+        help="Number of processes decoding the grib file, default=1"
+    )
+
+    parser.add_argument(
+        '-D',
+        '--date',
+        type=str,
+        help="Date of the forecast run (YYYYMMDD), default=most recent"
+    )
+
+    parser.add_argument(
+        '-t',
+        '--time',
+        type=int,
+        help="Hour of the forecast run, default=most recent"
+    )
+
+    parser.add_argument(
+        '-n',
+        '--plan',
+        action="store_true",
+        help="Dry run: report byte ranges and requests of each step from the "
+             "index files only, no download"
+    )
+
+    if parser.parse_args().plan:
+        plan(extended=parser.parse_args().extended)
+        sys.exit(0)
     main(
         extended=parser.parse_args().extended,
-        delete=parser.parse_args().delete
+        delete=parser.parse_args().delete,
+        compact_only=parser.parse_args().compact,
+        workers=parser.parse_args().workers,
+        date=parser.parse_args().date,
+        time=parser.parse_args().time
     )
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""
+ecmwf_series
+compact forecast series preallocated by step, conversion to JSON only at the
+output boundary
+"""
+
+import numpy as np
+
+NAT = np.datetime64("NaT", "m")
+
+
+class ForecastSeries(object):
+    """
+    forecast series of a single parameter, indexed by step
+    """
+    __slots__ = ("unit", "time", "value")
+
+    def __init__(
+            self,
+            unit: str,
+            size: int
+    ):
+        self.unit = unit
+        self.time = np.full(size, NAT, dtype="datetime64[m]")
+        self.value = np.full(size, np.nan, dtype=np.float32)
+
+    def to_json(self) -> dict:
+        """
+        entries of steps filled only
+        :return: format of forecast.json
+        """
+        filled = ~np.isnat(self.time)
+        return {
+            "unit": self.unit,
+            "time": [i.replace("-", "").replace("T", "").replace(":", "")
+                     for i in np.datetime_as_string(self.time[filled],
+                                                    unit="m")],
+            # float32 resolution, avoid spurious digits in forecast.json
+            "value": [float("{:.7g}".format(i)) for i in self.value[filled]]
+        }
+
+
+def to_datetime64(
+        date: int,
+        time: int
+) -> np.datetime64:
+    """
+    :param date: YYYYMMDD, e.g. validityDate
+    :param time: HHMM, e.g. validityTime
+    :return:
+    """
+    date = str(date)
+    return np.datetime64("{}-{}-{}T{:02d}:{:02d}".format(
+        date[:4], date[4:6], date[6:8], time // 100, time % 100), "m")
+
+
+def to_json(forecast: dict[str, ForecastSeries]) -> dict:
+    """
+    :param forecast: key: series
+    :return: format of forecast.json
+    """
+    return {k: v.to_json() for k, v in forecast.items()}
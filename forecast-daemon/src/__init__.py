@@ -0,0 +1,9 @@
+__author__ = "Dr. Ralf Antonius Timmermann"
+__copyright__ = ("Copyright (c) 2025, Dr. Ralf Antonius Timmermann "
+                 "All rights reserved.")
+__credits__ = ""
+__license__ = "BSD-3-Clause"
+__version__ = "0.1.0"
+__maintainer__ = "Dr. Ralf Antonius Timmermann"
+__email__ = "rtimmermann@astro.uni-bonn.de"
+__status__ = "Prod"
\ No newline at end of file
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+
+"""
+forecast_daemon
+single long-running process hosting the downloads of ECMWF, GFS-DOWNSIZED,
+and GFS instead of one cron-started interpreter per run. The providers share
+one HTTP connection pool and one worker pool, the in-process caches of grid
+cells, interpolation weights, and forecast.json are kept between runs.
+Providers and their cycles are enabled in data/parameter.json. Instead of
+fixed times, each cycle is probed after its dissemination schedule and
+ingested as soon as it is published (see forecast_schedule).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import requests
+from requests.adapters import HTTPAdapter
+from multiprocessing import Pool
+from datetime import datetime, timedelta, timezone
+# internal
+from forecast_schedule import (Job, cycle_entry, latest_cycle, following,
+                               backoff, read_latency, record, summary)
+
+SOURCE_DIR = os.path.dirname(os.path.realpath(__file__))
+CONFIG_FILE = "{}/../data/parameter.json".format(SOURCE_DIR)
+# provider: application directory next to forecast-daemon
+PROVIDERS = {
+    "ECMWF": "ecmwf-opendata",
+    "GFS-DOWNSIZED": "gfs-downsized",
+    "GFS": "gfs"
+}
+
+# sources of the provider applications, prior to forking the worker pool
+for app in PROVIDERS.values():
+    sys.path.append(os.path.realpath("{}/../../{}/src".format(SOURCE_DIR, app)))
+
+
+class Resources(object):
+    """
+    connection and worker pool shared by all providers
+    """
+
+    def __init__(
+            self,
+            processes: int = None,
+            pool_connections: int = 10,
+            pool_maxsize: int = 10,
+            backoff: dict = None
+    ):
+        """
+        :param processes: number of worker processes, default=number of CPUs
+        :param pool_connections: number of hosts to keep connections for
+        :param pool_maxsize: max. number of connections per host
+        :param backoff: initial, maximum [s], and budget [1/min] of probes
+        """
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # renice workers on raspberry Pi
+        self.pool = Pool(processes=processes,
+                         initializer=os.nice,
+                         initargs=(19,))
+        self.backoff = backoff if backoff else dict()
+        self.clients = dict()  # clients of the providers used for probing
+
+    def close(self) -> None:
+        self.pool.close()
+        self.pool.join()
+        self.session.close()
+
+
+def probe_ecmwf(
+        resources: Resources,
+        cycle: datetime,
+        entry: dict,
+        last: bool
+) -> bool:
+    """
+    HEAD request on the grib file of the first or last step
+    """
+    from ecmwf.opendata import Client
+    from ecmwf_download import data_url
+    if "ECMWF" not in resources.clients:
+        resources.clients['ECMWF'] = Client()
+    step = (240 if entry.get('extended') else 90) if last else 0
+    url = data_url(root=resources.clients['ECMWF'].url,
+                   date=cycle.replace(tzinfo=None),
+                   step=step)
+
+    return resources.session.head(url).status_code == 200
+
+
+def probe_gfs_downsized(
+        resources: Resources,
+        cycle: datetime,
+        entry: dict,
+        last: bool
+) -> bool:
+    """
+    HEAD request on the index file of the first or last step of the model
+    """
+    from gfs_fc_client import Client
+    from gfs_fc_aux import default_steps, defined_kwargs, load_config
+    config = load_config()  # current parameter.json of GFS-DOWNSIZED
+    client = Client(
+        grid=config["grid"],
+        **defined_kwargs(
+            model=config.get('model'),
+            paramset=config.get('paramset'),
+            resol=config.get('resol'),
+            date=cycle.strftime("%Y%m%d"),
+            time=cycle.hour,
+            session=resources.session,
+            source=config.get('source'),
+            s3=config.get('s3')
+        )
+    )
+    steps = config.get("steps", default_steps(model=config.get('model')))
+    url = client.index_url(step=steps[-1] if last else steps[0])
+
+    client.throttle()  # probes count against the NOMADS rate limit
+    return resources.session.head(url).status_code == 200
+
+
+def probe_gfs(
+        resources: Resources,
+        cycle: datetime,
+        entry: dict,
+        last: bool
+) -> bool:
+    """
+    size of the grib file of the first or last step on the FTP server
+    """
+    from ftplib import FTP, error_perm
+    from gfs_download import FTP_HOST, PATH
+    filename = "{}/gfs.{}/{:02d}/atmos/gfs.t{:02d}z.pgrb2.0p25.f{:03d}".format(
+        PATH, cycle.strftime("%Y%m%d"), cycle.hour, cycle.hour,
+        384 if last else 0)
+    with FTP(FTP_HOST) as ftp:
+        ftp.login()
+        try:
+            ftp.size(filename)
+        except error_perm:  # 550 no such file
+            return False
+
+    return True
+
+
+def run_ecmwf(
+        resources: Resources,
+        cycle: datetime,
+        entry: dict
+) -> None:
+    from ecmwf_download import main
+    main(extended=entry.get('extended', False),
+         session=resources.session,
+         pool=resources.pool,
+         date=cycle.strftime("%Y%m%d"),
+         time=cycle.hour)
+
+
+def run_gfs_downsized(
+        resources: Resources,
+        cycle: datetime,
+        entry: dict
+) -> None:
+    from gfs_fc_engine import main
+    main(session=resources.session,
+         pool=resources.pool,
+         date=cycle.strftime("%Y%m%d"),
+         time=cycle.hour)
+
+
+def run_gfs(
+        resources: Resources,
+        cycle: datetime,
+        entry: dict
+) -> None:
+    from gfs_download import ftp_fetch
+    ftp_fetch(datetimestr=cycle.strftime("%Y%m%d%H"),
+              subset=entry.get('subset', 1),
+              pool=resources.pool)
+
+
+# provider: (probe, ingest). Providers are imported on their first probe
+# only, disabled ones never
+ADAPTERS = {
+    "ECMWF": (probe_ecmwf, run_ecmwf),
+    "GFS-DOWNSIZED": (probe_gfs_downsized, run_gfs_downsized),
+    "GFS": (probe_gfs, run_gfs)
+}
+
+
+def run(
+        job: Job,
+        resources: Resources
+) -> bool:
+    """
+    a failing run is reported, the daemon continues with the next one
+    :param job:
+    :param resources:
+    :return: success
+    """
+    print("{} Provider {} started".format(
+        datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        job.provider))
+    start = time.monotonic()
+    success = False
+    try:
+        ADAPTERS[job.provider][1](resources=resources,
+                                  cycle=job.cycle,
+                                  entry=job.entry)
+        success = True
+    except SystemExit as e:
+        success = not e.code
+        if e.code:
+            print("Provider {} exited with code {}".format(job.provider,
+                                                            e.code))
+    except Exception:
+        traceback.print_exc()
+    print("{} Provider {} finished after {:.0f} s".format(
+        datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        job.provider, time.monotonic() - start))
+
+    return success
+
+
+def probe(
+        job: Job,
+        resources: Resources
+) -> bool:
+    """
+    probe for the stage of the job, network errors count as not published
+    :param job:
+    :param resources:
+    :return: published
+    """
+    job.probes += 1
+    job.attempt += 1
+    try:
+        return ADAPTERS[job.provider][0](resources=resources,
+                                         cycle=job.cycle,
+                                         entry=job.entry,
+                                         last=job.stage == "complete")
+    except Exception as e:
+        print("Provider {}: probe failed: {}".format(job.provider, e))
+        return False
+
+
+def next_job(
+        provider: str,
+        settings: dict,
+        cycle: datetime,
+        now: datetime
+) -> Job:
+    """
+    :param provider: weather forecast provider
+    :param settings: section of the provider in parameter.json
+    :param cycle: base time of the forecast run
+    :param now:
+    :return: job probed from the earliest dissemination on
+    """
+    return Job(provider=provider,
+               cycle=cycle,
+               entry=cycle_entry(cycles=settings['cycles'], cycle=cycle),
+               due=max(now, cycle + timedelta(
+                   hours=settings['dissemination']['delay'])))
+
+
+def main(once: bool = False) -> None:
+    """
+    :param once: ingest the latest cycle of each enabled provider without
+    probing, then exit
+    :return:
+    """
+    with open(CONFIG_FILE, "r") as config_handle:
+        config = json.load(config_handle)
+    enabled = [i for i in ADAPTERS if config.get(i, {}).get('enabled')]
+    if not enabled:
+        print("No provider enabled in {}".format(CONFIG_FILE))
+        sys.exit(1)
+    print("Providers enabled: {}".format(", ".join(enabled)))
+
+    resources = Resources(**config.get('daemon', {}))
+    now = datetime.now(timezone.utc)
+    latency = read_latency()
+    jobs = dict()
+    for provider in enabled:
+        settings = config[provider]
+        cycle = latest_cycle(cycles=settings['cycles'],
+                             delay=settings['dissemination']['delay'],
+                             now=now)
+        ingested = latency.get(provider, {}) \
+            .get(cycle.strftime("%Y%m%d%H%M"), {}).get("ingested")
+        if not once and (ingested or now > cycle + timedelta(
+                hours=settings['dissemination']['timeout'])):
+            cycle = following(cycles=settings['cycles'], cycle=cycle)
+        jobs[provider] = next_job(provider=provider,
+                                  settings=settings,
+                                  cycle=cycle,
+                                  now=now)
+
+    try:
+        if once:
+            for job in jobs.values():
+                run(job=job, resources=resources)
+            return
+        while True:
+            job = min(jobs.values(), key=lambda x: x.due)
+            settings = config[job.provider]
+            print("Next probe: provider {}, cycle {}, stage '{}' at {}".format(
+                job.provider, job.cycle.strftime("%Y%m%d%H%M"), job.stage,
+                job.due.strftime("%Y-%m-%d %H:%M:%S")))
+            time.sleep(max(0., (job.due - datetime.now(timezone.utc))
+                           .total_seconds()))
+
+            # first step published, probe the last one right away
+            while job.stage != "ingested" and probe(job=job,
+                                                    resources=resources):
+                job.reached(stage=job.stage, now=datetime.now(timezone.utc))
+            now = datetime.now(timezone.utc)
+            if job.stage == "ingested":
+                if run(job=job, resources=resources):
+                    job.reached(stage="ingested",
+                                now=datetime.now(timezone.utc))
+            elif now < job.cycle + timedelta(
+                    hours=settings['dissemination']['timeout']):
+                job.due = now + timedelta(seconds=backoff(
+                    attempt=job.attempt - 1, **resources.backoff))
+                continue
+            else:
+                print("Provider {}, Cycle {}: not published within {} hrs. "
+                      "Skipping ...".format(
+                          job.provider, job.cycle.strftime("%Y%m%d%H%M"),
+                          settings['dissemination']['timeout']))
+            summary(provider=job.provider, cycles=record(job=job))
+            jobs[job.provider] = next_job(
+                provider=job.provider,
+                settings=settings,
+                cycle=following(cycles=settings['cycles'], cycle=job.cycle),
+                now=datetime.now(timezone.utc))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        resources.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Downloads weather forecasts from ECMWF and GFS in a "
+                    "single long-running process as soon as they are "
+                    "published.")
+    parser.add_argument(
+        '-o',
+        '--once',
+        action="store_true",
+        help="Ingest the latest cycle of each enabled provider once and exit"
+    )
+
+    main(once=parser.parse_args().once)
+    sys.exit(0)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""
+forecast_schedule
+dissemination-aware scheduling of forecast cycles (runs). From the earliest
+dissemination time of a cycle on, its first step and then its last step are
+probed with exponential backoff. Ingest starts as soon as the last step is
+published. Latencies from base time to first step published, last step
+published, and run stored are tracked per cycle in data/latency.json.
+"""
+
+import os
+import json
+from statistics import median
+from datetime import datetime, timedelta
+
+SOURCE_DIR = os.path.dirname(os.path.realpath(__file__))
+LATENCY_FILE = "{}/../data/latency.json".format(SOURCE_DIR)
+HISTORY = 120  # number of cycles kept per provider
+STAGES = ["first", "complete", "ingested"]
+
+
+class Job(object):
+    """
+    state of a single forecast cycle of a provider
+    """
+
+    def __init__(
+            self,
+            provider: str,
+            cycle: datetime,
+            entry: dict,
+            due: datetime
+    ):
+        """
+        :param provider: weather forecast provider
+        :param cycle: base time of the forecast run
+        :param entry: cycle entry of parameter.json
+        :param due: time of the next probe
+        """
+        self.provider = provider
+        self.cycle = cycle
+        self.entry = entry
+        self.due = due
+        self.stage = STAGES[0]  # stage probed for
+        self.attempt = 0  # probes in current stage
+        self.probes = 0
+        self.latency = dict()  # stage: minutes after base time
+
+    def reached(
+            self,
+            stage: str,
+            now: datetime
+    ) -> None:
+        self.latency[stage] = round((now - self.cycle).total_seconds() / 60.,
+                                    1)
+        print("Provider {}, Cycle {}: {} after {} min".format(
+            self.provider, self.cycle.strftime("%Y%m%d%H%M"), stage,
+            self.latency[stage]))
+        if stage != STAGES[-1]:
+            self.stage = STAGES[STAGES.index(stage) + 1]
+            self.attempt = 0
+
+
+def cycle_entry(
+        cycles: list[dict],
+        cycle: datetime
+) -> dict:
+    """
+    :param cycles: list of entries with "hour" (UTC) and provider options
+    :param cycle: base time
+    :return: entry of the cycle
+    """
+    return next(i for i in cycles if i['hour'] == cycle.hour)
+
+
+def latest_cycle(
+        cycles: list[dict],
+        delay: float,
+        now: datetime
+) -> datetime:
+    """
+    :param cycles: list of entries with "hour" (UTC)
+    :param delay: earliest dissemination after base time [h]
+    :param now:
+    :return: most recent cycle, whose dissemination may have started
+    """
+    base = (now - timedelta(hours=delay)).replace(minute=0,
+                                                  second=0,
+                                                  microsecond=0)
+    candidates = [base.replace(hour=i['hour']) - timedelta(days=d)
+                  for i in cycles for d in (0, 1)]
+
+    return max(i for i in candidates if i <= base)
+
+
+def following(
+        cycles: list[dict],
+        cycle: datetime
+) -> datetime:
+    """
+    :param cycles: list of entries with "hour" (UTC)
+    :param cycle: base time
+    :return: base time of the next cycle
+    """
+    hours = sorted(i['hour'] for i in cycles)
+    later = [i for i in hours if i > cycle.hour]
+
+    return cycle.replace(hour=later[0]) if later \
+        else cycle.replace(hour=hours[0]) + timedelta(days=1)
+
+
+def backoff(
+        attempt: int,
+        initial: float = 60.,
+        maximum: float = 900.,
+        budget: float = 20.
+) -> float:
+    """
+    exponential backoff between probes, never more probes per minute than the
+    budget, e.g. well below the NOMADS rate limit of 120/min
+    :param attempt: number of probes in vain
+    :param initial: first interval [s]
+    :param maximum: max. interval [s]
+    :param budget: max. probes per minute
+    :return: interval [s]
+    """
+    return max(min(initial * 2 ** attempt, maximum), 60. / budget)
+
+
+def read_latency() -> dict:
+    """
+    :return: provider: cycle: stage: minutes after base time
+    """
+    if not os.path.exists(LATENCY_FILE):
+        return dict()
+    with open(LATENCY_FILE, "r") as latency_handle:
+        return json.load(latency_handle)
+
+
+def record(job: Job) -> dict:
+    """
+    store the latencies of the job, the last HISTORY cycles are kept
+    :param job:
+    :return: latencies of all cycles of the provider
+    """
+    data = read_latency()
+    cycles = data.setdefault(job.provider, dict())
+    cycles[job.cycle.strftime("%Y%m%d%H%M")] = {
+        **job.latency,
+        "probes": job.probes
+    }
+    for key in sorted(cycles)[:-HISTORY]:
+        del cycles[key]
+    with open(LATENCY_FILE + ".tmp", "w") as latency_handle:
+        json.dump(data, latency_handle, indent=2, sort_keys=True)
+    os.chmod(LATENCY_FILE + ".tmp", 0o666)  # docker owner is root
+    os.replace(LATENCY_FILE + ".tmp", LATENCY_FILE)
+
+    return cycles
+
+
+def summary(
+        provider: str,
+        cycles: dict
+) -> None:
+    """
+    print median, min., and max. latency per stage
+    :param provider: weather forecast provider
+    :param cycles: cycle: stage: minutes after base time
+    :return:
+    """
+    for stage in STAGES:
+        values = [i[stage] for i in cycles.values() if stage in i]
+        if values:
+            print("Provider {}, latency '{}' over {} cycle(s): median {:.0f}, "
+                  "min {:.0f}, max {:.0f} min".format(
+                      provider, stage, len(values), median(values),
+                      min(values), max(values)))
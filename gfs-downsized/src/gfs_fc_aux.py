@@ -5,13 +5,68 @@ SOURCE_DIR = os.path.dirname(os.path.realpath(__file__))
 DATA_DIR = "{}/../data".format(SOURCE_DIR)
 LOG_DIR = "{}/../logs".format(SOURCE_DIR)
 
-config_file = "{}/parameter.json".format(DATA_DIR)
-with open(config_file, "r") as config_handle:
-    CONFIG = json.load(config_handle)
+CONFIG_FILE = "{}/parameter.json".format(DATA_DIR)
+# content of parameter.json, loaded explicitly by load_config(), not on import
+CONFIG: dict = dict()
 
 DATA_FILE = "{}/forecast.json".format(DATA_DIR)
+CUBE_DIR = "{}/cube".format(DATA_DIR)
+PROFILE_DIR = "{}/profile".format(DATA_DIR)
+ENSEMBLE_DIR = "{}/ensemble".format(DATA_DIR)
+INDEX_DIR = "{}/indices".format(DATA_DIR)
+EVENT_DIR = "{}/events".format(DATA_DIR)
+PROVIDER = "GFS-DOWNSIZED"
 
 STEPS = list(range(0, 121)) + list(range(123, 385, 3))  # 0 step is "anl"
+# GEFS: 3-hourly files only, up to 240 hrs for pgrb2s 0p25
+ENSEMBLE_STEPS = list(range(0, 241, 3))
+ENSEMBLE_MODELS = ["gefs"]
+BOX = 0.5  # half width of the subregion around the location [deg]
+
+
+def load_config(config_file: str = CONFIG_FILE) -> dict:
+    """
+    read parameter.json, CONFIG is updated in place, i.e. all modules having
+    imported it see the current content
+    :param config_file:
+    :return: CONFIG
+    """
+    with open(config_file, "r") as config_handle:
+        config = json.load(config_handle)
+    CONFIG.clear()
+    CONFIG.update(config)
+
+    return CONFIG
+
+
+def default_steps(model: str = None) -> list[int]:
+    """
+    :param model: gfs (default) | gefs
+    :return: steps, if not given in parameter.json
+    """
+    return ENSEMBLE_STEPS if model in ENSEMBLE_MODELS else STEPS
+
 
 def defined_kwargs(**kwargs) -> dict:
     return {k: v for k, v in kwargs.items() if v is not None}
+
+
+def subregion(
+        geo_coordinates: dict,
+        box: float = BOX
+) -> dict:
+    """
+    lat/lon box around the location for the NOMADS grib filter, longitudes
+    range from 0° to 360° as for GFS
+    :param geo_coordinates: latitude and longitude of the location
+    :param box: half width [deg], at least one grid spacing
+    :return: toplat, bottomlat, leftlon, rightlon
+    """
+    longitude = (geo_coordinates['longitude'] + 360) % 360
+
+    return {
+        "toplat": min(geo_coordinates['latitude'] + box, 90.),
+        "bottomlat": max(geo_coordinates['latitude'] - box, -90.),
+        "leftlon": longitude - box,
+        "rightlon": longitude + box
+    }
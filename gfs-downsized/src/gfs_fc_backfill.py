@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+"""
+gfs_fc_backfill
+historical backfill of past forecast runs, e.g. for a verification archive.
+Every (cycle, step) unit of a date range and list of cycles is planned up
+front, units already stored in forecast.json are skipped. The remainder is
+retrieved by a single thread pool, all requests throttled by the rate limit
+of the process, and extracted by a single process pool. All forecast runs are
+written to forecast.json in a single commit at the end.
+"""
+
+import sys
+import numpy as np
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+# internal
+from gfs_fc_download import extract, read_forecast, write_forecasts
+from gfs_fc_derived import derive, REGISTRY
+from gfs_fc_series import ForecastSeries, unpack, to_json, from_json
+from gfs_fc_engine import create_client
+from gfs_fc_aux import defined_kwargs, default_steps, load_config, CONFIG
+
+CYCLES = [0, 6, 12, 18]  # forecast runs of a day [UTC]
+
+
+def cycles(
+        start: str,
+        end: str,
+        hours: list[int] = None
+) -> list[datetime]:
+    """
+    :param start: first day YYYYMMDD
+    :param end: last day YYYYMMDD, inclusive
+    :param hours: cycles of each day, default=CYCLES
+    :return: forecast runs in chronological order
+    """
+    first = datetime.strptime(start, "%Y%m%d")
+    days = (datetime.strptime(end, "%Y%m%d") - first).days + 1
+
+    return [first + timedelta(days=i, hours=j) for i in range(days)
+            for j in sorted(hours if hours else CYCLES)]
+
+
+def plan_units(
+        runs: list[datetime],
+        steps: list[int],
+        data: dict
+) -> dict[str, tuple[dict[str, ForecastSeries], list[int]]]:
+    """
+    units of work per forecast run, i.e. steps whose validity time is stored
+    for none of the raw parameters. Derived parameters are recomputed.
+    :param runs: see cycles()
+    :param steps:
+    :param data: content of forecast.json
+    :return: YYYYMMDDHHMM: (series stored, indices of the steps missing)
+    """
+    result = dict()
+    for run in runs:
+        datetimestr = run.strftime("%Y%m%d%H%M")
+        times = np.datetime64(run, "m") + np.array(steps, dtype="m8[h]")
+        forecast = from_json(
+            forecast={k: v for k, v in data.get(datetimestr, dict()).items()
+                      if k.split(":")[0] not in REGISTRY},
+            times=times)
+        stored = np.zeros(len(steps), dtype=bool)
+        for series in forecast.values():
+            stored |= ~np.isnat(series.time)
+        result[datetimestr] = (forecast, np.flatnonzero(~stored).tolist())
+
+    return result
+
+
+def backfill(
+        start: str,
+        end: str,
+        hours: list[int] = None,
+        workers: int = 4,
+        processes: int = 1,
+        keep_target: bool = False,
+        dry_run: bool = False
+) -> None:
+    """
+    ensembles, cubes and profiles are not backfilled. The retention policy is
+    not applied, runs beyond it are dropped by the next regular run.
+    :param start: first day YYYYMMDD
+    :param end: last day YYYYMMDD, inclusive
+    :param hours: cycles of each day, default=CYCLES
+    :param workers: number of threads retrieving steps
+    :param processes: number of processes extracting steps, in this process
+    if a single one
+    :param keep_target: keep target, if True
+    :param dry_run: report the units of work only
+    :return:
+    """
+    import requests
+    from gfs_fc_client import ENSEMBLE_MODELS
+
+    load_config()
+    if CONFIG.get('model') in ENSEMBLE_MODELS:
+        print("Backfill of ensembles is not supported")
+        return
+    steps = CONFIG.get("steps", default_steps())
+    units = plan_units(runs=cycles(start=start, end=end, hours=hours),
+                       steps=steps,
+                       data=read_forecast())
+    for datetimestr, (_, missing) in units.items():
+        print("Run {}: {} of {} step(s) to be retrieved".format(
+            datetimestr, len(missing), len(steps)))
+    total = sum(len(i[1]) for i in units.values())
+    print("Units of work: {} of {}".format(total, len(units) * len(steps)))
+    if dry_run or not total:
+        return
+
+    session = requests.Session()  # shared connection pool of all clients
+    pool = Pool(processes=processes) if processes > 1 else None
+    futures = dict()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    for datetimestr, (_, missing) in units.items():
+        if not missing:
+            continue
+        client = create_client(steps=[steps[i] for i in missing],
+                               session=session,
+                               date=datetimestr[:8],
+                               time=int(datetimestr[8:10]))
+        client.prefetch(steps=[steps[i] for i in missing])
+        for index in missing:
+            future = executor.submit(
+                client.retrieve,
+                step=steps[index],
+                **defined_kwargs(
+                    target="backfill_{}.grib2".format(datetimestr)
+                )
+            )
+            futures[future] = (datetimestr, index)
+
+    # extraction as soon as a step is retrieved
+    extracted = list()
+    for future in as_completed(futures):
+        datetimestr, index = futures[future]
+        try:
+            results = future.result()
+        except (Exception,) as e:
+            print("Run {}, step {}: {}".format(datetimestr, steps[index], e))
+            continue
+        if not results.target:
+            continue
+        args = (results.target, None, keep_target, index, 0, False,
+                dict(CONFIG))
+        extracted.append((datetimestr, pool.apply_async(extract, args)
+                          if pool is not None else extract(*args)))
+    executor.shutdown()
+
+    for datetimestr, result in extracted:
+        _, payload = result.get() if pool is not None else result
+        unpack(payload=payload,
+               forecast=units[datetimestr][0],
+               size=len(steps))
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    forecasts = dict()
+    for datetimestr, (forecast, missing) in units.items():
+        if not missing or not forecast:
+            continue
+        # conversion to JSON at the output boundary only
+        dict_x = to_json(forecast)
+        dict_x.update(derive(dict_x))
+        forecasts[datetimestr] = dict_x
+    write_forecasts(forecasts=forecasts)  # single commit of all runs
+    print("Backfill: {} forecast run(s) written".format(len(forecasts)))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Backfills past forecast runs of GFS into forecast.json")
+    parser.add_argument(
+        '-f',
+        '--start',
+        type=str,
+        required=True,
+        help="First day (YYYYMMDD)"
+    )
+    parser.add_argument(
+        '-t',
+        '--end',
+        type=str,
+        required=True,
+        help="Last day (YYYYMMDD), inclusive"
+    )
+    parser.add_argument(
+        '-y',
+        '--cycles',
+        type=int,
+        nargs="+",
+        choices=CYCLES,
+        help="Forecast runs of each day, default=all"
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=4,
+        help="Number of threads retrieving steps, default=4"
+    )
+    parser.add_argument(
+        '-p',
+        '--processes',
+        type=int,
+        default=1,
+        help="Number of processes extracting steps, default=1"
+    )
+    parser.add_argument(
+        '-k',
+        '--keep_target',
+        action="store_true",
+        help="Deletion of target files disabled."
+    )
+    parser.add_argument(
+        '-n',
+        '--plan',
+        action="store_true",
+        help="Dry run: report the units of work only, no download"
+    )
+
+    backfill(
+        start=parser.parse_args().start,
+        end=parser.parse_args().end,
+        hours=parser.parse_args().cycles,
+        workers=parser.parse_args().workers,
+        processes=parser.parse_args().processes,
+        keep_target=parser.parse_args().keep_target,
+        dry_run=parser.parse_args().plan
+    )
+    sys.exit(0)
@@ -7,13 +7,19 @@ extracts grib2 file to files according to filter parameters set
 import requests
 import json
 import os
-from time import sleep
+import re
+from time import sleep, monotonic
+from random import uniform
+from threading import Lock
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
 from requests import Response, HTTPError
-from multiurl import download
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta, timezone
-from bs4 import BeautifulSoup
 # internal
-from gfs_fc_aux import DATA_DIR, LOG_DIR, STEPS, CONFIG
+from gfs_fc_aux import (DATA_DIR, LOG_DIR, CONFIG, ENSEMBLE_MODELS,
+                        defined_kwargs, default_steps)
 
 FC_TIMES = [0, 6, 12, 18]
 COMMON = "{_url}/{_model}.{_yyyymmdd}/{_H}/atmos/"
@@ -23,11 +29,160 @@ GLOBAL_LONGITUDE_LATITUDE_GRID = (COMMON
                                   + "{_model}.t{_H}z.{_params}{_set}.{_resol}.f{_fc_hour}")
 PATTERN = {
     "SLS": SEMI_LAGRANGIAN_GRID,
-    "GLOB": GLOBAL_LONGITUDE_LATITUDE_GRID
+    "GLOB": GLOBAL_LONGITUDE_LATITUDE_GRID,
+    # files of GLOB, cut by the grib filter on the server
+    "FILTER": GLOBAL_LONGITUDE_LATITUDE_GRID
 }
+# GEFS, a directory per parameter set and resolution, e.g. pgrb2sp25, and a
+# file per member, e.g. gep01.t00z.pgrb2s.0p25.f003
+COMMON_ENSEMBLE = COMMON + "{_params}{_set}{_dir_resol}/"
+ENSEMBLE_GRID = (COMMON_ENSEMBLE
+                 + "{_member}.t{_H}z.{_params}{_set}.{_resol}.f{_fc_hour}")
+# control and perturbed members of GEFS
+MEMBERS = ["gec00"] + ["gep{:02d}".format(i) for i in range(1, 31)]
 URLS = {
-    "gfs": "https://nomads.ncep.noaa.gov/pub/data/nccf/com/gfs/prod"
+    "gfs": "https://nomads.ncep.noaa.gov/pub/data/nccf/com/gfs/prod",
+    "gefs": "https://nomads.ncep.noaa.gov/pub/data/nccf/com/gens/prod",
+    "filter": "https://nomads.ncep.noaa.gov/cgi-bin/{_filter}"
 }
+SOURCES = ["NOMADS", "S3"]
+# NOAA Big Data Program, GFS on AWS Open Data, identical layout of keys as of
+# NOMADS, anonymous access
+S3 = {
+    "endpoint": "https://s3.amazonaws.com",
+    "bucket": "noaa-gfs-bdp-pds",
+    "workers": 16  # concurrent requests
+}
+S3_BUCKETS = {"gefs": "noaa-gefs-pds"}  # other than the default bucket
+RATE_LIMIT = 100  # requests per minute, NOMADS blocks at 120/minute
+MAX_RETRIES = 5  # of missing or short byte ranges
+BACKOFF = 2.  # base of the jittered backoff [s]
+CHUNK_SIZE = 1 << 20
+
+
+class _RateLimit(object):
+    """
+    sliding window over the requests of the last minute, shared by all
+    clients and threads of the process
+    """
+
+    def __init__(self, limit: int = None):
+        """
+        :param limit: requests per minute, default="rate_limit" of
+        parameter.json or RATE_LIMIT, looked up on the first request
+        """
+        self.limit = limit
+        self.stamps = deque()
+        self.lock = Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            if self.limit is None:
+                self.limit = CONFIG.get("rate_limit", RATE_LIMIT)
+            now = monotonic()
+            while self.stamps and now - self.stamps[0] >= 60.:
+                self.stamps.popleft()
+            if len(self.stamps) >= self.limit:
+                sleep(60. - (now - self.stamps.popleft()))
+            self.stamps.append(monotonic())
+
+
+RATE = _RateLimit()
+
+
+def verify_messages(
+        chunk: bytes,
+        length: int
+) -> bool:
+    """
+    byte range comprises complete GRIB messages only: expected length, each
+    message starts with "GRIB", its total length (section 0) matches, and
+    ends with "7777"
+    :param chunk: content of the byte range
+    :param length: expected length
+    :return:
+    """
+    if len(chunk) != length:
+        return False
+    position = 0
+    while position < length:
+        if chunk[position:position + 4] != b"GRIB":
+            return False
+        if chunk[position + 7] == 2:  # edition
+            size = int.from_bytes(chunk[position + 8:position + 16], "big")
+        else:
+            size = int.from_bytes(chunk[position + 4:position + 7], "big")
+        if size < 8 or chunk[position + size - 4:position + size] != b"7777":
+            return False
+        position += size
+
+    return position == length
+
+
+def multipart(
+        chunks,
+        boundary: bytes
+):
+    """
+    parse a multipart/byteranges body while streaming
+    :param chunks: iterator of bytes, e.g. Response.iter_content()
+    :param boundary: of Content-Type
+    :return: iterator of (offset, content) of each part received completely
+    """
+    buffer = bytearray()
+    delimiter = b"--" + boundary
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            start = buffer.find(delimiter)
+            header_end = buffer.find(b"\r\n\r\n", start) if start >= 0 else -1
+            if header_end < 0:
+                break  # closing delimiter or header incomplete
+            match = re.search(rb"bytes (\d+)-(\d+)/",
+                              bytes(buffer[start:header_end]), re.I)
+            if not match:
+                break
+            first, last = int(match.group(1)), int(match.group(2))
+            end = header_end + 4 + last - first + 1
+            if len(buffer) < end:
+                break
+            yield first, bytes(buffer[header_end + 4:end])
+            del buffer[:end]
+
+
+def cut(
+        chunks,
+        start: int,
+        parts: tuple[tuple[int, int], ...]
+):
+    """
+    byte ranges requested, cut from a stream of the file starting at an
+    offset, e.g. a part of the response that the server coalesced from
+    adjacent ranges, a single range comprising all, or the entire file.
+    Only the bytes of the ranges are kept.
+    :param chunks: iterator of bytes
+    :param start: offset of the first byte of the stream
+    :param parts: (offset, length) of each byte range requested
+    :return: iterator of (offset, content) of each range received completely
+    """
+    pending = dict(parts)
+    buffers = dict()
+    position = start
+    for chunk in chunks:
+        end = position + len(chunk)
+        for offset, length in pending.items():
+            if offset + length <= position or offset >= end \
+                    or (offset < position and offset not in buffers):
+                continue  # outside of the chunk, or its start is missing
+            buffers.setdefault(offset, bytearray()).extend(
+                chunk[max(offset - position, 0):
+                      min(offset + length, end) - position])
+        for offset in [i for i in buffers if len(buffers[i]) == pending[i]]:
+            yield offset, bytes(buffers.pop(offset))
+            del pending[offset]
+        if not pending:
+            return
+        position = end
 
 
 class Result:
@@ -47,10 +202,18 @@ class Client(object):
             grid,
             parameter=None,
 #            validity=None,
-            model="gfs",  # gdas, enkfgdas
+            model="gfs",  # gefs, gdas, enkfgdas
             resol="0p25",  # SLS has a resolution of 360 / 1536 !
             paramset="",
             verify=True,
+            session=None,  # shared connection pool, e.g. of the daemon
+            subregion=None,  # lat/lon box, only used with grid="FILTER"
+            filter_script=None,  # only used with grid="FILTER"
+            source="NOMADS",  # [NOMADS|S3]
+            s3=None,  # endpoint, bucket, workers, only used with source="S3"
+            member=None,  # only used with model="gefs", default control
+            steps=None,  # checked for availability, default of the model
+            cache=None,  # directory of index files kept, e.g. by the plan
             **kwargs  # for date & time
     ):
         self.parameter = parameter if parameter else list()
@@ -59,12 +222,40 @@ class Client(object):
         self.resol = resol
         self.paramset = paramset
         self.verify = verify
+        self.subregion = subregion if subregion else dict()
+        # hourly steps up to 120 hrs are served by the "_1hr" script only
+        if filter_script:
+            self.filter_script = filter_script
+        elif model in ENSEMBLE_MODELS:
+            self.filter_script = "filter_{}_atmos_{}{}.pl".format(
+                model, resol, paramset)
+        else:
+            self.filter_script = "filter_{}_{}{}.pl".format(
+                model, resol, paramset or ("_1hr" if resol == "0p25" else ""))
 #        self.validity = validity if validity else list()
-        self.session = requests.Session()
+        self.session = session if session else requests.Session()
         self.target = "download.grib2"
         self.date = None
         self.time = None
         self.lower_by_fc = False
+        assert source in SOURCES, "Value for source: [NOMADS|S3]"
+        assert not (grid == "FILTER" and source == "S3"), \
+            "Grid FILTER requires source NOMADS"
+        assert not (grid == "SLS" and model in ENSEMBLE_MODELS), \
+            "Grid SLS is not provided for ensembles"
+        self.source = source
+        self.s3 = {**S3,
+                   **defined_kwargs(bucket=S3_BUCKETS.get(model)),
+                   **(s3 if s3 else dict())}
+        self.member = member if member else MEMBERS[0]
+        self.steps = steps if steps else default_steps(model=model)
+        self._indices = dict()  # url: index file, prefetched
+        self.cache = cache
+        if source == "S3":
+            # keep the connections of all concurrent requests in the pool
+            self.session.mount(self.s3['endpoint'], HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=self.s3['workers']))
 
         # define base time at first and check availability
         self._dateandtime(**kwargs)
@@ -77,37 +268,60 @@ class Client(object):
             self,
             *,
             step,
+            member=None,
             **kwargs
     ):
         """
         download grib2 file...
         :param step:
+        :param member: member of an ensemble, default=member of the client
         :param kwargs:
             target
         :return:
         """
         target = kwargs.get('target', self.target)
 
-        # get m_url for multi-range download
-        m_url = self._get_m_url(step=step)
-
-        file = "{}{:03d}.grib2".format(
+        file = "{}{}{:03d}.grib2".format(
             target.split(".grib2")[0],
+            "_{}_".format(member) if member else "",
             step)
 
+        if self.grid == "FILTER":
+            return self._retrieve_filtered(step=step, file=file, member=member)
+
+        # get m_url for multi-range download
+        m_url = self._get_m_url(step=step, member=member)
+
         if m_url:
-            expected_size = sum([j[1] for j in m_url['parts']])
-            # download byte multirange
-            results = download(
-                **m_url,
-                target="{}/{}".format(DATA_DIR, file),
-                verify=self.verify,
-                session=self.session
-            )
+            parts = m_url['parts']
+            received = dict()  # offset: verified content
+            for attempt in range(MAX_RETRIES + 1):
+                missing = tuple(i for i in parts if i[0] not in received)
+                if not missing:
+                    break
+                if attempt:
+                    delay = uniform(0., BACKOFF * 2 ** attempt)  # full jitter
+                    print("{} of {} byte range(s) missing or short, retry {} "
+                          "in {:.1f} s".format(len(missing), len(parts),
+                                               attempt, delay))
+                    sleep(delay)
+                received.update(self._download_parts(url=m_url['url'],
+                                                     parts=missing))
+            if not received:
+                print("No byte range received completely. Skipping...")
+                return Result(
+                    rc=False,
+                    target=None)
+
+            # complete messages only, in order of the index
+            with open("{}/{}".format(DATA_DIR, file), "wb") as fp:
+                for offset, _ in parts:
+                    if offset in received:
+                        fp.write(received[offset])
             # under Docker owner is root
             os.chmod("{}/{}".format(DATA_DIR, file), 0o666)
             return Result(
-                rc=expected_size == results,
+                rc=len(received) == len(parts),
                 target="{}/{}".format(DATA_DIR, file))
         else:
             print("No byte range provided with url. Skipping...")
@@ -115,8 +329,289 @@ class Client(object):
                 rc=False,
                 target=None)
 
-    @staticmethod
+    def _retrieve_filtered(
+            self,
+            *,
+            step: int,
+            file: str,
+            member: str = None
+    ) -> Result:
+        """
+        variables, levels, and the subregion are cut by the NOMADS grib filter
+        on the server, the response is retried with jittered backoff, unless
+        it comprises complete GRIB messages
+        :param step:
+        :param file: target file name
+        :param member: member of an ensemble
+        :return:
+        """
+        url = URLS['filter'].format(_filter=self.filter_script)
+        params = self._get_filter_params(step=step, member=member)
+        for attempt in range(MAX_RETRIES + 1):
+            if attempt:
+                delay = uniform(0., BACKOFF * 2 ** attempt)  # full jitter
+                print("Response of grib filter incomplete, retry {} in {:.1f} s"
+                      .format(attempt, delay))
+                sleep(delay)
+            self.throttle()
+            try:
+                response = self.session.get(url,
+                                            params=params,
+                                            verify=self.verify)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                print("Grib filter request failed: {}".format(e))
+                continue
+            content = response.content
+            # error pages are delivered as HTML with status 200
+            if content and verify_messages(chunk=content, length=len(content)):
+                print("Grib filter {}: {} bytes".format(params['file'],
+                                                        len(content)))
+                with open("{}/{}".format(DATA_DIR, file), "wb") as fp:
+                    fp.write(content)
+                # under Docker owner is root
+                os.chmod("{}/{}".format(DATA_DIR, file), 0o666)
+                return Result(
+                    rc=True,
+                    target="{}/{}".format(DATA_DIR, file))
+
+        print("No complete response of grib filter. Skipping...")
+        return Result(
+            rc=False,
+            target=None)
+
+    def _get_filter_params(
+            self,
+            step: int,
+            member: str = None
+    ) -> dict:
+        """
+        query of the grib filter, parameters and levels of parameter.json are
+        combined, i.e. all variables at all levels selected. Levels are the
+        full level names of the index files, e.g. "2 m above ground".
+        :param step:
+        :param member: member of an ensemble
+        :return:
+        """
+        base = self._get_url()
+        params = {
+            # directory relative to the base url, e.g. /gfs.20250214/00/atmos
+            "dir": "/" + base[len(URLS[self.model]) + 1:].rstrip("/"),
+            "file": self._get_url(step=step, member=member).split("/")[-1]
+        }
+        if not self.parameter:
+            params['all_var'] = "on"
+        if not self.parameter or not all(p.get('typeOfLevel') or p.get('level')
+                                         for p in self.parameter):
+            params['all_lev'] = "on"
+        for p in self.parameter:
+            for short_name in p['shortName']:
+                params["var_{}".format(short_name.upper())] = "on"
+            for level in p.get('level', [p.get('typeOfLevel')]):
+                if level:
+                    params["lev_{}".format(level.replace(" ", "_"))] = "on"
+        if self.subregion:
+            params['subregion'] = ""
+            params.update(self.subregion)
+
+        return params
+
+    def prefetch(
+            self,
+            steps: list[int],
+            members: list[str] = None
+    ) -> None:
+        """
+        index files of all steps fetched concurrently from the object store,
+        from NOMADS sequentially on demand owing to its rate limit
+        :param steps:
+        :param members: members of an ensemble, default=member of the client
+        :return:
+        """
+        if self.source != "S3":
+            return
+        urls = [self._get_url(step=i, member=m) for i in steps
+                for m in (members if members else [None])]
+        with ThreadPoolExecutor(max_workers=self.s3['workers']) as executor:
+            for url, idx in zip(urls, executor.map(self._try_index, urls)):
+                if idx:
+                    self._indices[url] = idx
+        print("Index files prefetched: {} of {}".format(len(self._indices),
+                                                        len(urls)))
+
+    def plan(
+            self,
+            steps: list[int],
+            members: list[str] = None
+    ) -> list[dict]:
+        """
+        byte ranges of a download resolved from the index files only, nothing
+        is downloaded. With grid FILTER, the bytes of the selected messages
+        of the entire grid are an upper bound, the subregion is cut on the
+        server.
+        :param steps:
+        :param members: members of an ensemble, default=member of the client
+        :return: step, member, ranges, bytes, and requests per file, ranges
+        None if the index file is not available
+        """
+        entries = list()
+        for step in steps:
+            for member in (members if members else [None]):
+                entry = {"step": step, "member": member, "ranges": None,
+                         "bytes": 0, "requests": 0}
+                entries.append(entry)
+                try:
+                    idx = self._call_index(
+                        url=self._get_url(step=step, member=member))
+                except (Exception,) as e:
+                    print(e)
+                    continue
+                parts = self._prepare_request(idx).get('parts', tuple())
+                entry['ranges'] = len(parts)
+                entry['bytes'] = sum(length for _, length in parts)
+                if self.grid == "FILTER":
+                    entry['requests'] = 1  # a single query of the filter
+                elif self.source == "S3":
+                    # size, index, and a request per range
+                    entry['requests'] = 2 + len(parts)
+                else:
+                    # size, index, and a single multi-range request
+                    entry['requests'] = 3 if parts else 2
+
+        return entries
+
+    def _try_index(
+            self,
+            url: str
+    ) -> dict | None:
+        try:
+            return self._call_index(url=url)
+        except (Exception,) as e:
+            print(e)
+            return None
+
+    def index_url(
+            self,
+            step: int,
+            member: str = None
+    ) -> str:
+        """
+        :param step:
+        :param member: member of an ensemble, default=member of the client
+        :return: URL of the index file of the step, e.g. to be probed
+        """
+        return self._get_url(step=step, member=member) + ".idx"
+
+    def throttle(self) -> None:
+        """
+        rate limit of NOMADS, none for the object store, e.g. also to be
+        applied to probes
+        """
+        if self.source == "NOMADS":
+            RATE.wait()
+
+    def _download_range(
+            self,
+            *,
+            url: str,
+            part: tuple[int, int]
+    ) -> bytes | None:
+        """
+        single range request, the object store serves no multi-range requests
+        :param url: of the grib2 file
+        :param part: (offset, length)
+        :return: content, if verified
+        """
+        offset, length = part
+        content = None
+        try:
+            with self.session.get(
+                    url,
+                    headers={"Range": "bytes={}-{}".format(
+                        offset, offset + length - 1)},
+                    stream=True,
+                    verify=self.verify
+            ) as response:
+                response.raise_for_status()
+                # range ignored, the entire object is streamed and cut
+                for _, content in cut(
+                        chunks=response.iter_content(CHUNK_SIZE),
+                        start=offset if response.status_code == 206 else 0,
+                        parts=(part,)):
+                    break
+        except requests.exceptions.RequestException as e:
+            print("Download of {} interrupted: {}".format(url, e))
+            return None
+
+        return content if content is not None \
+            and verify_messages(chunk=content, length=length) else None
+
+    def _download_parts(
+            self,
+            *,
+            url: str,
+            parts: tuple[tuple[int, int], ...]
+    ) -> dict[int, bytes]:
+        """
+        single multi-range request, the response is verified part by part
+        while streaming. Parts received completely are kept, even if the
+        connection breaks. From the object store, all ranges are requested
+        concurrently instead.
+        :param url: of the grib2 file
+        :param parts: (offset, length) of each byte range
+        :return: offset: content of each verified part
+        """
+        if self.source == "S3":
+            with ThreadPoolExecutor(
+                    max_workers=self.s3['workers']) as executor:
+                contents = executor.map(
+                    lambda part: self._download_range(url=url, part=part),
+                    parts)
+                return {o: c for (o, _), c in zip(parts, contents)
+                        if c is not None}
+
+        lengths = dict(parts)
+        received = dict()
+        RATE.wait()
+        try:
+            with self.session.get(
+                    url,
+                    headers={"Range": "bytes={}".format(",".join(
+                        "{}-{}".format(o, o + n - 1) for o, n in parts))},
+                    stream=True,
+                    verify=self.verify
+            ) as resp:
+                resp.raise_for_status()
+                content_type = resp.headers.get("Content-Type", "")
+                # the server may coalesce adjacent ranges into a single
+                # part, hence the requested ranges are cut from each part
+                if resp.status_code == 206 and "multipart" in content_type:
+                    boundary = content_type.split("boundary=")[-1].strip('"')
+                    for offset, content in multipart(
+                            chunks=resp.iter_content(CHUNK_SIZE),
+                            boundary=boundary.encode("latin-1")):
+                        received.update(cut(chunks=[content],
+                                            start=offset,
+                                            parts=parts))
+                elif resp.status_code == 206:  # single range comprising all
+                    offset = int(re.search(r"bytes (\d+)-",
+                                           resp.headers['Content-Range'])
+                                 .group(1))
+                    received.update(cut(chunks=resp.iter_content(CHUNK_SIZE),
+                                        start=offset,
+                                        parts=parts))
+                else:  # ranges ignored, entire file streamed
+                    received.update(cut(chunks=resp.iter_content(CHUNK_SIZE),
+                                        start=0,
+                                        parts=parts))
+        except requests.exceptions.RequestException as e:
+            print("Download of {} interrupted: {}".format(url, e))
+
+        return {o: c for o, c in received.items()
+                if o in lengths and verify_messages(chunk=c, length=lengths[o])}
+
     def _get_url_paths(
+            self,
             *,
             url: str,
             ext: str = ".idx",
@@ -129,8 +624,12 @@ class Client(object):
         :param params: not used
         :return:
         """
-        response = requests.get(url, params=params)
+        if self.source == "S3":
+            return self._list_objects(url=url, ext=ext)
+        RATE.wait()
+        response = self.session.get(url, params=params)
         if response.ok:
+            from bs4 import BeautifulSoup  # only needed to list NOMADS
             response_text = response.text
             soup = BeautifulSoup(response_text, 'html.parser')
             # list of all downloadable index files per weather forecast time
@@ -139,6 +638,37 @@ class Client(object):
         else:
             response.raise_for_status()
 
+    def _list_objects(
+            self,
+            *,
+            url: str,
+            ext: str = ".idx"
+    ) -> list:
+        """
+        ListObjectsV2 of the object store, anonymous access
+        :param url: url of COMMON, i.e. the prefix of the keys
+        :param ext: ".idx"
+        :return: list of all index files (full path)
+        """
+        base = "{}/{}".format(self.s3['endpoint'], self.s3['bucket'])
+        params = {"list-type": "2", "prefix": url[len(base) + 1:]}
+        paths = list()
+        while True:
+            response = self.session.get(base, params=params, verify=self.verify)
+            response.raise_for_status()
+            root = ElementTree.fromstring(response.content)
+            # namespace of the S3 API
+            ns = root.tag[:root.tag.index("}") + 1] \
+                if root.tag.startswith("{") else ""
+            paths += ["{}/{}".format(base, i.text)
+                      for i in root.iter(ns + "Key") if i.text.endswith(ext)]
+            token = root.find(ns + "NextContinuationToken")
+            if token is None:
+                break
+            params['continuation-token'] = token.text
+
+        return paths
+
     def _check_availability(self) -> None:
         """
         checks if all files for the most recent fc are available. If not, rerun
@@ -149,7 +679,7 @@ class Client(object):
             idx_list_available = self._get_url_paths(
                 url=self._get_url()
             )
-            for step in STEPS:
+            for step in self.steps:
                 if self._get_url(step=step) + ".idx" not in idx_list_available:
                     raise LookupError
         except (HTTPError, LookupError):
@@ -192,16 +722,19 @@ class Client(object):
 
     def _get_url(
             self,
-            step: int = None
+            step: int = None,
+            member: str = None
     ) -> str:
         """
         prepare data and configure url string
         :param step:
+        :param member: member of an ensemble, default=member of the client
         :return:
         """
         args = dict()
 
-        args['_url'] = URLS['gfs']
+        args['_url'] = URLS[self.model] if self.source == "NOMADS" \
+            else "{}/{}".format(self.s3['endpoint'], self.s3['bucket'])
         args['_model'] = self.model
         args['_extension'] = "grib2"
         # could be extended to e.g. goessimpgrb2 ???
@@ -210,25 +743,33 @@ class Client(object):
         args['_resol'] = self.resol
         args['_yyyymmdd'] = self.date
         args['_H'] = "{:02d}".format(self.time)
+        if self.model in ENSEMBLE_MODELS:
+            # e.g. 0p25 -> p25, 0p50 -> p5
+            args['_dir_resol'] = self.resol[1:].rstrip("0")
+            args['_member'] = member if member else self.member
+            common, pattern = COMMON_ENSEMBLE, ENSEMBLE_GRID
+        else:
+            common, pattern = COMMON, PATTERN[self.grid]
         if step is None:
-            return COMMON.format(**args)
+            return common.format(**args)
         else:
             args['_fc_hour'] = "{:03d}".format(step)
-            return PATTERN[self.grid].format(**args)
+            return pattern.format(**args)
 
     def _get_m_url(
             self,
-            step: int
+            step: int,
+            member: str = None
     ) -> dict:
         """
         prepare data and configure url string
         :param step:
+        :param member: member of an ensemble
         :return:
         """
         try:
-            idx = self._call_index(
-                url=self._get_url(step=step)
-            )
+            url = self._get_url(step=step, member=member)
+            idx = self._indices.pop(url, None) or self._call_index(url=url)
         except (Exception,) as e:
             print(e)
             print("Resource not available. Revise your parameter set ...")
@@ -245,18 +786,30 @@ class Client(object):
         :param url:
         :return: index file in dict format
         """
+        if self.cache:
+            cached = "{}/{}.json".format(
+                self.cache, url.split("://")[-1].replace("/", "_"))
+            if os.path.exists(cached):
+                with open(cached, "r") as cache_handle:
+                    # keys of the records are numbers
+                    return {k: {int(no): record for no, record in v.items()}
+                            for k, v in json.load(cache_handle).items()}
         dix = dict()
         dict_keys = \
             ["offset", "datetime", "shortName", "level", "validity"]
 
         try:
             # total size of grib data file in bytes
-            resp: Response = requests.get(url, stream=True)
+            self.throttle()
+            resp: Response = self.session.head(url, verify=self.verify) \
+                if self.source == "S3" else self.session.get(url, stream=True)
             resp.raise_for_status()
             length = int(resp.headers.get("Content-length"))
+            resp.close()  # body not read, release connection to the pool
 
             # download its appropriate index file
             url_index = f"{url}.idx"
+            self.throttle()
             response = self.session.get(url_index)
             response.raise_for_status()
             dix[url] = dict()
@@ -290,13 +843,19 @@ class Client(object):
         # continually hits the site over the threshold.
         # source: ncep.pmb.dataflow@noaa.gov (Brian)
         # Hence, configure the sleep argument accordingly!
-        sleep(1.)
+        if self.source == "NOMADS":
+            sleep(1.)
 
-        if CONFIG['debug']:
+        if CONFIG.get('debug'):
             with open("{}/indices.json".format(LOG_DIR), "w") as log_handle:
                 json.dump(dix, log_handle, indent=2)
             # docker owner is root, anyone can delete
             os.chmod("{}/indices.json".format(LOG_DIR), 0o666)
+        if self.cache:
+            os.makedirs(self.cache, exist_ok=True)
+            with open(cached, "w") as cache_handle:
+                json.dump(dix, cache_handle)
+            os.chmod(cached, 0o666)  # docker owner is root, anyone can delete
 
         return dix
 
@@ -339,7 +898,10 @@ class Client(object):
 
                     # evaluate fields shortName is compared in lower case
                     if value['shortName'].lower() in p['shortName']:
-                        if p.get('typeOfLevel'):  # if exists typOfLevel
+                        if p.get('level'):  # full level names, e.g. "500 mb"
+                            if value['level'] in p['level']:
+                                predicate = True
+                        elif p.get('typeOfLevel'):  # if exists typOfLevel
                             if p.get('validity'):  # if exists validity
                                 if p['typeOfLevel'] in value['level'] \
                                         and p['validity'] in value['validity']:
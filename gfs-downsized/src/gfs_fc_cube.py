@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+"""
+gfs_fc_cube
+regional cube of a forecast run: a box around the location is sliced from each
+decoded field and appended to data/cube/<run>.cube as soon as it is decoded,
+the run is never held in memory as a whole.
+
+Layout of a cube file: one zlib-compressed chunk per parameter and step, i.e.
+step x lat x lon in chunks of 1 x lat x lon, float32 little-endian, bytes
+shuffled prior to compression. The index (JSON) follows the chunks, then its
+length (8 bytes, little-endian) and MAGIC. A reader memory-maps the file and
+decompresses the chunk of a single time slice only, see tools/forecast_cube.
+"""
+
+import os
+import json
+import zlib
+import numpy as np
+
+MAGIC = b"FCCUBE01"
+LEVEL = 6  # zlib compression level
+BOX = 0.5  # default half width of the box [deg]
+# rows and columns of the box per grid geometry
+_BOXES: dict = dict()
+# rows and columns of the grid cell around the location per grid geometry
+_CELLS: dict = dict()
+
+
+def box_indices(
+        geometry: tuple,
+        item,
+        coordinates: np.ndarray,
+        box: float = BOX
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    rows and columns of the grid within the box, computed once per grid
+    geometry and location. Longitudes are compared modulo 360, i.e. the box
+    may straddle the first/last column of the grid.
+    :param geometry: key of the grid, e.g. (gridType, Ni, Nj, first lat, lon)
+    :param item: grib message
+    :param coordinates: latitude, longitude of the location
+    :param box: half width of the box [deg]
+    :return: rows, columns, latitudes, longitudes of the box
+    """
+    key = geometry + (box,) + tuple(coordinates)
+    if key not in _BOXES:
+        lats, lons = item.latlons()
+        lats, lons = lats[:, 0], lons[0, :]
+        rows = np.flatnonzero(np.abs(lats - coordinates[0]) <= box)
+        distance = (lons - coordinates[1] + 180) % 360 - 180
+        cols = np.flatnonzero(np.abs(distance) <= box)
+        cols = cols[np.argsort(distance[cols], kind="stable")]  # west to east
+        _BOXES[key] = (rows, cols, lats[rows], lons[cols])
+
+    return _BOXES[key]
+
+
+def cell_indices(
+        geometry: tuple,
+        item,
+        grid: dict
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    rows and columns of the grid cell, computed once per grid geometry, i.e.
+    the subset of item.data(**grid) taken from the values decoded once for
+    the grid cell and the box
+    :param geometry: key of the grid, e.g. (gridType, Ni, Nj, first lat, lon)
+    :param item: grib message
+    :param grid: lat1, lat2, lon1, lon2 of the grid cell
+    :return: rows, columns, latitudes, longitudes (2-d) of the grid cell
+    """
+    key = geometry + tuple(sorted(grid.items()))
+    if key not in _CELLS:
+        lats, lons = item.latlons()
+        # bounds inclusive, as of item.data()
+        mask = (lats >= grid['lat1']) & (lats <= grid['lat2']) \
+            & (lons >= grid['lon1']) & (lons <= grid['lon2'])
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        _CELLS[key] = (rows, cols, lats[np.ix_(rows, cols)],
+                       lons[np.ix_(rows, cols)])
+
+    return _CELLS[key]
+
+
+class CubeWriter(object):
+    """
+    append boxes of a forecast run chunk by chunk, the index is written on
+    close
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            size: int
+    ):
+        """
+        :param directory: location of the cube files
+        :param size: number of steps
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.tmp = "{}/cube.tmp".format(directory)
+        self.handle = open(self.tmp, "wb")
+        self.index = {"size": size, "shuffle": True, "params": dict()}
+
+    def append(
+            self,
+            key: str,
+            unit: str,
+            index: int,
+            time: str,
+            lats: np.ndarray,
+            lons: np.ndarray,
+            values: np.ndarray
+    ) -> None:
+        """
+        :param key: name of the parameter
+        :param unit:
+        :param index: index of the step
+        :param time: validity time YYYYMMDDHHMM
+        :param lats: latitudes of the rows of the box
+        :param lons: longitudes of the columns of the box
+        :param values: box of the decoded field, masked values become NaN
+        :return:
+        """
+        if key not in self.index['params']:
+            self.index['params'][key] = {
+                "unit": unit,
+                "lats": [float(i) for i in lats],
+                "lons": [float(i) for i in lons],
+                "time": [None] * self.index['size'],
+                "chunks": [None] * self.index['size']
+            }
+        param = self.index['params'][key]
+        data = np.ma.filled(np.ma.asarray(values, dtype="<f4"), np.nan)
+        # byte shuffle, the exponents of neighbouring values compress well
+        data = zlib.compress(data.view(np.uint8).reshape(-1, 4).T.tobytes(),
+                             LEVEL)
+        param['chunks'][index] = [self.handle.tell(), len(data)]
+        param['time'][index] = time
+        self.handle.write(data)
+
+    def close(self, datetimestr: str) -> str:
+        """
+        write the index and rename to the run
+        :param datetimestr: YYYYMMDDHHMM of the forecast run
+        :return: cube file
+        """
+        footer = json.dumps(self.index).encode("utf-8")
+        self.handle.write(footer)
+        self.handle.write(len(footer).to_bytes(8, "little"))
+        self.handle.write(MAGIC)
+        size = self.handle.tell()
+        self.handle.close()
+        target = "{}/{}.cube".format(self.directory, datetimestr)
+        os.chmod(self.tmp, 0o666)  # docker owner is root, anyone can delete
+        os.replace(self.tmp, target)
+        print("Cube '{}': {} parameter(s), {} bytes".format(
+            os.path.basename(target), len(self.index['params']), size))
+
+        return target
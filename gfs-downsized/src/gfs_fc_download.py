@@ -5,39 +5,146 @@ Download GFS forecast data
 https://nomads.ncep.noaa.gov/pub/data/nccf/com/gfs/ via HTTP
 """
 
-import pygrib
 import os
 import json
-from numpy import array as np_array
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from numpy import array as np_array, eye as np_eye, ix_ as np_ix
 from multiprocessing import Queue
-from scipy.interpolate import RegularGridInterpolator
 # internal
-from gfs_fc_aux import DATA_FILE, CONFIG #, defined_kwargs
+from gfs_fc_aux import (DATA_FILE, EVENT_DIR, PROVIDER, CONFIG,
+                        load_config)  # , defined_kwargs
+from gfs_fc_series import pack, to_datetime64
+from gfs_fc_cube import box_indices, cell_indices, BOX
+from gfs_fc_profile import TYPE_OF_LEVEL, SHORT_NAMES, stack
+from gfs_fc_notify import summary, publish
+from gfs_fc_memory import sample
+
+# forecast.json as last written by this process, e.g. by the daemon, to skip
+# parsing it again on the next write
+_STORE: dict = dict()
+# grid cell enclosing the location per grid geometry and interpolation weights
+# per grid cell, kept for the lifetime of the (worker) process
+_GRIDS: dict = dict()
+_WEIGHTS: dict = dict()
+
+
+def read_forecast() -> dict:
+    """
+    content of forecast.json, parsed only if changed since the last write of
+    this process
+    :return: forecast run: forecast
+    """
+    if not os.path.exists(DATA_FILE):
+        return dict()
+    stat = os.stat(DATA_FILE)
+    if _STORE.get('version') == (stat.st_mtime_ns, stat.st_size):
+        return _STORE['data']  # unchanged since last write
+    with open(DATA_FILE, "r") as jsonFile:
+        return json.load(jsonFile)
 
 
 def write_forecast(
         datetimestr: str,
-        forecast: dict
+        forecast: dict,
+        retention: dict = None
 ) -> None:
     """
-    update forecast.json
+    update forecast.json atomically, i.e. write a temporary file and replace,
+    apply retention policy if provided
     :param datetimestr: YYYYMMDDHH
     :param forecast:
+    :param retention: retention policy, see compact()
     :return: None
     """
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "w") as create_empty:
-            json.dump({}, create_empty)
-            os.chmod(DATA_FILE, 0o666)  # docker owner is root, anyone can delete
-    with open(DATA_FILE, "r+") as jsonFile:
-        data = json.load(jsonFile)
-        data[datetimestr] = forecast
-        jsonFile.seek(0)  # rewind
+    write_forecasts(forecasts={datetimestr: forecast} if datetimestr
+                    else dict(),
+                    retention=retention)
+
+
+def write_forecasts(
+        forecasts: dict,
+        retention: dict = None
+) -> None:
+    """
+    update forecast.json with any number of forecast runs in a single commit,
+    see write_forecast()
+    :param forecasts: forecast run YYYYMMDDHHMM: forecast
+    :param retention: retention policy, see compact()
+    :return: None
+    """
+    size = os.path.getsize(DATA_FILE) if os.path.exists(DATA_FILE) else 0
+    data = read_forecast()
+    data.update(forecasts)
+    if retention:
+        data = compact(data=data, retention=retention)
+    with open(DATA_FILE + ".tmp", "w") as jsonFile:
         json.dump(data,
                   jsonFile,
                   indent=2,
                   sort_keys=True)
-        jsonFile.truncate()
+    os.chmod(DATA_FILE + ".tmp", 0o666)  # docker owner is root, anyone can delete
+    os.replace(DATA_FILE + ".tmp", DATA_FILE)
+    stat = os.stat(DATA_FILE)
+    _STORE['version'] = (stat.st_mtime_ns, stat.st_size)
+    _STORE['data'] = data
+    print("File '{}' size: {} -> {} bytes".format(
+        os.path.basename(DATA_FILE), size, stat.st_size))
+    # subscribers notified once the runs are committed
+    for datetimestr, forecast in forecasts.items():
+        publish(directory=EVENT_DIR,
+                event=summary(provider=PROVIDER,
+                              datetimestr=datetimestr,
+                              forecast=forecast))
+
+
+def compact(
+        data: dict,
+        retention: dict,
+        now: datetime = None
+) -> dict:
+    """
+    apply retention policy on forecast runs: keep full runs for "full_days",
+    then reduce runs to the 00/12 cycles ("reduction": "cycles") or to the
+    first 24 hrs of each run ("reduction": "first24h") until "reduced_days",
+    drop runs thereafter
+    :param data: content of forecast.json
+    :param retention: see parameter.json
+    :param now: reference time, default=current time
+    :return: compacted content
+    """
+    now = now or datetime.now(timezone.utc)
+    full = timedelta(days=retention.get('full_days', 36500))
+    reduced = timedelta(days=retention.get('reduced_days', 0))
+    result = dict()
+    dropped, truncated = 0, 0
+
+    for datetimestr, forecast in data.items():
+        issue = datetime.strptime(datetimestr, "%Y%m%d%H%M") \
+            .replace(tzinfo=timezone.utc)
+        if now - issue <= full:
+            result[datetimestr] = forecast
+        elif now - issue > max(full, reduced):
+            dropped += 1
+        elif retention.get('reduction') == "first24h":
+            until = (issue + timedelta(hours=24)).strftime("%Y%m%d%H%M")
+            result[datetimestr] = dict()
+            for param, values in forecast.items():
+                keep = [i for i, t in enumerate(values['time']) if t <= until]
+                result[datetimestr][param] = {
+                    **values,
+                    "time": [values['time'][i] for i in keep],
+                    "value": [values['value'][i] for i in keep]
+                }
+                truncated += len(values['time']) - len(keep)
+        elif issue.hour in (0, 12):  # reduction "cycles"
+            result[datetimestr] = forecast
+        else:
+            dropped += 1
+    print("Compaction: {} run(s) dropped, {} entries truncated"
+          .format(dropped, truncated))
+
+    return result
 
 
 def create_grid(
@@ -76,20 +183,73 @@ def create_grid(
     }
 
 
+def interpolate(
+        data: np_array,
+        lats: np_array,
+        lons: np_array,
+        coordinates: np_array
+) -> float:
+    """
+    linear interpolation at coordinates within the grid cell, weights are
+    computed once per grid cell and location, e.g. changed in parameter.json
+    between runs of a worker of the daemon
+    :param data: values of the grid cell
+    :param lats:
+    :param lons:
+    :param coordinates:
+    :return: value at coordinates
+    """
+    key = (tuple(lats[:, 0]), tuple(lons[0, :]), tuple(coordinates))
+    if key not in _WEIGHTS:
+        from scipy.interpolate import RegularGridInterpolator
+        # interpolation of unit vectors yields the weight of each grid point
+        _WEIGHTS[key] = RegularGridInterpolator(
+            key[:2],
+            np_eye(data.size).reshape(data.shape + (data.size,)),
+            method='linear'
+        )(coordinates)[0]
+
+    return float(_WEIGHTS[key] @ data.ravel())
+
+
 def extract(
         target: str,
         q: Queue = None,
-        keep_target: bool = False
-) -> tuple[bool, dict] | None:
+        keep_target: bool = False,
+        index: int = 0,
+        member: int = 0,
+        profile_memory: bool = False,
+        config: dict = None
+) -> tuple[str, dict] | None:
     """
     extract grib2 file according to select parameter
     :param target: full path
     :param q: queue per fc hour for multiprocessing
     :param keep_target: keep target, if True
-    :return:
+    :param index: index of the step of the target in the list of steps
+    :param member: index of the member of an ensemble
+    :param profile_memory: trace the Python allocations of the decode
+    :param config: parameter.json of the run, e.g. to a worker of a pool
+    forked prior to a change, default=as loaded
+    :return: date of creation, values of the step as raw buffers, see pack(),
+    and the memory of the decode, see sample()
     """
     fs: list = list()
     result: dict = dict()
+    boxes: dict = dict()  # key: (time, lats, lons, values) of the box
+    cells: list = list()  # grid cells of the pressure levels of the profile
+    import pygrib  # loaded by the extracting process only
+    traced = profile_memory and not tracemalloc.is_tracing()
+    if traced:
+        tracemalloc.start()  # stopped again, e.g. in a worker of the pool
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()  # peak of this decode only
+    if config is not None and config != CONFIG:
+        # worker of a pool forked prior to loading or to a change
+        CONFIG.clear()
+        CONFIG.update(config)
+    elif not CONFIG:
+        load_config()
 
     coords = np_array([CONFIG['geo_coordinates']['latitude'],
                        (CONFIG['geo_coordinates']['longitude'] + 360) % 360])
@@ -108,14 +268,21 @@ def extract(
         item['dataTime']
     )
     # figure out spatial resolution from 1st item
-    # print(item.values.shape)
-    resolution = 360 / item.values.shape[1]  # longitude
+    # longitude, Ni is that of the subregion with grid "FILTER"
+    resolution = item['iDirectionIncrementInDegrees']
     print(f"Spatial resolution: {resolution} degree")
-    lats, lons = item.latlons()
-    # place a rectangle over the region to be used for forecast
-    grid = create_grid(coordinates=coords,
-                       lats=lats[:, 0],
-                       lons=lons[0, :])
+    geometry = (item['gridType'], item['Ni'], item['Nj'],
+                item['latitudeOfFirstGridPointInDegrees'],
+                item['longitudeOfFirstGridPointInDegrees'])
+    # grid cell per geometry and location, e.g. changed in parameter.json
+    key = geometry + tuple(coords)
+    if key not in _GRIDS:
+        lats, lons = item.latlons()
+        # place a rectangle over the region to be used for forecast
+        _GRIDS[key] = create_grid(coordinates=coords,
+                                  lats=lats[:, 0],
+                                  lons=lons[0, :])
+    grid = _GRIDS[key]
 
     # ToDo shortNames are not equal in idx and grib2 files for GFS (NOAA). This
     #  seems to be an issue of pygrib, as optimized for ECMWF. According to
@@ -138,15 +305,26 @@ def extract(
     fsss.close()
     print("\n")
 
+    names = CONFIG['profile'].get('shortName', SHORT_NAMES) \
+        if CONFIG.get('profile') else list()
     for item in fs:
         print(item["shortName"], "->", item)
-        data, lats, lons = item.data(**grid)
-        nearest_neighbor = RegularGridInterpolator(
-            (lats[:, 0], lons[0, :]),
-            data,
-            method='linear'
-        )
-        value_at_coordinates = list(nearest_neighbor(coords))[0]
+        # decoded once for the grid cell and the box
+        values = item.values
+        rows, cols, lats, lons = cell_indices(geometry=geometry,
+                                              item=item,
+                                              grid=grid)
+        data = values[np_ix(rows, cols)]
+        if item['typeOfLevel'] == TYPE_OF_LEVEL and item['shortName'] in names:
+            cells.append((item['shortName'], item['units'], item['level'],
+                          data, "{}{:04d}".format(item['validityDate'],
+                                                  item['validityTime']),
+                          lats, lons))
+            continue
+        value_at_coordinates = interpolate(data=data,
+                                           lats=lats,
+                                           lons=lons,
+                                           coordinates=coords)
 
         # key is somewhat crummy
         combined_dict_key = ("{}:{}:{}:{}"
@@ -154,15 +332,26 @@ def extract(
                                     item['typeOfLevel'],
                                     item['stepType'],
                                     item['level']))
-        dt_str = "{}{:04d}".format(
-            item['validityDate'],
-            item['validityTime']
+        result[combined_dict_key] = (
+            item['units'],
+            to_datetime64(date=item['validityDate'],
+                          time=item['validityTime']),
+            value_at_coordinates
         )
-        result[combined_dict_key] = {
-            "unit": item['units'],
-            "time": [dt_str],
-            "value": [value_at_coordinates]
-        }
+        if CONFIG.get('cube'):
+            rows, cols, box_lats, box_lons = box_indices(
+                geometry=geometry,
+                item=item,
+                coordinates=coords,
+                box=CONFIG['cube'].get('box', BOX)
+            )
+            boxes[combined_dict_key] = (
+                "{}{:04d}".format(item['validityDate'],
+                                  item['validityTime']),
+                box_lats,
+                box_lons,
+                values[np_ix(rows, cols)]
+            )
 
     # ToDo:
     #  Man that is born of a woman
@@ -171,11 +360,29 @@ def extract(
     #  He cometh up, and is cut down like a flower;
     #  he fleeth as it were a shadow,
     #  and ne'er continueth in one stay.
+    # level stack of the step interpolated at once
+    profile = {
+        "time": cells[0][4],
+        # grid cell of the messages of the level stack
+        "step": stack(entries=cells,
+                      lats=cells[0][5],
+                      lons=cells[0][6],
+                      coordinates=coords)
+    } if cells else None
+
     if not keep_target:
         os.remove(target)
         print("Target file '{}' deleted".format(target))
 
+    payload = pack(index=index,
+                   entries=result,
+                   boxes=boxes,
+                   profile=profile,
+                   member=member)
+    payload['memory'] = sample()
+    if traced:
+        tracemalloc.stop()
     if q:
-        q.put((date_creation_str, result))
+        q.put((date_creation_str, payload))
     else:
-        return date_creation_str, result
+        return date_creation_str, payload
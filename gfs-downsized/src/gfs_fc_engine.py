@@ -9,58 +9,108 @@ import json
 import sys
 import os
 import logging
-from gfs_fc_client import Client
+from time import sleep
+from queue import Empty
+from concurrent.futures import ThreadPoolExecutor
 from argparse import ArgumentParser
 from multiprocessing import Process, Queue
 # internal
 from gfs_fc_download import extract, write_forecast
-from gfs_fc_aux import defined_kwargs, CONFIG, STEPS
+from gfs_fc_derived import derive
+from gfs_fc_series import ForecastSeries, unpack, to_json
+from gfs_fc_cube import CubeWriter
+from gfs_fc_profile import ProfileSeries, index_parameter, fill, pwv, save
+from gfs_fc_ensemble import (EnsembleSeries, unpack as unpack_member,
+                             save as save_ensemble)
+from gfs_fc_memory import Profile, Budget
+from gfs_fc_aux import (defined_kwargs, default_steps, subregion, load_config,
+                        CONFIG, CUBE_DIR, PROFILE_DIR, ENSEMBLE_DIR, INDEX_DIR)
 
 # Logging Format
 MYFORMAT: str = ("%(asctime)s :: %(levelname)s: %(filename)s - %(name)s - "
                  "%(lineno)s - %(funcName)s()\t%(message)s")
+BANDWIDTH = 10.  # assumed download rate of the plan [MB/s]
 
 
-def main(
-        parallel: bool = False,
-        keep_target: bool = False
+def collect(
+        payload: dict,
+        forecast: dict[str, ForecastSeries],
+        size: int,
+        cube: CubeWriter = None,
+        profile: dict[str, ProfileSeries] = None,
+        ensemble: dict[str, EnsembleSeries] = None,
+        members: int = 1
 ) -> None:
     """
-
-    :param parallel: engage multiprocessing, if True
-    :param keep_target: keep target, if True
+    fill forecast series from the payload of a step, append its boxes to the
+    cube and its level stack to the profile series, if any. Payloads of
+    members of an ensemble fill the ensemble series only.
+    :param payload: see pack()
+    :param forecast: key: series
+    :param size: number of steps
+    :param cube: cube of the forecast run
+    :param profile: shortName: profile series of the forecast run
+    :param ensemble: key: ensemble series of the forecast run
+    :param members: number of members
     :return:
     """
+    if ensemble is not None:
+        unpack_member(payload=payload,
+                      member=payload['member'],
+                      ensemble=ensemble,
+                      members=members,
+                      size=size)
+        return
+    unpack(payload=payload, forecast=forecast, size=size)
+    if profile is not None and payload['profile']:
+        fill(profile=profile,
+             index=payload['index'],
+             time=payload['profile']['time'],
+             step=payload['profile']['step'],
+             size=size)
+    if cube:
+        for key, (time, lats, lons, values) in payload['boxes'].items():
+            cube.append(key=key,
+                        unit=payload['units'][key],
+                        index=payload['index'],
+                        time=time,
+                        lats=lats,
+                        lons=lons,
+                        values=values)
 
-    # define logging
-    if CONFIG['debug']:
-        logging_level: str = "DEBUG"
-        logging.basicConfig(format=MYFORMAT,
-                            level=getattr(logging, logging_level),
-                            datefmt="%Y-%m-%d %H:%M:%S")
 
-    dict_x = dict()
-
-    def collect(r: dict) -> dict:
-        for k, v in r.items():
-            try:
-                dict_x[k]['time'].extend(v['time'])
-                dict_x[k]['value'].extend(v['value'])
-            except KeyError:
-                dict_x[k] = v
-        return dict_x
-    # end module collect
-
-    date_creation_string: str = None
-    ps = list()  # list of processes
-    qs = list()  # list of queues
+def create_client(
+        steps: list[int],
+        profile: bool = False,
+        session=None,
+        cache: str = None,
+        date: str = None,
+        time: int = None
+):
+    """
+    client as configured in parameter.json
+    :param steps:
+    :param profile: pressure levels of the profile appended to the parameters
+    :param session: shared requests.Session, e.g. of forecast-daemon
+    :param cache: directory of index files kept, e.g. by the plan
+    :param date: YYYYMMDD of the forecast run, overrides parameter.json
+    :param time: hour of the forecast run, overrides parameter.json
+    :return: gfs_fc_client.Client
+    """
+    from gfs_fc_client import Client
+    parameters = CONFIG.get('parameter')
+    if parameters and profile:
+        # pressure levels of the profile in addition
+        parameters = parameters + [index_parameter(profile=CONFIG['profile'])]
 
-    client = Client(
-        # grid: mandatory [SLS|GLOB]
+    return Client(
+        # grid: mandatory [SLS|GLOB|FILTER]
         grid=CONFIG["grid"],
         **defined_kwargs(
             # if parameter missing, entire parameter set
-            parameter=CONFIG.get('parameter'),
+            parameter=parameters,
+            # gfs (default), or ensemble gefs
+            model=CONFIG.get('model'),
             # validity optional, list of substrings, e.g. "fcst" and/or "anl"
             # validity=CONFIG.get('validity'),
             # only used with grid="GLOB"
@@ -68,50 +118,286 @@ def main(
             # only used with grid="GLOB"
             resol=CONFIG.get('resol'),
             # if missing, most recent date and/or time with data available
-            date=CONFIG.get('date'),
-            time=CONFIG.get('time')
+            date=date if date else CONFIG.get('date'),
+            time=time if time is not None else CONFIG.get('time'),
+            session=session,
+            # only used with grid="FILTER", box around geo_coordinates
+            subregion=subregion(
+                geo_coordinates=CONFIG['geo_coordinates'],
+                **defined_kwargs(box=CONFIG.get('box'))
+            ) if CONFIG["grid"] == "FILTER" else None,
+            filter_script=CONFIG.get('filter'),
+            # NOMADS (default) or S3, e.g. NOAA's AWS Open Data mirror
+            source=CONFIG.get('source'),
+            s3=CONFIG.get('s3'),
+            steps=steps,
+            cache=cache
         )
     )
 
-    for step in CONFIG.get("steps", STEPS):
-        results = client.retrieve(
-            step=step,
-            **defined_kwargs(
-                target=CONFIG.get('target')
-            )
-        )
-        # success, match file size(s)
-        print(f"File size matched: {results.rc}")
-        if not results.target:
+
+def plan(session=None) -> None:
+    """
+    dry run: byte ranges of each step resolved from the index files only,
+    which are cached in INDEX_DIR. Ranges, bytes, and requests are reported
+    per step and in total against the rate limit of NOMADS, nothing is
+    downloaded.
+    :param session: shared requests.Session
+    :return:
+    """
+    from gfs_fc_client import ENSEMBLE_MODELS, MEMBERS, RATE_LIMIT
+
+    load_config()
+    steps = CONFIG.get("steps", default_steps(model=CONFIG.get('model')))
+    ensemble = CONFIG.get('model') in ENSEMBLE_MODELS
+    members = CONFIG.get('ensemble', dict()).get('members', MEMBERS) \
+        if ensemble else None
+    if not CONFIG.get('parameter'):
+        print("Caveat: no parameter selected, entire files are downloaded!")
+    client = create_client(steps=steps,
+                           profile=bool(CONFIG.get('profile')) and not
+                           ensemble,
+                           session=session,
+                           cache=INDEX_DIR)
+    entries = client.plan(steps=steps, members=members)
+
+    print("Plan of forecast run {}{:02d}, grid {}, source {}".format(
+        client.date, client.time, client.grid, client.source))
+    for entry in entries:
+        label = "{:03d}{}".format(
+            entry['step'], " " + entry['member'] if entry['member'] else "")
+        if entry['ranges'] is None:
+            print("Step {}: index file not available".format(label))
             continue
+        print("Step {}: {} range(s), {:.2f} MB, {} request(s)".format(
+            label, entry['ranges'], entry['bytes'] / 1e6, entry['requests']))
+    ranges = sum(i['ranges'] or 0 for i in entries)
+    size = sum(i['bytes'] for i in entries)
+    requests = sum(i['requests'] for i in entries)
+    # requests of the object store are not throttled
+    rate = CONFIG.get("rate_limit", RATE_LIMIT) \
+        if client.source == "NOMADS" else None
+    seconds = size / (CONFIG.get("bandwidth", BANDWIDTH) * 1e6)
+    if rate:
+        # throttled requests plus the pause after each index file
+        seconds += requests / rate * 60. + len(entries)
+    print("Total: {} file(s), {} range(s), {:.2f} MB, {} request(s){}".format(
+        len(entries), ranges, size / 1e6, requests,
+        ", {:.1f} min at {}/min (NOMADS blocks at 120/min)".format(
+            requests / rate, rate) if rate else ""))
+    print("Estimated wall time: {:.0f} s at {} MB/s".format(
+        seconds, CONFIG.get("bandwidth", BANDWIDTH)))
 
-        if parallel:
-            queue = Queue()
-            p = Process(target=extract,
-                        args=(results.target, queue, keep_target),
-                        daemon=True)
-            # no join() required
-            p.start()
-            # renice on raspberry Pi
-            os.system("renice -n 19 -p {}".format(p.pid))
-            ps.append(p)
-            qs.append(queue)
-            print("Number of alive processes: {}"
-                  .format(sum([i.is_alive() for i in ps])))
-        else:
-            date_creation_string, res = extract(target=results.target)
-            dict_x = collect(res)
 
-    for q in qs:  # collecting from queue
-        date_creation_string, res = q.get()
-        dict_x = collect(res)
+def drain(
+        running: list,
+        block: bool = False
+) -> list[tuple[str, dict]]:
+    """
+    results of the decodes finished, which are removed from the decodes
+    running. A process exited without result is reported and removed.
+    :param running: (process, queue) or async result of the pool per decode
+    :param block: wait until at least one decode has finished
+    :return: date of creation and payload per decode, see extract()
+    """
+    while True:
+        done = list()
+        for item in list(running):
+            if isinstance(item, tuple):
+                p, q = item
+                # liveness first: a process flushing its result and exiting
+                # after the queue was found empty is polled once more below
+                alive = p.is_alive()
+                if not q.empty():
+                    done.append(q.get())
+                elif alive:
+                    continue
+                else:
+                    try:
+                        done.append(q.get(timeout=1.))
+                    except Empty:
+                        print("Process {} exited without result, exit code "
+                              "{}".format(p.pid, p.exitcode))
+            elif item.ready():
+                done.append(item.get())
+            else:
+                continue
+            running.remove(item)
+        if done or not block or not running:
+            return done
+        sleep(0.1)
 
-    # print(json.dumps(dict_x, indent=2))
 
-    write_forecast(datetimestr=date_creation_string,
-                   forecast=dict_x)  # always update entire json
+def main(
+        parallel: bool = False,
+        keep_target: bool = False,
+        session=None,
+        pool=None,
+        profile_memory: bool = False,
+        date: str = None,
+        time: int = None
+) -> None:
+    """
 
-    sys.exit(0)
+    :param parallel: engage multiprocessing, if True
+    :param keep_target: keep target, if True
+    :param session: shared requests.Session, e.g. of forecast-daemon
+    :param pool: shared multiprocessing.Pool, extraction is submitted to the
+    pool instead of a process per step, if provided
+    :param profile_memory: report the memory per phase and per step
+    :param date: YYYYMMDD of the forecast run, e.g. probed by forecast-daemon,
+    overrides parameter.json
+    :param time: hour of the forecast run, overrides parameter.json
+    :return:
+    """
+    # requests and bs4 loaded on download only, not on compaction
+    from gfs_fc_client import ENSEMBLE_MODELS, MEMBERS
+
+    # current parameter.json on each run, e.g. of forecast-daemon
+    load_config()
+    # define logging
+    if CONFIG.get('debug'):
+        logging_level: str = "DEBUG"
+        logging.basicConfig(format=MYFORMAT,
+                            level=getattr(logging, logging_level),
+                            datefmt="%Y-%m-%d %H:%M:%S")
+
+    # series of each parameter preallocated by step, filled by unpack()
+    forecast: dict[str, ForecastSeries] = dict()
+    steps = CONFIG.get("steps", default_steps(model=CONFIG.get('model')))
+    # ensemble, e.g. GEFS: members fetched concurrently, member x step series
+    # per parameter instead of forecast series, neither cube nor profile
+    settings = CONFIG.get('ensemble', dict())
+    ensemble = dict() if CONFIG.get('model') in ENSEMBLE_MODELS else None
+    members = settings.get('members', MEMBERS) if ensemble is not None \
+        else [None]
+    # optional box around the location per step, appended to a cube file
+    cube = CubeWriter(directory=CUBE_DIR, size=len(steps)) \
+        if CONFIG.get('cube') and ensemble is None else None
+    # optional vertical profiles, pressure levels of the shortNames
+    profile = dict() if CONFIG.get('profile') and ensemble is None else None
+    # optional RSS budget [MB] limiting the decodes at once
+    memory = Profile(enabled=profile_memory)
+    budget = Budget(**defined_kwargs(
+        budget=CONFIG.get('memory', dict()).get('budget'),
+        decode=CONFIG.get('memory', dict()).get('decode')))
+
+    date_creation_string: str = None
+    running = list()  # processes and queues, or async results of the pool
+
+    client = create_client(steps=steps,
+                           profile=profile is not None,
+                           session=session,
+                           date=date,
+                           time=time)
+    sinks = dict(cube=cube,
+                 profile=profile,
+                 ensemble=ensemble,
+                 members=len(members))
+
+    def receive(results: list[tuple[str, dict]]) -> None:
+        nonlocal date_creation_string
+        for date_creation_string, res in results:
+            budget.learn(memory=res.get('memory'))
+            memory.step(step=steps[res['index']],
+                        member=members[res['member']],
+                        memory=res.get('memory'))
+            with memory.phase("collect"):
+                collect(payload=res, forecast=forecast, size=len(steps),
+                        **sinks)
+
+    # index files of all steps at once, if the source permits
+    with memory.phase("prefetch"):
+        client.prefetch(steps=steps,
+                        members=members if ensemble is not None else None)
+
+    # members of a step concurrently, requests throttled by the rate limit
+    executor = ThreadPoolExecutor(max_workers=settings.get('workers', 4))
+    for index, step in enumerate(steps):
+        with memory.phase("retrieve"):
+            retrieved = list(executor.map(
+                lambda m: client.retrieve(
+                    step=step,
+                    member=m,
+                    **defined_kwargs(
+                        target=CONFIG.get('target')
+                    )
+                ),
+                members))
+        for member, results in enumerate(retrieved):
+            # success, all byte ranges complete
+            print(f"All byte ranges verified: {results.rc}")
+            if not results.target:
+                continue
+
+            args = (results.target, None, keep_target, index, member,
+                    profile_memory, dict(CONFIG))
+            if pool is not None or parallel:
+                # decodes at once limited by the RSS budget
+                receive(drain(running=running))
+                while not budget.admit(running=len(running)):
+                    receive(drain(running=running, block=True))
+            if pool is not None:
+                running.append(pool.apply_async(extract, args))
+            elif parallel:
+                queue = Queue()
+                p = Process(target=extract,
+                            args=args[:1] + (queue,) + args[2:],
+                            daemon=True)
+                # no join() required
+                p.start()
+                # renice on raspberry Pi
+                os.system("renice -n 19 -p {}".format(p.pid))
+                running.append((p, queue))
+                print("Number of alive processes: {}"
+                      .format(sum(isinstance(i, tuple) and i[0].is_alive()
+                                  for i in running)))
+            else:
+                with memory.phase("decode"):
+                    result = extract(*args)
+                receive([result])
+    executor.shutdown()
+
+    while running:  # collecting from queues or pool
+        receive(drain(running=running, block=True))
+    if cube and date_creation_string:
+        cube.close(datetimestr=date_creation_string)
+    if ensemble is not None:
+        if date_creation_string:
+            # statistics per forecast run, forecast.json is not affected
+            with memory.phase("write"):
+                save_ensemble(ensemble=ensemble,
+                              directory=ENSEMBLE_DIR,
+                              datetimestr=date_creation_string,
+                              percentiles=settings.get('percentiles'),
+                              thresholds=settings.get('thresholds'))
+        memory.report()
+        return
+
+    with memory.phase("write"):
+        # conversion to JSON at the output boundary only
+        dict_x = to_json(forecast)
+        # print(json.dumps(dict_x, indent=2))
+
+        # derived quantities once per forecast run, stored next to raw
+        # parameters
+        dict_x.update(derive(dict_x))
+        if profile and date_creation_string:
+            save(profile=profile,
+                 directory=PROFILE_DIR,
+                 datetimestr=date_creation_string)
+            if CONFIG['profile'].get('altitude') is not None:
+                pwv_site = pwv(profile=profile,
+                               altitude=CONFIG['profile']['altitude'])
+                if pwv_site:
+                    dict_x["Precipitable water above site:heightAboveSea:"
+                           "instant:{}".format(CONFIG['profile']['altitude'])
+                           ] = pwv_site
+
+        write_forecast(datetimestr=date_creation_string,
+                       forecast=dict_x,
+                       retention=CONFIG.get('retention'))  # always update entire json
+    memory.report()
 
 
 if __name__ == "__main__":
@@ -131,7 +417,61 @@ if __name__ == "__main__":
         help="Deletion of target files disabled."
     )
 
+    parser.add_argument(
+        '-c',
+        '--compact',
+        action="store_true",
+        help="Apply retention policy on forecast.json only, no download"
+    )
+
+    parser.add_argument(
+        '-n',
+        '--plan',
+        action="store_true",
+        help="Dry run: report byte ranges and requests of each step from the "
+             "index files only, no download"
+    )
+
+    parser.add_argument(
+        '-m',
+        '--profile-memory',
+        action="store_true",
+        help="Report the memory (RSS and traced allocations) per phase and "
+             "per step"
+    )
+
+    parser.add_argument(
+        '-d',
+        '--date',
+        type=str,
+        help="Date of the forecast run (YYYYMMDD), default=parameter.json or "
+             "most recent"
+    )
+
+    parser.add_argument(
+        '-t',
+        '--time',
+        type=int,
+        help="Hour of the forecast run, default=parameter.json or most recent"
+    )
+
+    if parser.parse_args().plan:
+        plan()
+        sys.exit(0)
+    if parser.parse_args().compact:
+        if load_config().get('retention'):
+            write_forecast(datetimestr=None,
+                           forecast=None,
+                           retention=CONFIG['retention'])
+        else:
+            print("No retention policy defined in parameter.json")
+        sys.exit(0)
+
     main(
         parallel=parser.parse_args().parallel,
-        keep_target=parser.parse_args().keep_target
+        keep_target=parser.parse_args().keep_target,
+        profile_memory=parser.parse_args().profile_memory,
+        date=parser.parse_args().date,
+        time=parser.parse_args().time
     )
+    sys.exit(0)
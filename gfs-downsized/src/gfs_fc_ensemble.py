@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+gfs_fc_ensemble
+ensemble forecast series, member x step per parameter, and their statistics
+(mean, spread, percentiles, probabilities of exceedance) computed once per
+forecast run and stored in data/ensemble/<run>.npz
+"""
+
+import os
+import numpy as np
+
+NAT = np.datetime64("NaT", "m")
+PERCENTILES = [10, 25, 50, 75, 90]
+
+
+class EnsembleSeries(object):
+    """
+    forecast series of all members of a single parameter, indexed by step
+    """
+    __slots__ = ("unit", "time", "value")
+
+    def __init__(
+            self,
+            unit: str,
+            members: int,
+            size: int
+    ):
+        self.unit = unit
+        self.time = np.full(size, NAT, dtype="datetime64[m]")
+        self.value = np.full((members, size), np.nan, dtype=np.float32)
+
+
+def unpack(
+        payload: dict,
+        member: int,
+        ensemble: dict[str, EnsembleSeries],
+        members: int,
+        size: int
+) -> None:
+    """
+    fill ensemble series in place at the member and index of the step
+    :param payload: see pack()
+    :param member: index of the member
+    :param ensemble: key: series
+    :param members: number of members
+    :param size: number of steps
+    :return:
+    """
+    times = np.frombuffer(payload['time'], dtype="datetime64[m]")
+    values = np.frombuffer(payload['value'], dtype=np.float32)
+    for (key, unit), time, value in zip(payload['units'].items(),
+                                        times, values):
+        if key not in ensemble:
+            ensemble[key] = EnsembleSeries(unit=unit,
+                                           members=members,
+                                           size=size)
+        ensemble[key].time[payload['index']] = time
+        ensemble[key].value[member, payload['index']] = value
+
+
+def statistics(
+        series: EnsembleSeries,
+        percentiles: list[float] = None,
+        thresholds: list[float] = None
+) -> dict[str, np.ndarray]:
+    """
+    statistics over the members of all steps at once, members missing are
+    disregarded
+    :param series:
+    :param percentiles: default=PERCENTILES
+    :param thresholds: values, whose probability of exceedance is computed
+    :return: arrays by name, percentile x step and threshold x step
+    """
+    percentiles = PERCENTILES if percentiles is None else percentiles
+    thresholds = list() if thresholds is None else thresholds
+    filled = ~np.isnat(series.time)
+    value = series.value[:, filled].astype(np.float64)
+    valid = np.count_nonzero(~np.isnan(value), axis=0)
+    exceeding = np.count_nonzero(
+        value[np.newaxis] > np.asarray(thresholds,
+                                       dtype=np.float64)[:, None, None],
+        axis=1)
+
+    return {
+        "time": series.time[filled],
+        "member": series.value[:, filled],
+        "mean": np.nanmean(value, axis=0),
+        "spread": np.nanstd(value, axis=0),
+        "q": np.asarray(percentiles, dtype=np.float64),
+        "percentile": np.nanpercentile(value, percentiles, axis=0)
+        .reshape(len(percentiles), -1),
+        "threshold": np.asarray(thresholds, dtype=np.float64),
+        "exceedance": exceeding / np.maximum(valid, 1)
+    }
+
+
+def save(
+        ensemble: dict[str, EnsembleSeries],
+        directory: str,
+        datetimestr: str,
+        percentiles: list[float] = None,
+        thresholds: dict[str, list[float]] = None
+) -> str:
+    """
+    statistics of all parameters of the forecast run
+    :param ensemble: key: series
+    :param directory: location of the ensemble files
+    :param datetimestr: YYYYMMDDHHMM of the forecast run
+    :param percentiles: default=PERCENTILES
+    :param thresholds: key or name of the parameter: values, whose
+    probability of exceedance is computed
+    :return: ensemble file
+    """
+    thresholds = thresholds if thresholds else dict()
+    os.makedirs(directory, exist_ok=True)
+    arrays = dict()
+    for key, series in ensemble.items():
+        stats = statistics(
+            series=series,
+            percentiles=percentiles,
+            thresholds=thresholds.get(key, thresholds.get(key.split(":")[0]))
+        )
+        arrays[key + ".unit"] = np.array(series.unit)
+        for name, value in stats.items():
+            arrays["{}.{}".format(key, name)] = value
+        print("Ensemble {}: {} member(s), {} step(s)".format(
+            key, np.count_nonzero(~np.all(np.isnan(stats['member']), axis=1)),
+            len(stats['time'])))
+    target = "{}/{}.npz".format(directory, datetimestr)
+    np.savez_compressed(target, **arrays)
+    os.chmod(target, 0o666)  # docker owner is root, anyone can delete
+    print("Ensemble '{}': {} parameter(s)".format(os.path.basename(target),
+                                                  len(ensemble)))
+
+    return target
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+"""
+gfs_fc_memory
+memory of the engine on constrained hosts, e.g. a Raspberry Pi: resident set
+size (RSS) and Python allocations (tracemalloc) sampled per phase of the
+engine and per step decoded by a worker, and a budget of the RSS limiting
+the number of decodes at once.
+"""
+
+import os
+import resource
+import tracemalloc
+from time import perf_counter
+from contextlib import contextmanager
+
+MB = float(1 << 20)
+
+
+def rss() -> float:
+    """
+    :return: current resident set size of the process [MB], its peak if
+    /proc is not available
+    """
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") \
+                / MB
+    except (OSError, ValueError):
+        return peak_rss()
+
+
+def peak_rss() -> float:
+    """
+    :return: peak resident set size of the process since its start [MB]
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def sample() -> dict:
+    """
+    memory of a worker at the end of its decode, Python allocations only if
+    traced
+    :return: pid, rss, peak rss, and peak traced [MB]
+    """
+    return {
+        "pid": os.getpid(),
+        "rss": rss(),
+        "peak_rss": peak_rss(),
+        "traced": tracemalloc.get_traced_memory()[1] / MB
+        if tracemalloc.is_tracing() else None
+    }
+
+
+class Profile(object):
+    """
+    peak memory per phase of the engine and per step decoded, a no-op unless
+    enabled
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.phases = dict()  # name: [seconds, peak traced, rss]
+        self.steps = list()  # (step, member, sample)
+        if enabled:
+            tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        peak over all entries of the phase
+        :param name: e.g. "retrieve"
+        """
+        if not self.enabled:
+            yield
+            return
+        tracemalloc.reset_peak()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.phases.setdefault(name, [0., 0., 0.])
+            entry[0] += perf_counter() - start
+            entry[1] = max(entry[1], tracemalloc.get_traced_memory()[1] / MB)
+            entry[2] = max(entry[2], rss())
+
+    def step(
+            self,
+            step: int,
+            member: str,
+            memory: dict
+    ) -> None:
+        """
+        :param step:
+        :param member: member of an ensemble, None otherwise
+        :param memory: see sample()
+        """
+        if self.enabled and memory:
+            self.steps.append((step, member, memory))
+
+    def report(self) -> None:
+        if not self.enabled:
+            return
+        tracemalloc.stop()
+        print("Memory per phase (main process {}):".format(os.getpid()))
+        for name, (seconds, traced, resident) in self.phases.items():
+            print("  {:<10} {:7.1f} s, traced {:8.1f} MB, RSS {:8.1f} MB"
+                  .format(name, seconds, traced, resident))
+        print("Memory per step:")
+        for step, member, memory in sorted(self.steps, key=lambda x: x[0]):
+            print("  Step {:03d}{} (pid {}): traced {} MB, RSS {:.1f} MB, "
+                  "peak RSS {:.1f} MB".format(
+                   step, " " + member if member else "", memory['pid'],
+                   "{:.1f}".format(memory['traced'])
+                   if memory['traced'] is not None else "-",
+                   memory['rss'], memory['peak_rss']))
+        workers = dict()
+        for _, _, memory in self.steps:
+            workers[memory['pid']] = max(workers.get(memory['pid'], 0.),
+                                         memory['peak_rss'])
+        print("Peak RSS: main {:.1f} MB, {} worker(s) up to {:.1f} MB"
+              .format(peak_rss(), len(workers),
+                      max(workers.values(), default=0.)))
+
+
+class Budget(object):
+    """
+    RSS budget of the engine and its workers: a decode is admitted if the
+    current RSS of the engine plus the peak RSS of a decode for each decode
+    running, incl. the new one, fit. The peak of a decode is learned from the
+    workers, until then a single decode runs at a time.
+    """
+
+    def __init__(
+            self,
+            budget: float = None,
+            decode: float = None
+    ):
+        """
+        :param budget: [MB], None=unlimited
+        :param decode: initial estimate of the peak RSS of a decode [MB]
+        """
+        self.budget = budget
+        self.decode = decode
+
+    def learn(self, memory: dict) -> None:
+        """
+        :param memory: see sample()
+        """
+        if memory:
+            self.decode = max(self.decode or 0., memory['peak_rss'])
+
+    def admit(self, running: int) -> bool:
+        """
+        :param running: number of decodes running
+        :return: True, if one more decode fits
+        """
+        if self.budget is None or not running:
+            return True
+        if self.decode is None:
+            return False
+
+        return rss() + (running + 1) * self.decode <= self.budget
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+gfs_fc_series
+compact forecast series preallocated by step. Workers send the values of their
+step as raw buffers, conversion to JSON only at the output boundary.
+"""
+
+import numpy as np
+
+NAT = np.datetime64("NaT", "m")
+
+
+class ForecastSeries(object):
+    """
+    forecast series of a single parameter, indexed by step
+    """
+    __slots__ = ("unit", "time", "value")
+
+    def __init__(
+            self,
+            unit: str,
+            size: int
+    ):
+        self.unit = unit
+        self.time = np.full(size, NAT, dtype="datetime64[m]")
+        self.value = np.full(size, np.nan, dtype=np.float32)
+
+    def to_json(self) -> dict:
+        """
+        entries of steps filled only
+        :return: format of forecast.json
+        """
+        filled = ~np.isnat(self.time)
+        return {
+            "unit": self.unit,
+            "time": [i.replace("-", "").replace("T", "").replace(":", "")
+                     for i in np.datetime_as_string(self.time[filled],
+                                                    unit="m")],
+            # float32 resolution, avoid spurious digits in forecast.json
+            "value": [float("{:.7g}".format(i)) for i in self.value[filled]]
+        }
+
+
+def to_datetime64(
+        date: int,
+        time: int
+) -> np.datetime64:
+    """
+    :param date: YYYYMMDD, e.g. validityDate
+    :param time: HHMM, e.g. validityTime
+    :return:
+    """
+    date = str(date)
+    return np.datetime64("{}-{}-{}T{:02d}:{:02d}".format(
+        date[:4], date[4:6], date[6:8], time // 100, time % 100), "m")
+
+
+def pack(
+        index: int,
+        entries: dict[str, tuple[str, np.datetime64, float]],
+        boxes: dict = None,
+        profile: dict = None,
+        member: int = 0
+) -> dict:
+    """
+    values of a single step as raw buffers to be sent between processes
+    :param index: index of the step
+    :param entries: key: (unit, validity time, value)
+    :param boxes: key: (validity time, lats, lons, values) of the cube, if any
+    :param profile: validity time and level stack of the step, if any
+    :param member: index of the member of an ensemble
+    :return:
+    """
+    return {
+        "index": index,
+        "member": member,
+        "boxes": boxes if boxes else dict(),
+        "profile": profile if profile else dict(),
+        "units": {k: v[0] for k, v in entries.items()},
+        "time": np.array([v[1] for v in entries.values()],
+                         dtype="datetime64[m]").tobytes(),
+        "value": np.array([v[2] for v in entries.values()],
+                          dtype=np.float32).tobytes()
+    }
+
+
+def unpack(
+        payload: dict,
+        forecast: dict[str, ForecastSeries],
+        size: int
+) -> None:
+    """
+    fill forecast series in place at the index of the step of the payload
+    :param payload: see pack()
+    :param forecast: key: series
+    :param size: number of steps
+    :return:
+    """
+    times = np.frombuffer(payload['time'], dtype="datetime64[m]")
+    values = np.frombuffer(payload['value'], dtype=np.float32)
+    for (key, unit), time, value in zip(payload['units'].items(),
+                                        times, values):
+        if key not in forecast:
+            forecast[key] = ForecastSeries(unit=unit, size=size)
+        forecast[key].time[payload['index']] = time
+        forecast[key].value[payload['index']] = value
+
+
+def to_json(forecast: dict[str, ForecastSeries]) -> dict:
+    """
+    :param forecast: key: series
+    :return: format of forecast.json
+    """
+    return {k: v.to_json() for k, v in forecast.items()}
+
+
+def from_json(
+        forecast: dict,
+        times: np.ndarray
+) -> dict[str, ForecastSeries]:
+    """
+    series of a forecast run as stored in forecast.json, placed at the index
+    of their validity times, entries at other times are disregarded
+    :param forecast: format of forecast.json
+    :param times: validity time of each step, datetime64[m]
+    :return: key: series
+    """
+    result = dict()
+    for key, entry in forecast.items():
+        series = ForecastSeries(unit=entry['unit'], size=len(times))
+        time = np.array(["{}-{}-{}T{}:{}".format(i[:4], i[4:6], i[6:8],
+                                                 i[8:10], i[10:12])
+                         for i in entry['time']], dtype="datetime64[m]")
+        rows = np.minimum(np.searchsorted(times, time), len(times) - 1)
+        known = times[rows] == time
+        series.time[rows[known]] = time[known]
+        series.value[rows[known]] = np.asarray(entry['value'],
+                                               dtype=np.float32)[known]
+        result[key] = series
+
+    return result
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+gfs_decode
+parallel decode of a single multi-message GRIB file: offsets and lengths of
+the messages are scanned once without decoding, split into contiguous batches,
+and decoded by a pool of processes. Each worker memory-maps the file itself
+and returns records of point values only, merged by the caller in step order.
+"""
+
+import os
+import mmap
+from functools import partial
+from multiprocessing import Pool
+
+BATCHES = 4  # batches per worker, balances fields of unequal size
+MIN_BATCH = 4  # messages per batch at least
+
+
+def scan(target: str) -> list[tuple[int, int]]:
+    """
+    offset and length of each complete message from the headers (section 0),
+    no message is decoded
+    :param target: grib file
+    :return: (offset, length) in file order
+    """
+    messages = list()
+    position = 0
+    size = os.path.getsize(target)
+    with open(target, "rb") as grib_handle:
+        while position < size:
+            grib_handle.seek(position)
+            header = grib_handle.read(16)
+            if len(header) < 16 or header[:4] != b"GRIB":
+                break
+            length = int.from_bytes(header[8:16], "big") if header[7] == 2 \
+                else int.from_bytes(header[4:7], "big")
+            if length < 16 or position + length > size:
+                break
+            messages.append((position, length))
+            position += length
+
+    return messages
+
+
+def split(
+        messages: list[tuple[int, int]],
+        workers: int
+) -> list[list[tuple[int, int]]]:
+    """
+    contiguous batches of about equal number of messages
+    :param messages: see scan()
+    :param workers: number of processes
+    :return: batches in file order
+    """
+    number = max(1, min(workers * BATCHES, len(messages) // MIN_BATCH))
+    size = -(-len(messages) // number) if messages else 1
+
+    return [messages[i:i + size] for i in range(0, len(messages), size)]
+
+
+def messages_of(
+        target: str,
+        batch: list[tuple[int, int]]
+):
+    """
+    messages of a batch, one at a time from the memory-mapped file
+    :param target: grib file
+    :param batch: see split()
+    :return: generator of grib messages
+    """
+    import pygrib  # loaded by the decoding processes only
+    with open(target, "rb") as grib_handle, \
+            mmap.mmap(grib_handle.fileno(), 0,
+                      access=mmap.ACCESS_READ) as grib_map:
+        for offset, length in batch:
+            yield pygrib.fromstring(grib_map[offset:offset + length])
+
+
+def run(
+        function,
+        target: str,
+        workers: int = 1,
+        pool=None,
+        **kwargs
+) -> list:
+    """
+    map the decoding function over the batches of the file, in this process
+    if a single worker and no pool is given
+    :param function: top-level function(target, batch, **kwargs) returning a
+    list of records
+    :param target: grib file
+    :param workers: number of processes
+    :param pool: multiprocessing pool, e.g. of forecast-daemon
+    :param kwargs: passed to the function
+    :return: records of all batches in file order
+    """
+    messages = scan(target=target)
+    task = partial(function, target, **kwargs)
+    if pool is None and workers <= 1:
+        return task(messages)
+    batches = split(messages=messages,
+                    workers=workers if pool is None else os.cpu_count())
+    print("Decoding {} messages in {} batches".format(len(messages),
+                                                      len(batches)))
+    if pool is not None:
+        results = pool.map(task, batches)
+    else:
+        with Pool(processes=workers) as own_pool:
+            results = own_pool.map(task, batches)
+
+    return [record for result in results for record in result]
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""
+gfs_derived
+quantities derived from the raw forecast parameters, computed once per forecast
+run over entire series and stored next to the raw parameters in forecast.json
+"""
+
+import numpy as np
+
+
+def wind_speed(
+        u: np.ndarray,
+        v: np.ndarray
+) -> np.ndarray:
+    return np.hypot(u, v)
+
+
+def wind_direction(
+        u: np.ndarray,
+        v: np.ndarray
+) -> np.ndarray:
+    """
+    meteorological convention, direction the wind blows from, 0° is north
+    """
+    return (180. + np.degrees(np.arctan2(u, v))) % 360.
+
+
+def relative_humidity(
+        t: np.ndarray,
+        td: np.ndarray
+) -> np.ndarray:
+    """
+    Magnus formula over water (Alduchov and Eskridge, 1996)
+    :param t: temperature [K]
+    :param td: dew point temperature [K]
+    :return: relative humidity [%]
+    """
+    def saturation(x): return np.exp(17.625 * (x - 273.15) / (x - 30.11))
+
+    return 100. * saturation(td) / saturation(t)
+
+
+# derived parameter name: unit, raw parameters the formula depends on,
+# and formula. Accumulated parameters of GFS are reset every 6 hrs (buckets),
+# hence, they are not de-accumulated.
+REGISTRY = {
+    "Wind speed": {
+        "unit": "m s**-1",
+        "depends": ["U component of wind", "V component of wind"],
+        "formula": wind_speed
+    },
+    "Wind direction": {
+        "unit": "Degree true",
+        "depends": ["U component of wind", "V component of wind"],
+        "formula": wind_direction
+    },
+    "10 metre wind speed": {
+        "unit": "m s**-1",
+        "depends": ["10 metre U wind component", "10 metre V wind component"],
+        "formula": wind_speed
+    },
+    "10 metre wind direction": {
+        "unit": "Degree true",
+        "depends": ["10 metre U wind component", "10 metre V wind component"],
+        "formula": wind_direction
+    },
+    "2 metre relative humidity": {
+        "unit": "%",
+        "depends": ["2 metre temperature", "2 metre dewpoint temperature"],
+        "formula": relative_humidity
+    }
+}
+
+
+def derive(forecast: dict) -> dict:
+    """
+    compute all derived parameters whose raw parameters are available
+    :param forecast: raw parameters of a single forecast run
+    :return: derived parameters in the format of forecast.json
+    """
+    result = dict()
+
+    for name, spec in REGISTRY.items():
+        if not all(i in forecast for i in spec['depends']):
+            continue
+        time = forecast[spec['depends'][0]]['time']
+        if any(forecast[i]['time'] != time for i in spec['depends'][1:]):
+            print("Validity times of {} differ. Skipping {} ..."
+                  .format(spec['depends'], name))
+            continue
+        order = np.argsort(time)
+        args = [np.asarray(forecast[i]['value'], dtype=float)[order]
+                for i in spec['depends']]
+        result[name] = {
+            "unit": spec['unit'],
+            "time": [time[i] for i in order],
+            "value": spec['formula'](*args).tolist()
+        }
+        print("Derived parameter: {}".format(name))
+
+    return result
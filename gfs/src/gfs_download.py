@@ -5,19 +5,27 @@ The NOAA Big Data Program also provides access to gridded 0.25°- and 0.5°-reso
 analysis and forecast data in a trailing 30-day window in the AWS Open Data Registry for GFS.
 Download GFS forecast data
 https://nomads.ncep.noaa.gov/pub/data/nccf/com/gfs/
-via FTP into a GRIB2 file and extract each parameter
+via FTP, or from the AWS Open Data mirror (option "source": "S3" in
+parameter.json), into a GRIB2 file and extract each parameter
 """
 
-import pygrib
 import os
 import sys
 import re
 import argparse
-from scipy.interpolate import RegularGridInterpolator
 import numpy as np
 import json
+from xml.etree import ElementTree
 from ftplib import FTP
+from datetime import datetime, timedelta, timezone
 import math
+# internal
+from gfs_derived import derive
+from gfs_cube import CubeWriter, box_indices, cell_indices, BOX
+from gfs_profile import (ProfileSeries, TYPE_OF_LEVEL, SHORT_NAMES, stack,
+                         fill, pwv, save)
+from gfs_decode import run, messages_of
+from gfs_notify import summary, publish
 
 NO_FILES: int = 209  # total number to download from https://www.nco.ncep.noaa.gov/pmb/products/gfs/
 NO_FILE_TEST: int = 3  # test option "-t" stops after NO_FILE_TEST grib2 files
@@ -27,8 +35,25 @@ SPATIAL_RESOLUTION: float = 0.25  # spatial resolution of the model
 SOURCE_DIR = os.path.dirname(os.path.realpath(__file__))
 DATA_DIR = "{}/../data".format(SOURCE_DIR)
 LOG_DIR = "{}/../logs".format(SOURCE_DIR)
+LOG_FILE = "{}/forecast.json".format(DATA_DIR)
+CONFIG_FILE = "{}/parameter.json".format(DATA_DIR)
+CUBE_DIR = "{}/cube".format(DATA_DIR)
+PROFILE_DIR = "{}/profile".format(DATA_DIR)
+INDEX_DIR = "{}/indices".format(DATA_DIR)
+EVENT_DIR = "{}/events".format(DATA_DIR)
+PROVIDER = "GFS"
 FTP_HOST = "ftp.ncep.noaa.gov"
 PATH = "/pub/data/nccf/com/gfs/prod"
+# NOAA Big Data Program, GFS on AWS Open Data, anonymous access
+S3 = {
+    "endpoint": "https://s3.amazonaws.com",
+    "bucket": "noaa-gfs-bdp-pds"
+}
+CHUNK_SIZE = 1 << 20
+BANDWIDTH = 10.  # assumed download rate of the plan [MB/s]
+# forecast.json as last written by this process, e.g. by the daemon, to skip
+# parsing it again on the next write
+_STORE: dict = dict()
 
 
 def defined_kwargs(**kwargs) -> dict:
@@ -37,28 +62,92 @@ def defined_kwargs(**kwargs) -> dict:
 
 def write_forecast(
         datetimestr: str,
-        forecast: dict
+        forecast: dict,
+        retention: dict = None
 ) -> None:
     """
-    update log.json
+    update forecast.json atomically, i.e. write a temporary file and replace,
+    apply retention policy if provided
     :param datetimestr: YYYYMMDDHH
     :param forecast:
+    :param retention: retention policy, see compact()
     :return: None
     """
-    log_file = "{}/forecast.json".format(DATA_DIR)
-    if not os.path.exists(log_file):
-        with open(log_file, "w") as create_empty:
-            json.dump({}, create_empty)
-            os.chmod(log_file, 0o666)  # docker owner is root, anyone can delete
-    with open(log_file, "r+") as jsonFile:
-        data = json.load(jsonFile)
+    data = dict()
+    size = 0
+    if os.path.exists(LOG_FILE):
+        stat = os.stat(LOG_FILE)
+        size = stat.st_size
+        if _STORE.get('version') == (stat.st_mtime_ns, stat.st_size):
+            data = _STORE['data']  # unchanged since last write
+        else:
+            with open(LOG_FILE, "r") as jsonFile:
+                data = json.load(jsonFile)
+    if datetimestr:
         data[datetimestr] = forecast
-        jsonFile.seek(0)  # rewind
+    if retention:
+        data = compact(data=data, retention=retention)
+    with open(LOG_FILE + ".tmp", "w") as jsonFile:
         json.dump(data,
                   jsonFile,
                   indent=2,
                   sort_keys=True)
-        jsonFile.truncate()
+    os.chmod(LOG_FILE + ".tmp", 0o666)  # docker owner is root, anyone can delete
+    os.replace(LOG_FILE + ".tmp", LOG_FILE)
+    stat = os.stat(LOG_FILE)
+    _STORE['version'] = (stat.st_mtime_ns, stat.st_size)
+    _STORE['data'] = data
+    print("File '{}' size: {} -> {} bytes".format(
+        os.path.basename(LOG_FILE), size, stat.st_size))
+
+
+def compact(
+        data: dict,
+        retention: dict,
+        now: datetime = None
+) -> dict:
+    """
+    apply retention policy on forecast runs: keep full runs for "full_days",
+    then reduce runs to the 00/12 cycles ("reduction": "cycles") or to the
+    first 24 hrs of each run ("reduction": "first24h") until "reduced_days",
+    drop runs thereafter
+    :param data: content of forecast.json
+    :param retention: see parameter.json
+    :param now: reference time, default=current time
+    :return: compacted content
+    """
+    now = now or datetime.now(timezone.utc)
+    full = timedelta(days=retention.get('full_days', 36500))
+    reduced = timedelta(days=retention.get('reduced_days', 0))
+    result = dict()
+    dropped, truncated = 0, 0
+
+    for datetimestr, forecast in data.items():
+        issue = datetime.strptime(datetimestr, "%Y%m%d%H%M") \
+            .replace(tzinfo=timezone.utc)
+        if now - issue <= full:
+            result[datetimestr] = forecast
+        elif now - issue > max(full, reduced):
+            dropped += 1
+        elif retention.get('reduction') == "first24h":
+            until = (issue + timedelta(hours=24)).strftime("%Y%m%d%H%M")
+            result[datetimestr] = dict()
+            for param, values in forecast.items():
+                keep = [i for i, t in enumerate(values['time']) if t <= until]
+                result[datetimestr][param] = {
+                    **values,
+                    "time": [values['time'][i] for i in keep],
+                    "value": [values['value'][i] for i in keep]
+                }
+                truncated += len(values['time']) - len(keep)
+        elif issue.hour in (0, 12):  # reduction "cycles"
+            result[datetimestr] = forecast
+        else:
+            dropped += 1
+    print("Compaction: {} run(s) dropped, {} entries truncated"
+          .format(dropped, truncated))
+
+    return result
 
 
 def create_grid(
@@ -86,11 +175,126 @@ def create_grid(
     }
 
 
-def extract(target: str) -> dict:
-    fs: list = []
+def selected(
+        item,
+        parameters: list[dict]
+) -> bool:
+    """
+    selection of pygrib's select() on a single message, any of the parameters
+    of parameter.json matching
+    :param item: grib message
+    :param parameters: shortName, typeOfLevel, and level, single or list
+    :return:
+    """
+    for entry in parameters:
+        params = defined_kwargs(
+            shortName=entry.get('shortName'),
+            typeOfLevel=entry.get('typeOfLevel'),
+            level=entry.get('level')
+        )
+        if all(item[k] in (v if isinstance(v, list) else [v])
+               for k, v in params.items()):
+            return True
+
+    return False
+
+
+def decode(
+        target: str,
+        batch: list[tuple[int, int]],
+        grid: dict,
+        coordinates: np.ndarray,
+        parameters: list[dict],
+        box: float = None,
+        names: list = None
+) -> list[dict]:
+    """
+    decode the selected messages of a batch one at a time, see gfs_decode
+    :param target: grib file
+    :param batch: offset and length of the messages
+    :param grid: grid cell around the location
+    :param coordinates: latitude, longitude of the location
+    :param parameters: see parameter.json
+    :param box: half width of the box of the cube [deg], no box if None
+    :param names: shortNames of the profile, no profile if None
+    :return: records of the selected messages in file order
+    """
+    from scipy.interpolate import RegularGridInterpolator
+    records = list()
+    for item in messages_of(target=target, batch=batch):
+        value = selected(item=item, parameters=parameters)
+        level = names is not None and item['typeOfLevel'] == TYPE_OF_LEVEL \
+            and item['shortName'] in names
+        if not (value or level):
+            continue
+        if value:
+            print(item["shortName"], item)
+        # decoded once for the grid cell and the box
+        values = item.values
+        geometry = (item['gridType'], item['Ni'], item['Nj'],
+                    item['latitudeOfFirstGridPointInDegrees'],
+                    item['longitudeOfFirstGridPointInDegrees'])
+        rows, cols, lats, lons = cell_indices(geometry=geometry,
+                                              item=item,
+                                              grid=grid)
+        data = values[np.ix_(rows, cols)]
+        record = {
+            "name": item['name'],
+            "shortName": item['shortName'],
+            "units": item['units'],
+            "level": item['level'],
+            "time": "{}{:04d}".format(item['validityDate'],
+                                      item['validityTime'])
+        }
+        if level:
+            record['cell'] = (data, lats, lons)
+        if value:
+            nearest_neighbor = RegularGridInterpolator(
+                (lats[:, 0], lons[0, :]),
+                data,
+                method='linear'
+            )
+            record['value'] = list(nearest_neighbor(coordinates))[0]
+            if box is not None:
+                rows, cols, box_lats, box_lons = box_indices(
+                    geometry=geometry,
+                    item=item,
+                    coordinates=coordinates,
+                    box=box
+                )
+                record['box'] = (box_lats, box_lons,
+                                 values[np.ix_(rows, cols)])
+        records.append(record)
+        del data, values
+
+    return records
+
+
+def extract(
+        target: str,
+        cube: CubeWriter = None,
+        index: int = 0,
+        profile: dict[str, ProfileSeries] = None,
+        size: int = 1,
+        workers: int = 1,
+        pool=None
+) -> dict:
+    """
+    extract grib2 file according to select parameter
+    :param target: file name in DATA_DIR
+    :param cube: cube of the forecast run, the box around the location is
+    appended, if provided
+    :param index: index of the step of the target
+    :param profile: profile series of the forecast run, filled in place with
+    the pressure levels of the step, if provided
+    :param size: number of steps
+    :param workers: number of processes decoding the grib file
+    :param pool: multiprocessing pool, e.g. of forecast-daemon, overrides
+    workers
+    :return: values at the location
+    """
     tmp: dict = {}
-    config_file = "{}/parameter.json".format(DATA_DIR)
-    with open(config_file, "r") as f:
+    with open(CONFIG_FILE, "r") as f:
         config = json.load(f)
     coords = np.array([config['geo_coordinates']['latitude'],
                        (config['geo_coordinates']['longitude'] + 360) % 360])
@@ -98,46 +302,229 @@ def extract(target: str) -> dict:
     grid = create_grid(coordinates=coords,
                        resolution=SPATIAL_RESOLUTION)
 
-    fsss = pygrib.open("{}/{}".format(DATA_DIR, target))
-    # for item in fsss:
-    #     print(item["shortName"], item)
-    # print("\n")
-    for item in config['parameter']:
-        params = defined_kwargs(
-            shortName=item.get('shortName'),
-            typeOfLevel=item.get('typeOfLevel'),
-            level=item.get('level')
-        )
-        fs.extend(fsss.select(**params))
-
-    for item in fs:
-        print(item["shortName"], item)
-        data, lats, lons = item.data(**grid)
-        nearest_neighbor = RegularGridInterpolator(
-            (lats[:, 0], lons[0, :]),
-            data,
-            method='linear'
-        )
-        value_at_coordinates = list(nearest_neighbor(coords))[0]
-        dt_str = "{}{:04d}".format(
-            item['validityDate'],
-            item['validityTime']
-        )
-        tmp[item['name']] = {
-            "unit": item['units'],
-            "time": [dt_str],
-            "value": [value_at_coordinates]
+    # messages scanned once, batches decoded by a pool of processes if more
+    # than one worker, records in file order
+    records = run(
+        function=decode,
+        target="{}/{}".format(DATA_DIR, target),
+        workers=workers,
+        pool=pool,
+        grid=grid,
+        coordinates=coords,
+        parameters=config['parameter'],
+        box=config['cube'].get('box', BOX) if cube else None,
+        names=config['profile'].get('shortName', SHORT_NAMES)
+        if profile is not None else None
+    )
+    entries = list()
+    for record in records:
+        if "cell" in record:
+            data, lats, lons = record['cell']
+            entries.append((record['shortName'], record['units'],
+                            record['level'], data, record['time'], lats,
+                            lons))
+        if "value" not in record:
+            continue
+        if cube:
+            cube.append(key=record['name'],
+                        unit=record['units'],
+                        index=index,
+                        time=record['time'],
+                        lats=record['box'][0],
+                        lons=record['box'][1],
+                        values=record['box'][2])
+        tmp[record['name']] = {
+            "unit": record['units'],
+            "time": [record['time']],
+            "value": [record['value']]
         }
-    fsss.close()
+    if entries:
+        # level stack of the step interpolated at once
+        fill(profile=profile,
+             index=index,
+             time=entries[0][4],
+             # grid cell of the messages of the step
+             step=stack(entries=entries,
+                        lats=entries[0][5],
+                        lons=entries[0][6],
+                        coordinates=coords),
+             size=size)
 
     return tmp
 
 
+def s3_files(
+        session,
+        s3: dict,
+        prefix: str
+) -> dict[str, int]:
+    """
+    ListObjectsV2 of the object store, anonymous access
+    :param session: pooled connections, requests.Session
+    :param s3: endpoint and bucket
+    :param prefix: of the keys
+    :return: file name: size [bytes] of all keys
+    """
+    base = "{}/{}".format(s3['endpoint'], s3['bucket'])
+    params = {"list-type": "2", "prefix": prefix}
+    files = dict()
+    while True:
+        response = session.get(base, params=params)
+        response.raise_for_status()
+        root = ElementTree.fromstring(response.content)
+        # namespace of the S3 API
+        ns = root.tag[:root.tag.index("}") + 1] \
+            if root.tag.startswith("{") else ""
+        for item in root.iter(ns + "Contents"):
+            files[item.find(ns + "Key").text.split("/")[-1]] = int(
+                item.find(ns + "Size").text)
+        token = root.find(ns + "NextContinuationToken")
+        if token is None:
+            break
+        params['continuation-token'] = token.text
+
+    return files
+
+
+def s3_cycle(
+        session,
+        s3: dict,
+        datetimestr: str = None
+) -> tuple[str, str, dict[str, int]]:
+    """
+    forecast run in the object store, the most recent one with any file
+    uploaded, if not specified
+    :param session: pooled connections, requests.Session
+    :param s3: endpoint and bucket
+    :param datetimestr: YYYYMMDDHH
+    :return: date string, hour, file names with their sizes
+    """
+    if datetimestr:
+        cycles = [datetime.strptime(datetimestr, "%Y%m%d%H")]
+    else:
+        now = datetime.now(timezone.utc)
+        cycles = [now.replace(hour=now.hour - now.hour % 6, minute=0, second=0,
+                              microsecond=0) - timedelta(hours=6 * i)
+                  for i in range(8)]  # last two days
+    for cycle in cycles:
+        files = s3_files(session=session,
+                         s3=s3,
+                         prefix="gfs.{0}/{1}/atmos/gfs.t{1}z.pgrb2.0p25.f"
+                         .format(cycle.strftime("%Y%m%d"),
+                                 cycle.strftime("%H")))
+        if files:
+            return cycle.strftime("%Y%m%d"), cycle.strftime("%H"), files
+
+    raise LookupError("No forecast run found in bucket {}".format(
+        s3['bucket']))
+
+
+def ftp_cycle(
+        ftp: FTP,
+        datetimestr: str = None
+) -> tuple[str, str, list[str]]:
+    """
+    forecast run on the FTP server, the most recent one, if not specified.
+    The working directory is changed to the files of the forecast run.
+    :param ftp: logged in
+    :param datetimestr: YYYYMMDDHH
+    :return: date string, hour, file names
+    """
+    if datetimestr:
+        date_string, last_hour = datetimestr[:8], datetimestr[8:10]
+        ftp.cwd("{}/gfs.{}".format(PATH, date_string))
+    else:
+        ftp.cwd(PATH)
+        last_entry = sorted(list(filter(
+            lambda x: x.startswith("gfs."), ftp.nlst()
+        )))[-1]
+        ftp.cwd(last_entry)
+        date_string = last_entry.lstrip("gfs.")
+        last_hour = ftp.nlst()[-1]
+    ftp.cwd("{}/atmos".format(last_hour))
+
+    return date_string, last_hour, ftp.nlst()
+
+
+def plan(
+        datetimestr: str = None,
+        subset: int = 1
+) -> None:
+    """
+    dry run: the grib files of the forecast run are listed with their sizes,
+    which are cached in INDEX_DIR once the file set is complete. Files,
+    bytes, and requests are reported per step and in total, nothing is
+    downloaded. Files are fetched as a whole, parameters are selected after
+    the download.
+    :param datetimestr: YYYYMMDDHH forecast run, default=most recent
+    :param subset: every subset^th hour only
+    :return:
+    """
+    regex = re.compile(
+        r"^gfs.t[0-9]{2}z.pgrb2.0p25.f([0-9]{3})$"
+    )
+    with open(CONFIG_FILE, "r") as f:
+        config = json.load(f)
+    if not config.get('parameter'):
+        print("Caveat: no parameter selected, all parameters are decoded!")
+    source = config.get('source', "FTP")  # [FTP|S3]
+    cache = "{}/{}.json".format(INDEX_DIR, datetimestr) if datetimestr \
+        else None
+    if cache and os.path.exists(cache):
+        with open(cache, "r") as f:
+            sizes = json.load(f)
+        print("File list of run {} cached".format(datetimestr))
+    elif source == "S3":
+        import requests  # S3 only
+        s3 = {**S3, **config.get('s3', dict())}
+        date_string, last_hour, sizes = s3_cycle(session=requests.Session(),
+                                                 s3=s3,
+                                                 datetimestr=datetimestr)
+        datetimestr = "{}{}".format(date_string, last_hour)
+    else:
+        ftp = FTP(FTP_HOST)
+        ftp.login()
+        date_string, last_hour, filenames = ftp_cycle(
+            ftp=ftp,
+            datetimestr=datetimestr)
+        datetimestr = "{}{}".format(date_string, last_hour)
+        ftp.voidcmd("TYPE I")  # size in binary mode
+        sizes = {i: ftp.size(i) for i in sorted(filenames)
+                 if re.search(regex, i)}
+        ftp.quit()
+    sizes = {k: v for k, v in sizes.items() if re.search(regex, k)}
+    cache = "{}/{}.json".format(INDEX_DIR, datetimestr)
+    if len(sizes) == NO_FILES and not os.path.exists(cache):
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        with open(cache, "w") as f:
+            json.dump(sizes, f)
+        os.chmod(cache, 0o666)  # docker owner is root, anyone can delete
+
+    # a size and a retrieval per file on FTP, a retrieval on S3
+    per_file = 2 if source != "S3" else 1
+    selected_files = {k: v for k, v in sorted(sizes.items())
+                      if int(re.findall(regex, k)[0]) % subset == 0}
+    print("Plan of forecast run {}, source {}, {} of {} files{}".format(
+        datetimestr, source, len(sizes), NO_FILES,
+        "" if len(sizes) == NO_FILES else " (incomplete)"))
+    for filename, size in selected_files.items():
+        print("Step {}: 1 file, {:.2f} MB, {} request(s)".format(
+            re.findall(regex, filename)[0], size / 1e6, per_file))
+    total = sum(selected_files.values())
+    print("Total: {} file(s), {:.2f} MB, {} request(s)".format(
+        len(selected_files), total / 1e6, per_file * len(selected_files)))
+    bandwidth = config.get("bandwidth", BANDWIDTH)
+    print("Estimated wall time: {:.0f} s at {} MB/s".format(
+        total / (bandwidth * 1e6), bandwidth))
+
+
 def ftp_fetch(
         datetimestr: str = None,
         *,
         test: bool = False,
-        subset: int = 1
+        subset: int = 1,
+        workers: int = 1,
+        pool=None
 ) -> None:
     """
     be absolutely careful
@@ -146,6 +533,9 @@ def ftp_fetch(
     the current date & times if specified
     :param test: test with few files only
     :param subset: download every subset^th hour only
+    :param workers: number of processes decoding each grib file
+    :param pool: multiprocessing pool, e.g. of forecast-daemon, overrides
+    workers
     :return:
     """
     targets: list = []
@@ -158,30 +548,32 @@ def ftp_fetch(
     regex_datetime = re.compile(
         r"^(20[234][0-9])(0?[1-9]|1[012])(0[1-9]|[12]\d|3[01])(00|06|12|18)$"
     )
+    with open(CONFIG_FILE, "r") as f:
+        config = json.load(f)
+    retention = config.get('retention')
+    source = config.get('source', "FTP")  # [FTP|S3]
+    s3 = {**S3, **config.get('s3', dict())}
 
     try:
-        ftp = FTP(FTP_HOST)
-        ftp.login()
-        if datetimestr:
-            l_datetime = re.findall(regex_datetime, datetimestr)
-            if l_datetime:
-                date_string = "".join(l_datetime[0][:3])
-                last_hour = l_datetime[0][3]
-            else:
-                raise ValueError("Invalid Date/Time provided.")
-            ftp.cwd("{}/gfs.{}".format(PATH, date_string))
+        if datetimestr and not re.findall(regex_datetime, datetimestr):
+            raise ValueError("Invalid Date/Time provided.")
+        if source == "S3":
+            import requests  # S3 only
+            session = requests.Session()  # pooled connections
+            date_string, last_hour, filenames = s3_cycle(
+                session=session,
+                s3=s3,
+                datetimestr=datetimestr)
+            datetimestr = "{}{}".format(date_string, last_hour)
         else:
-            ftp.cwd(PATH)
-            last_entry = sorted(list(filter(
-                lambda x: x.startswith("gfs."), ftp.nlst()
-            )))[-1]
-            ftp.cwd(last_entry)
-            date_string = last_entry.lstrip("gfs.")
-            last_hour = ftp.nlst()[-1]
+            ftp = FTP(FTP_HOST)
+            ftp.login()
+            date_string, last_hour, filenames = ftp_cycle(
+                ftp=ftp,
+                datetimestr=datetimestr)
             # reuse datetime for current date/time
             datetimestr = "{}{}".format(date_string, last_hour)
-        ftp.cwd("{}/atmos".format(last_hour))
-        for filename in sorted(ftp.nlst()):
+        for filename in sorted(filenames):
             if re.search(regex, filename):
                 targets.append(filename)
         print("Number of files to download: {}".format(len(targets)))
@@ -189,6 +581,13 @@ def ftp_fetch(
         datetimestr += "00"  # append 00 minutes
         if len(targets) == NO_FILES:
             msg = "Success"
+            size = sum(int(re.findall(regex, i)[0]) % subset == 0
+                       for i in targets)
+            # optional box around the location per step, appended to a cube
+            cube = CubeWriter(directory=CUBE_DIR, size=size) \
+                if config.get('cube') else None
+            # optional vertical profiles, pressure levels of the shortNames
+            profile = dict() if config.get('profile') else None
             for target in targets:
                 hrs = int(re.findall(regex, target)[0])
                 if hrs % subset != 0: # download every ?th hour
@@ -199,12 +598,26 @@ def ftp_fetch(
                         "{}/{}".format(DATA_DIR, target),
                         'wb'
                 ) as fp:
-                    ftp.retrbinary("RETR {}".format(target), fp.write)
+                    if source == "S3":
+                        with session.get("{}/{}/gfs.{}/{}/atmos/{}".format(
+                                s3['endpoint'], s3['bucket'], date_string,
+                                last_hour, target), stream=True) as response:
+                            response.raise_for_status()
+                            for chunk in response.iter_content(CHUNK_SIZE):
+                                fp.write(chunk)
+                    else:
+                        ftp.retrbinary("RETR {}".format(target), fp.write)
                 print("File '{}' downloaded".format(target))
                 # docker owner is root, anyone can delete in case of failure
                 os.chmod("{}/{}".format(DATA_DIR, target), 0o666)
 
-                r = extract(target=target)
+                r = extract(target=target,
+                            cube=cube,
+                            index=cnt_files,
+                            profile=profile,
+                            size=size,
+                            workers=workers,
+                            pool=pool)
 
                 # create a global dict
                 if dict_x:
@@ -225,11 +638,33 @@ def ftp_fetch(
                         default=str
                     )
                 )
+                # derived quantities over the series downloaded so far, kept
+                # apart from dict_x that is extended file by file
+                derived = derive(dict_x)
+                if profile and config['profile'].get('altitude') is not None:
+                    pwv_site = pwv(profile=profile,
+                                   altitude=config['profile']['altitude'])
+                    if pwv_site:
+                        derived["Precipitable water above site"] = pwv_site
                 write_forecast(datetimestr=datetimestr,
-                               forecast=dict_x)  # always update
+                               forecast={**dict_x, **derived},
+                               retention=retention)  # always update
                 if test and cnt_files == NO_FILE_TEST:  # for testing -d option
                     msg = "File set is incomplete due to option"
                     break
+            if cube:
+                cube.close(datetimestr=datetimestr)
+            if profile:
+                save(profile=profile,
+                     directory=PROFILE_DIR,
+                     datetimestr=datetimestr)
+            if msg == "Success":
+                # forecast.json is updated file by file, subscribers are
+                # notified once the run is complete
+                publish(directory=EVENT_DIR,
+                        event=summary(provider=PROVIDER,
+                                      datetimestr=datetimestr,
+                                      forecast={**dict_x, **derived}))
         else:
             msg = "File set is incomplete. Try again later."
     except Exception as e:
@@ -262,8 +697,46 @@ if __name__ == "__main__":
         help="Download every ?(2nd, 3rd, 4th, ...) hour, default=entire set"
     )
 
+    parser.add_argument(
+        '-c',
+        '--compact',
+        action="store_true",
+        help="Apply retention policy on forecast.json only, no download"
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=1,
+        help="Number of processes decoding each grib file, default=1"
+    )
+
+    parser.add_argument(
+        '-n',
+        '--plan',
+        action="store_true",
+        help="Dry run: report files, bytes, and requests of each step from "
+             "the file list only, no download"
+    )
+
+    if parser.parse_args().plan:
+        plan(datetimestr=parser.parse_args().datetimestr,
+             subset=parser.parse_args().subset)
+        sys.exit(0)
+    if parser.parse_args().compact:
+        with open(CONFIG_FILE, "r") as config_handle:
+            policy = json.load(config_handle).get('retention')
+        if policy:
+            write_forecast(datetimestr=None,
+                           forecast=None,
+                           retention=policy)
+        else:
+            print("No retention policy defined in {}".format(CONFIG_FILE))
+        sys.exit(0)
+
     ftp_fetch(
         datetimestr=parser.parse_args().datetimestr,
         test=parser.parse_args().test,
-        subset=parser.parse_args().subset
+        subset=parser.parse_args().subset,
+        workers=parser.parse_args().workers
     )
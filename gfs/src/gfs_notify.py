@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+gfs_notify
+"run ready" event published as soon as a forecast run is committed to
+forecast.json. Subscribers bind a Unix datagram socket each in data/events,
+e.g. tools/forecast_subscribe, and receive a single JSON datagram per run:
+provider, run, parameters and time span. No broker is involved, sockets of
+subscribers gone are removed. Publishing never fails the ingest.
+"""
+
+import os
+import json
+import socket
+from datetime import datetime, timezone
+
+EVENT = "run ready"
+
+
+def summary(
+        provider: str,
+        datetimestr: str,
+        forecast: dict
+) -> dict:
+    """
+    :param provider: weather forecast provider ECMWF | GFS | GFS-DOWNSIZED
+    :param datetimestr: YYYYMMDDHHMM of the forecast run
+    :param forecast: format of forecast.json
+    :return: event of the forecast run
+    """
+    times = [i for entry in forecast.values() for i in entry['time']]
+    return {
+        "event": EVENT,
+        "provider": provider,
+        "run": datetimestr,
+        "parameters": sorted(forecast),
+        "start": min(times) if times else None,
+        "end": max(times) if times else None,
+        "published": datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+    }
+
+
+def publish(
+        directory: str,
+        event: dict
+) -> int:
+    """
+    send the event to all subscribers of the directory
+    :param directory: location of the sockets of the subscribers
+    :param event: see summary()
+    :return: number of subscribers reached
+    """
+    if not os.path.isdir(directory):
+        return 0
+    message = json.dumps(event).encode("utf-8")
+    reached = 0
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sender:
+        sender.setblocking(False)  # a slow subscriber never blocks ingest
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".sock"):
+                continue
+            path = "{}/{}".format(directory, name)
+            try:
+                sender.sendto(message, path)
+                reached += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.remove(path)  # subscriber gone
+                except OSError:
+                    pass
+            except OSError as e:  # e.g. queue of the subscriber full
+                print("Event not sent to '{}': {}".format(name, e))
+    print("Event '{}' of run {} sent to {} subscriber(s)".format(
+        event['event'], event['run'], reached))
+
+    return reached
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+"""
+gfs_profile
+vertical profiles of a forecast run: all isobaric levels of the selected
+parameters (shortName) are interpolated at the location in a single operation
+per step and collected as level x time arrays per parameter. Precipitable water
+vapour above the altitude of the site is integrated from the profiles at
+ingest.
+"""
+
+import os
+import numpy as np
+
+TYPE_OF_LEVEL = "isobaricInhPa"
+# temperature, specific humidity, and geopotential height by default
+SHORT_NAMES = ["t", "q", "gh"]
+G = 9.80665  # standard gravity [m s**-2]
+NAT = np.datetime64("NaT", "m")
+
+
+class ProfileSeries(object):
+    """
+    profile series of a single parameter, level x step
+    """
+    __slots__ = ("unit", "levels", "time", "value")
+
+    def __init__(
+            self,
+            unit: str,
+            levels: np.ndarray,
+            size: int
+    ):
+        """
+        :param unit:
+        :param levels: pressure levels [hPa] in descending order
+        :param size: number of steps
+        """
+        self.unit = unit
+        self.levels = np.asarray(levels, dtype=np.float64)
+        self.time = np.full(size, NAT, dtype="datetime64[m]")
+        self.value = np.full((len(levels), size), np.nan, dtype=np.float32)
+
+
+def to_datetime64(datetimestr: str) -> np.datetime64:
+    """
+    :param datetimestr: YYYYMMDDHHMM, e.g. validity time
+    :return:
+    """
+    return np.datetime64("{}-{}-{}T{}:{}".format(
+        datetimestr[:4], datetimestr[4:6], datetimestr[6:8],
+        datetimestr[8:10], datetimestr[10:12]), "m")
+
+
+def stack(
+        entries: list[tuple],
+        lats: np.ndarray,
+        lons: np.ndarray,
+        coordinates: np.ndarray
+) -> dict[str, tuple[str, np.ndarray, np.ndarray]]:
+    """
+    interpolate the level stack of all parameters of a single step at once
+    :param entries: (shortName, unit, level, values of the grid cell, ...) per
+    message of the step
+    :param lats: latitudes of the grid cell
+    :param lons: longitudes of the grid cell
+    :param coordinates: latitude, longitude of the location
+    :return: shortName: (unit, levels, values) in descending pressure
+    """
+    from scipy.interpolate import RegularGridInterpolator
+    values = RegularGridInterpolator(
+        (lats[:, 0], lons[0, :]),
+        np.stack([i[3] for i in entries], axis=-1),
+        method='linear'
+    )(coordinates)[0]
+    names = np.array([i[0] for i in entries])
+    levels = np.array([i[2] for i in entries], dtype=np.float64)
+    result = dict()
+    for name, unit in dict((i[0], i[1]) for i in entries).items():
+        mask = names == name
+        order = np.argsort(-levels[mask], kind="stable")
+        result[name] = (unit, levels[mask][order], values[mask][order])
+
+    return result
+
+
+def fill(
+        profile: dict[str, ProfileSeries],
+        index: int,
+        time: str,
+        step: dict[str, tuple[str, np.ndarray, np.ndarray]],
+        size: int
+) -> None:
+    """
+    fill profile series in place at the index of the step, levels not known
+    from the first step of a parameter are disregarded
+    :param profile: shortName: series
+    :param index: index of the step
+    :param time: validity time YYYYMMDDHHMM
+    :param step: see stack()
+    :param size: number of steps
+    :return:
+    """
+    for name, (unit, levels, values) in step.items():
+        if name not in profile:
+            profile[name] = ProfileSeries(unit=unit, levels=levels, size=size)
+        series = profile[name]
+        rows = np.searchsorted(-series.levels, -levels)
+        known = rows < len(series.levels)
+        known[known] = series.levels[rows[known]] == levels[known]
+        series.value[rows[known], index] = values[known]
+        series.time[index] = to_datetime64(time)
+
+
+def specific_humidity(
+        r: np.ndarray,
+        t: np.ndarray,
+        p: np.ndarray
+) -> np.ndarray:
+    """
+    Magnus formula over water (Alduchov and Eskridge, 1996)
+    :param r: relative humidity [%]
+    :param t: temperature [K]
+    :param p: pressure [hPa]
+    :return: specific humidity [kg kg**-1]
+    """
+    e = r / 100. * 6.1094 * np.exp(17.625 * (t - 273.15) / (t - 30.11))
+    return 0.622 * e / (p - 0.378 * e)
+
+
+def pwv(
+        profile: dict[str, ProfileSeries],
+        altitude: float
+) -> dict | None:
+    """
+    precipitable water vapour above the altitude, i.e. specific humidity
+    integrated over pressure (trapezoidal) from the pressure at the altitude,
+    interpolated linearly in log pressure over geopotential height, to the
+    top level. All steps at once.
+    :param profile: shortName: series, "gh" and "q" or "r" and "t" required
+    :param altitude: altitude of the site [m]
+    :return: format of forecast.json, None if the profiles are insufficient
+    """
+    humidity = ["q"] if "q" in profile else ["r", "t"]
+    if not all(i in profile for i in ["gh"] + humidity):
+        return None
+    levels = profile['gh'].levels
+    for name in humidity:
+        levels = np.intersect1d(levels, profile[name].levels)[::-1]
+    if len(levels) < 2:
+        return None
+
+    def select(name): return profile[name].value[
+        np.isin(profile[name].levels, levels)].astype(np.float64)
+
+    gh = select("gh")
+    p = levels * 100.  # [Pa]
+    q = select("q") if "q" in profile \
+        else specific_humidity(r=select("r"), t=select("t"), p=levels[:, None])
+    cols = np.arange(gh.shape[1])
+    above = gh >= altitude
+    k = np.argmax(above, axis=0)  # first level above the site
+    below = np.maximum(k - 1, 0)
+    f = np.where(k > 0, (altitude - gh[below, cols])
+                 / (gh[k, cols] - gh[below, cols]), 0.)
+    p_site = np.exp(np.log(p[below]) + f * (np.log(p[k]) - np.log(p[below])))
+    q_site = q[below, cols] + f * (q[k, cols] - q[below, cols])
+    # layers between consecutive levels above the site plus the partial layer
+    layers = -np.diff(p)[:, None] * (q[:-1] + q[1:]) / 2.
+    layers[np.arange(len(p) - 1)[:, None] < k] = 0.
+    total = (layers.sum(axis=0)
+             + (p_site - p[k]) * (q_site + q[k, cols]) / 2.) / G
+    total[~above.any(axis=0)] = np.nan  # site above the top level
+
+    time = profile['gh'].time
+    filled = ~np.isnat(time) & ~np.isnan(total)
+    return {
+        "unit": "kg m**-2",
+        "time": [i.replace("-", "").replace("T", "").replace(":", "")
+                 for i in np.datetime_as_string(time[filled], unit="m")],
+        "value": [float("{:.7g}".format(i)) for i in total[filled]]
+    }
+
+
+def save(
+        profile: dict[str, ProfileSeries],
+        directory: str,
+        datetimestr: str
+) -> str:
+    """
+    level x time arrays of the forecast run
+    :param profile: shortName: series
+    :param directory: location of the profile files
+    :param datetimestr: YYYYMMDDHHMM of the forecast run
+    :return: profile file
+    """
+    os.makedirs(directory, exist_ok=True)
+    arrays = dict()
+    for name, series in profile.items():
+        arrays[name + ".unit"] = np.array(series.unit)
+        arrays[name + ".level"] = series.levels
+        arrays[name + ".time"] = series.time
+        arrays[name + ".value"] = series.value
+    target = "{}/{}.npz".format(directory, datetimestr)
+    np.savez_compressed(target, **arrays)
+    os.chmod(target, 0o666)  # docker owner is root, anyone can delete
+    print("Profile '{}': {}".format(os.path.basename(target),
+                                    ", ".join(sorted(profile))))
+
+    return target
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+
+"""
+Observing windows and severe-weather alerts of the forecasts in forecast.json.
+Rules combine conditions on forecast parameters, e.g. PWV < 0.5 mm for at
+least 3 hrs, or 10 m wind speed > 15 m/s. Each forecast run is evaluated by a
+vectorized run-length detection over its validity times, the windows found are
+stored in an index, hence the next window is looked up without reading
+forecast.json. Only forecast runs new or changed since their evaluation, e.g.
+written step by step or backfilled, are processed.
+
+Rules: tools/data/alerts.json, index: tools/data/windows.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+from datetime import datetime, timezone
+# internal
+from forecast_aux import PROVIDERS, DATA_DIR, read_forecast
+from forecast_resample import to_epoch, to_datetimestr
+
+ALERT_DIR = "{}/tools/data".format(DATA_DIR)
+CONFIG_FILE = "{}/alerts.json".format(ALERT_DIR)
+INDEX_FILE = "{}/windows.json".format(ALERT_DIR)
+OPERATORS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal
+}
+
+
+def run_lengths(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    consecutive runs of True without a Python loop
+    :param mask: condition per validity time
+    :return: index of the first and past the last element of each run
+    """
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def fingerprint(forecast: dict) -> str:
+    """
+    :param forecast: parameters of the forecast run
+    :return: number of validity times over all parameters and the last one,
+    changed by each step written
+    """
+    times = [i for entry in forecast.values() for i in entry['time']]
+
+    return "{}:{}".format(len(times), max(times) if times else "")
+
+
+def lookup(
+        forecast: dict,
+        names: str | list[str]
+) -> dict | None:
+    """
+    :param forecast: parameters of the forecast run
+    :param names: name or names in order of preference, a name matches a key
+    with suffixes, e.g. ":heightAboveSea:instant:5050"
+    :return: series of the first name found
+    """
+    for name in [names] if isinstance(names, str) else names or list():
+        for key, series in forecast.items():
+            if (key == name or key.startswith(name + ":")) and series:
+                return series
+
+    return None
+
+
+def evaluate(
+        rule: dict,
+        provider: str,
+        forecast: dict
+) -> list[list] | None:
+    """
+    windows of a single forecast run, in which all conditions of the rule are
+    met at the validity times common to their parameters
+    :param rule: see alerts.json
+    :param provider: weather forecast provider ECMWF | GFS | GFS-DOWNSIZED
+    :param forecast: parameters of the forecast run
+    :return: [start, end, hours] per window, start and end are the first and
+    last validity time YYYYMMDDHHMM, None if a parameter is missing
+    """
+    times, masks = None, list()
+    for condition in rule['conditions']:
+        series = lookup(forecast=forecast,
+                        names=condition['parameter'].get(provider))
+        if not series:
+            return None
+        t = to_epoch(series['time'])
+        value = np.asarray(series['value'], dtype=np.float64) \
+            * condition.get('scale', 1.) + condition.get('offset', 0.)
+        order = np.argsort(t)
+        masks.append((t[order], OPERATORS[condition['operator']](
+            value[order], condition['threshold'])))
+        times = t[order] if times is None else np.intersect1d(times, t)
+    mask = np.ones(len(times), dtype=bool)
+    for t, m in masks:
+        mask &= m[np.searchsorted(t, times)]
+
+    starts, ends = run_lengths(mask)
+    hours = (times[ends - 1] - times[starts]) / 3600.
+    keep = hours >= rule.get('hours', 0.)
+
+    return [[to_datetimestr(times[s]), to_datetimestr(times[e - 1]),
+             float(h)] for s, e, h in zip(starts[keep], ends[keep],
+                                          hours[keep])]
+
+
+def update(
+        providers: list[str],
+        rebuild: bool = False,
+        runs: list[str] = None
+) -> dict:
+    """
+    evaluate all rules over the forecast runs new or changed since their
+    evaluation, runs no longer in forecast.json are dropped from the index
+    :param providers: weather forecast providers
+    :param rebuild: evaluate all runs again, e.g. after a change of the rules
+    :param runs: YYYYMMDDHHMM evaluated again in any case, e.g. of an event
+    :return: index
+    """
+    with open(CONFIG_FILE, "r") as config_handle:
+        config = json.load(config_handle)
+    index = json.load(open(INDEX_FILE, "r")) \
+        if os.path.exists(INDEX_FILE) and not rebuild \
+        else {"runs": {}, "windows": {}}
+
+    for provider in providers:
+        try:
+            forecast = read_forecast(provider=provider)
+        except FileNotFoundError:
+            print("No forecast.json for provider {}. Skipping ...".format(
+                provider))
+            continue
+        # run: fingerprint when evaluated, a list of runs of a former index
+        # is evaluated again
+        known = index['runs'].get(provider, dict())
+        if not isinstance(known, dict):
+            known = dict()
+        prints = {i: fingerprint(forecast[i]) for i in forecast}
+        new = sorted(i for i in forecast if known.get(i) != prints[i]
+                     or i in (runs or list()))
+        for rule in config['rules']:
+            windows = index['windows'].setdefault(rule['name'], {}) \
+                .setdefault(provider, {})
+            for issue_date in list(windows):
+                if issue_date not in forecast:
+                    del windows[issue_date]
+            for issue_date in new:
+                result = evaluate(rule=rule,
+                                  provider=provider,
+                                  forecast=forecast[issue_date])
+                if result is not None:
+                    windows[issue_date] = result
+                else:
+                    windows.pop(issue_date, None)
+        index['runs'][provider] = prints
+        if new:
+            print("Provider {}: {} run(s) evaluated".format(provider,
+                                                            len(new)))
+
+    os.makedirs(ALERT_DIR, exist_ok=True)
+    with open(INDEX_FILE, "w") as index_handle:
+        json.dump(index, index_handle, indent=2, sort_keys=True)
+
+    return index
+
+
+def next_window(
+        index: dict,
+        rule: str,
+        now: str = None,
+        providers: list[str] = None
+) -> dict | None:
+    """
+    earliest window of the rule not yet over, from the latest forecast run of
+    each provider
+    :param index: see update()
+    :param rule: name of the rule
+    :param now: YYYYMMDDHHMM, default=current time
+    :param providers: weather forecast providers, default=all
+    :return: provider, run, start, end, hours, None if there is none
+    """
+    now = now or datetime.now(timezone.utc).strftime("%Y%m%d%H%M")
+    found = None
+    for provider, runs in index['windows'].get(rule, dict()).items():
+        if (providers and provider not in providers) or not runs:
+            continue
+        issue_date = max(runs)
+        # windows in chronological order
+        for start, end, hours in runs[issue_date]:
+            if end < now:
+                continue
+            if found is None or start < found['start']:
+                found = {"provider": provider, "run": issue_date,
+                         "start": start, "end": end, "hours": hours}
+            break
+
+    return found
+
+
+def report(
+        index: dict,
+        providers: list[str],
+        now: str = None
+) -> None:
+    """
+    next window of each rule
+    :param index: see update()
+    :param providers: weather forecast providers
+    :param now: YYYYMMDDHHMM, default=current time
+    :return:
+    """
+    with open(CONFIG_FILE, "r") as config_handle:
+        rules = json.load(config_handle)['rules']
+    for rule in rules:
+        window = next_window(index=index,
+                             rule=rule['name'],
+                             now=now,
+                             providers=providers)
+        label = "ALERT" if rule.get('type') == "alert" else "Window"
+        if window is None:
+            print("{} '{}': none".format(label, rule['name']))
+            continue
+        print("{} '{}': {start} - {end} ({hours:.1f} h), {provider} run "
+              "{run}".format(label, rule['name'], **window))
+
+
+def main(
+        providers: list[str] = None,
+        rebuild: bool = False,
+        subscribe: bool = False,
+        now: str = None
+) -> None:
+    """
+    evaluate new forecast runs and print the next window of each rule, on
+    each "run ready" event if subscribed
+    :param providers: weather forecast providers, default=all
+    :param rebuild: evaluate all runs again
+    :param subscribe: wait for new forecast runs, see forecast_subscribe
+    :param now: YYYYMMDDHHMM, default=current time
+    :return:
+    """
+    providers = providers or list(PROVIDERS)
+    report(index=update(providers=providers, rebuild=rebuild),
+           providers=providers,
+           now=now)
+    if subscribe:
+        from forecast_subscribe import Subscriber
+        with Subscriber(providers=providers, name="alert") as subscriber:
+            try:
+                for event in subscriber.events():
+                    print("\n{provider} run {run} ready".format(**event))
+                    report(index=update(providers=[event['provider']],
+                                        runs=[event['run']]),
+                           providers=providers,
+                           now=now)
+            except KeyboardInterrupt:
+                pass
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Observing windows and severe-weather alerts of "
+                    "downloaded weather forecasts from ECMWF or GFS.")
+    parser.add_argument(
+        '-p',
+        '--provider',
+        type=str,
+        nargs="+",
+        choices=PROVIDERS,
+        help="Select forecast provider(s), default=all"
+    )
+    parser.add_argument(
+        '-r',
+        '--rebuild',
+        action="store_true",
+        help="Evaluate all forecast runs again, e.g. after a change of rules"
+    )
+    parser.add_argument(
+        '-s',
+        '--subscribe',
+        action="store_true",
+        help="Evaluate each new forecast run as soon as it is ready"
+    )
+    parser.add_argument(
+        '-n',
+        '--now',
+        type=str,
+        help="Reference time (YYYYMMDDHHMM), default=current time"
+    )
+
+    main(
+        providers=parser.parse_args().provider,
+        rebuild=parser.parse_args().rebuild,
+        subscribe=parser.parse_args().subscribe,
+        now=parser.parse_args().now
+    )
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+"""
+Read-only HTTP query API over the forecast.json files of ECMWF and GFS. Answers
+from an in-memory index that is reloaded, if the modification time of a
+forecast.json changes. Endpoints:
+
+/runs?provider=
+/latest?provider=
+/series?provider=&param=&from=&to=&run=&format=[json|binary]
+
+Series are returned as compact JSON or binary, i.e. little-endian int64 epoch
+seconds followed by float32 values with the number of entries in header
+"X-Count". "from" and "to" are datetime strings (YYYYMMDDHH[MM]).
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import threading
+from array import array
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+# internal
+from forecast_aux import PROVIDERS, provider_log_file
+
+HOST = "127.0.0.1"
+PORT = 8080
+
+
+class _Index(object):
+    """
+    forecast.json per provider held in memory, reloaded on change of mtime
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = dict()
+
+    def get(self, provider: str) -> dict:
+        """
+        current index of the provider
+        :param provider: weather forecast provider ECMWF | GFS | GFS-DOWNSIZED
+        :return: dict with keys version, runs, and data
+        """
+        log_file = provider_log_file(provider=provider)
+        stat = os.stat(log_file)  # raises FileNotFoundError
+        version = "{}-{}".format(stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            entry = self.entries.get(provider)
+            if entry is None or entry['version'] != version:
+                with open(log_file, "r") as jsonfile:
+                    data = json.load(jsonfile)
+                entry = {
+                    "version": version,
+                    "runs": sorted(data.keys()),
+                    "data": data
+                }
+                self.entries[provider] = entry
+                print("Index of provider {} (re)loaded".format(provider))
+
+        return entry
+
+
+INDEX = _Index()
+
+
+def epoch(datetimestr: str) -> int:
+    """
+    :param datetimestr: format YYYYMMDDHHMM
+    :return: seconds since epoch
+    """
+    return int(datetime.strptime(datetimestr, '%Y%m%d%H%M')
+               .replace(tzinfo=timezone.utc).timestamp())
+
+
+def runs(index: dict, query: dict) -> tuple[dict, str]:
+    return {"runs": index['runs']}, "application/json"
+
+
+def latest(index: dict, query: dict) -> tuple[dict, str]:
+    if not index['runs']:
+        raise LookupError("No forecast run available")
+    run = index['runs'][-1]
+
+    return {
+        "run": run,
+        "parameter": {
+            item: {
+                "unit": values['unit'],
+                "entries": len(values['time']),
+                # null for an empty series
+                "from": values['time'][0] if values['time'] else None,
+                "to": values['time'][-1] if values['time'] else None
+            }
+            for item, values in index['data'][run].items()
+        }
+    }, "application/json"
+
+
+def series(index: dict, query: dict) -> tuple[dict | bytes, str]:
+    run = query.get('run', index['runs'][-1] if index['runs'] else None)
+    param = query.get('param')
+    if not param:
+        raise ValueError("Query parameter 'param' is mandatory")
+    try:
+        values = index['data'][run][param]
+    except KeyError:
+        raise LookupError("Forecast run {} or parameter '{}' not found"
+                          .format(run, param))
+    # pad, such that YYYYMMDDHH covers the entire hour
+    lower = query.get('from', "").ljust(12, "0")
+    upper = query.get('to', "").ljust(12, "9")
+    selected = [(t, v) for t, v in zip(values['time'], values['value'])
+                if lower <= t <= upper]
+
+    if query.get('format', "json") == "binary":
+        times = array('q', (epoch(t) for t, _ in selected))
+        # null of forecast.json as NaN, anything else not a number is a
+        # corrupt forecast.json
+        value = array('f', (float("nan") if v is None else v
+                            for _, v in selected))
+        if sys.byteorder == "big":
+            times.byteswap()
+            value.byteswap()
+        return times.tobytes() + value.tobytes(), "application/octet-stream"
+
+    return {
+        "run": run,
+        "param": param,
+        "unit": values['unit'],
+        "time": [t for t, _ in selected],
+        "value": [v for _, v in selected]
+    }, "application/json"
+
+
+ENDPOINTS = {
+    "/runs": runs,
+    "/latest": latest,
+    "/series": series
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    GET requests on ENDPOINTS, anything else is rejected
+    """
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        endpoint = ENDPOINTS.get(url.path)
+        if endpoint is None:
+            return self._error(HTTPStatus.NOT_FOUND, "Unknown endpoint")
+        provider = query.get('provider')
+        if provider not in PROVIDERS:
+            return self._error(HTTPStatus.BAD_REQUEST,
+                               "Query parameter 'provider' must be one of {}"
+                               .format(list(PROVIDERS)))
+        try:
+            index = INDEX.get(provider=provider)
+        except FileNotFoundError:
+            return self._error(HTTPStatus.NOT_FOUND,
+                               "No forecast.json for provider {}"
+                               .format(provider))
+
+        # response is determined by the version of forecast.json and query
+        etag = '"{}"'.format(hashlib.sha1("{}|{}".format(
+            index['version'], self.path).encode("utf-8")).hexdigest())
+        # list of entity tags or *, weak ones compared as strong ones
+        tags = [i.strip().removeprefix("W/")
+                for i in self.headers.get("If-None-Match", "").split(",")]
+        if etag in tags or "*" in tags:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        try:
+            result, content_type = endpoint(index, query)
+        except ValueError as e:
+            return self._error(HTTPStatus.BAD_REQUEST, str(e))
+        except LookupError as e:
+            return self._error(HTTPStatus.NOT_FOUND, str(e))
+        except (TypeError, OverflowError) as e:  # e.g. value not a number
+            return self._error(HTTPStatus.INTERNAL_SERVER_ERROR,
+                               "Forecast series not encodable: {}".format(e))
+
+        if isinstance(result, bytes):
+            body = result
+            # int64 + float32 per entry
+            count = len(body) // 12
+        else:
+            body = json.dumps(result, separators=(",", ":")).encode("utf-8")
+            count = None
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        if count is not None:
+            self.send_header("X-Count", str(count))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(
+            self,
+            status: HTTPStatus,
+            message: str
+    ) -> None:
+        body = json.dumps({"error": message}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main(
+        host: str = HOST,
+        port: int = PORT
+) -> None:
+    """
+    serve until interrupted
+    :param host: interface to bind to
+    :param port: port to listen on
+    :return:
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    print("Serving forecasts on http://{}:{}".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Read-only HTTP API over downloaded weather forecasts from "
+                    "ECMWF or GFS.")
+    parser.add_argument(
+        '-H',
+        '--host',
+        type=str,
+        default=HOST,
+        help="Interface to bind to, default={}".format(HOST)
+    )
+    parser.add_argument(
+        '-P',
+        '--port',
+        type=int,
+        default=PORT,
+        help="Port to listen on, default={}".format(PORT)
+    )
+
+    main(
+        host=parser.parse_args().host,
+        port=parser.parse_args().port
+    )
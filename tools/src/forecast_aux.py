@@ -0,0 +1,38 @@
+import os
+import json
+
+# data directory relative to source
+DATA_DIR = "{}/../../".format(os.path.dirname(os.path.realpath(__file__)))
+# provider and its application directory
+PROVIDERS = {
+    "ECMWF": "ecmwf-opendata",
+    "GFS": "gfs",
+    "GFS-DOWNSIZED": "gfs-downsized"
+}
+
+
+def provider_log_file(provider: str) -> str:
+    """
+    location of forecast.json of the provider
+    :param provider: weather forecast provider ECMWF | GFS | GFS-DOWNSIZED
+    :return:
+    """
+    if provider not in PROVIDERS:
+        raise NotImplementedError("Wrong provider!")
+
+    return "{}/{}/data/forecast.json".format(DATA_DIR, PROVIDERS[provider])
+
+
+def read_forecast(provider: str) -> dict:
+    """
+    read forecast.json of the provider
+    :param provider: weather forecast provider ECMWF | GFS | GFS-DOWNSIZED
+    :return:
+    """
+    log_file = provider_log_file(provider=provider)
+    if not os.path.exists(log_file):
+        raise FileNotFoundError(log_file)
+    with open(log_file, "r") as jsonfile:
+        res = json.load(jsonfile)
+
+    return res
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+"""
+Headless batch rendering of the forecast plots (parameters and windrose) of the
+most recent forecast runs in forecast.json, e.g. for a web status page. Figures
+are rendered across a process pool, unchanged figures are never re-rendered.
+"""
+
+import matplotlib
+matplotlib.use("Agg")  # headless, prior to any import of pyplot
+
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+import matplotlib.pyplot as plt
+from datetime import datetime
+from multiprocessing import Pool
+# internal
+from forecast_aux import PROVIDERS, provider_log_file
+from forecast_viewer import read_log
+from forecast_windrose import (provider_settings, wind, create_bars,
+                               colormaps, COLOR_MAP, V_MAX, TITLE)
+
+PLOT_DIR = "{}/../plots".format(os.path.dirname(os.path.realpath(__file__)))
+CACHE_FILE = "{}/batch_cache.json".format(PLOT_DIR)
+
+
+def slug(name: str) -> str:
+    """
+    file name compliant version of a parameter name
+    :param name: e.g. "10 metre U wind component"
+    :return: e.g. "10_metre_U_wind_component"
+    """
+    return re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+
+
+def task_hash(task: dict) -> str:
+    """
+    hash of run id(s) and parameter (incl. values) of a task
+    :param task:
+    :return: hex digest
+    """
+    return hashlib.sha256(
+        json.dumps(task, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def create_tasks(
+        provider: str,
+        runs: int = 1
+) -> list[dict]:
+    """
+    one task per figure, i.e. per parameter and the windrose, if available
+    :param provider: weather forecast provider ECMWF | GFS | GFS-DOWNSIZED
+    :param runs: number of most recent forecast runs plotted
+    :return:
+    """
+    tasks = list()
+    dict_x = read_log(log_file=provider_log_file(provider=provider))
+    issue_dates = sorted(dict_x.keys())[-runs:]
+
+    parameters = sorted({item for issue_date in issue_dates
+                         for item in dict_x[issue_date].keys()})
+    for item in parameters:
+        tasks.append({
+            "kind": "parameter",
+            "title": item,
+            "unit": next(dict_x[i][item]['unit'] for i in issue_dates
+                         if item in dict_x[i]),
+            "series": {i: [dict_x[i][item]['time'],
+                           dict_x[i][item]['value']]
+                       for i in issue_dates if item in dict_x[i]},
+            "target": "{}/{}_{}.png".format(PLOT_DIR, slug(provider),
+                                            slug(item))
+        })
+
+    try:
+        _, parameter_file, u_key, v_key = provider_settings(provider)
+        forecast = dict_x[issue_dates[-1]]
+        tasks.append({
+            "kind": "windrose",
+            "title": TITLE.format(
+                provider,
+                read_log(log_file=parameter_file)["geo_coordinates"]["location"]
+            ),
+            "issue_date": issue_dates[-1],
+            "time": forecast[u_key]['time'],
+            "u": forecast[u_key]['value'],
+            "v": forecast[v_key]['value'],
+            "target": "{}/{}_windrose.png".format(PLOT_DIR, slug(provider))
+        })
+    except (NotImplementedError, FileNotFoundError, KeyError, IndexError):
+        print("No windrose for provider {}".format(provider))
+
+    return tasks
+
+
+def render(task: dict) -> str:
+    """
+    render a single figure, executed in a worker process
+    :param task: see create_tasks
+    :return: target file
+    """
+    if task['kind'] == "windrose":
+        v_abs, v_dir = wind(u=task['u'], v=task['v'])
+        fig = plt.figure(figsize=(8, 8))
+        ax = plt.subplot(projection='polar')
+        ax.set_rlim(0, np.ceil(V_MAX + 0.5))
+        fig.suptitle(task['title'])
+        ax.set_title("Issue Date: {}, {} - {}".format(
+            task['issue_date'][:-2],
+            datetime.strptime(task['time'][0], '%Y%m%d%H%M'),
+            datetime.strptime(task['time'][-1], '%Y%m%d%H%M')))
+        create_bars(ax=ax,
+                    v_dir=v_dir,
+                    v_abs=v_abs,
+                    colors=colormaps[COLOR_MAP](v_abs / V_MAX))
+    else:
+        fig, ax = plt.subplots(figsize=(10, 6))
+        for issue_date, (time, value) in task['series'].items():
+            ax.plot(
+                [datetime.strptime(i, '%Y%m%d%H%M') for i in time],
+                value,
+                label=issue_date[:-2])
+        ax.set_title(task['title'])
+        ax.set_ylabel(task['unit'])
+        ax.set_xlabel("Time")
+        ax.legend(loc='upper left', bbox_to_anchor=(1, 1))
+    fig.savefig(task['target'], bbox_inches="tight")
+    plt.close(fig)
+
+    return task['target']
+
+
+def main(
+        providers: list[str],
+        runs: int = 1,
+        processes: int = None,
+        force: bool = False
+) -> None:
+    """
+    render all figures of the most recent forecast run(s) not rendered before
+    :param providers: weather forecast providers ECMWF | GFS | GFS-DOWNSIZED
+    :param runs: number of most recent forecast runs plotted
+    :param processes: size of the process pool, default=number of CPUs
+    :param force: re-render regardless of the cache, if True
+    :return:
+    """
+    tasks = list()
+    for provider in providers:
+        try:
+            tasks.extend(create_tasks(provider=provider, runs=runs))
+        except FileNotFoundError:
+            print("No forecast.json for provider {}. Skipping ...".format(
+                provider))
+
+    cache = read_log(log_file=CACHE_FILE) \
+        if os.path.exists(CACHE_FILE) else dict()
+    todo = list()
+    for task in tasks:
+        digest = task_hash(task)
+        name = os.path.basename(task['target'])
+        if (not force and cache.get(name) == digest
+                and os.path.exists(task['target'])):
+            print("Unchanged: {}".format(name))
+            continue
+        cache[name] = digest
+        todo.append(task)
+
+    with Pool(processes=processes) as pool:
+        for target in pool.imap_unordered(render, todo):
+            print("Rendered: {}".format(os.path.basename(target)))
+
+    with open(CACHE_FILE, "w") as cache_handle:
+        json.dump(cache, cache_handle, indent=2, sort_keys=True)
+
+    print("{} figure(s) rendered, {} unchanged".format(
+        len(todo), len(tasks) - len(todo)))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Renders plots of downloaded weather forecasts from ECMWF "
+                    "or GFS into tools/plots.")
+    parser.add_argument(
+        '-p',
+        '--provider',
+        type=str,
+        nargs="+",
+        default=list(PROVIDERS),
+        choices=PROVIDERS,
+        help="Select forecast provider(s), default=all"
+    )
+    parser.add_argument(
+        '-n',
+        '--runs',
+        type=int,
+        default=1,
+        help="Number of most recent forecast runs plotted, default=1"
+    )
+    parser.add_argument(
+        '-j',
+        '--processes',
+        type=int,
+        help="Number of worker processes, default=number of CPUs"
+    )
+    parser.add_argument(
+        '-f',
+        '--force',
+        action="store_true",
+        help="Re-render all figures regardless of the cache, default=No"
+    )
+
+    main(
+        providers=parser.parse_args().provider,
+        runs=parser.parse_args().runs,
+        processes=parser.parse_args().processes,
+        force=parser.parse_args().force
+    )
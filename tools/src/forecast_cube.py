@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""
+Reader of the regional cubes of ECMWF, GFS, and GFS-DOWNSIZED, i.e. a box
+around the location per parameter and step (option "cube" in parameter.json
+of the provider). The cube file is memory-mapped, a time slice decompresses
+its own chunk only. For the layout see ecmwf_cube of ecmwf-opendata.
+"""
+
+import os
+import sys
+import mmap
+import json
+import zlib
+import argparse
+import numpy as np
+# internal
+from forecast_aux import PROVIDERS, DATA_DIR
+
+MAGIC = b"FCCUBE01"
+
+
+def cube_dir(provider: str) -> str:
+    """
+    location of the cube files of the provider
+    :param provider: weather forecast provider ECMWF | GFS | GFS-DOWNSIZED
+    :return:
+    """
+    if provider not in PROVIDERS:
+        raise NotImplementedError("Wrong provider!")
+
+    return "{}/{}/data/cube".format(DATA_DIR, PROVIDERS[provider])
+
+
+def cube_runs(provider: str) -> list[str]:
+    """
+    :param provider: weather forecast provider ECMWF | GFS | GFS-DOWNSIZED
+    :return: sorted forecast runs with a cube file, format YYYYMMDDHHMM
+    """
+    directory = cube_dir(provider=provider)
+    if not os.path.isdir(directory):
+        return list()
+
+    return sorted(i[:-5] for i in os.listdir(directory) if i.endswith(".cube"))
+
+
+class Cube(object):
+    """
+    memory-mapped cube file of a single forecast run
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: cube file
+        """
+        self.path = path
+        self.handle = open(path, "rb")
+        self.map = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError("Not a complete cube file: {}".format(path))
+        end = len(self.map) - len(MAGIC) - 8
+        length = int.from_bytes(self.map[end:end + 8], "little")
+        self.index = json.loads(self.map[end - length:end])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.map.close()
+        self.handle.close()
+
+    @property
+    def params(self) -> list[str]:
+        return sorted(self.index['params'])
+
+    @property
+    def size(self) -> int:
+        return self.index['size']
+
+    def grid(self, param: str) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :param param: name of the parameter
+        :return: latitudes, longitudes of the box
+        """
+        entry = self.index['params'][param]
+        return np.array(entry['lats']), np.array(entry['lons'])
+
+    def times(self, param: str) -> list[str]:
+        """
+        :param param: name of the parameter
+        :return: validity time per step, YYYYMMDDHHMM or None, if missing
+        """
+        return self.index['params'][param]['time']
+
+    def time_slice(
+            self,
+            param: str,
+            index: int
+    ) -> np.ndarray:
+        """
+        decompress the chunk of a single step
+        :param param: name of the parameter
+        :param index: index of the step
+        :return: lat x lon, NaN if the step is missing
+        """
+        entry = self.index['params'][param]
+        shape = (len(entry['lats']), len(entry['lons']))
+        chunk = entry['chunks'][index]
+        if chunk is None:
+            return np.full(shape, np.nan, dtype=np.float32)
+        offset, length = chunk
+        data = np.frombuffer(zlib.decompress(self.map[offset:offset + length]),
+                             dtype=np.uint8)
+        if self.index.get('shuffle'):
+            data = data.reshape(4, -1).T
+        return np.frombuffer(data.tobytes(), dtype="<f4").reshape(shape)
+
+    def series(self, param: str) -> np.ndarray:
+        """
+        :param param: name of the parameter
+        :return: step x lat x lon
+        """
+        return np.stack([self.time_slice(param=param, index=i)
+                         for i in range(self.size)])
+
+
+def main(
+        provider: str,
+        run: str = None,
+        param: str = None,
+        index: int = None
+) -> None:
+    """
+    list the parameters of a cube, or print a time slice
+    :param provider: weather forecast provider ECMWF | GFS | GFS-DOWNSIZED
+    :param run: forecast run YYYYMMDDHHMM, default=latest
+    :param param: name of the parameter
+    :param index: index of the step
+    :return:
+    """
+    runs = cube_runs(provider=provider)
+    if not runs or (run and run not in runs):
+        print("No cube found for provider {}".format(provider))
+        sys.exit(1)
+    run = run or runs[-1]
+    with Cube("{}/{}.cube".format(cube_dir(provider=provider), run)) as cube:
+        if not param:
+            for item in cube.params:
+                lats, lons = cube.grid(param=item)
+                print("{} [{}]: {} steps, {} x {} grid points".format(
+                    item, cube.index['params'][item]['unit'],
+                    sum(i is not None for i in cube.times(param=item)),
+                    len(lats), len(lons)))
+        else:
+            lats, lons = cube.grid(param=param)
+            if index is None:
+                values = cube.series(param=param)
+                print("Run {}, {}: min {:.4g}, mean {:.4g}, max {:.4g}".format(
+                    run, param, np.nanmin(values), np.nanmean(values),
+                    np.nanmax(values)))
+            else:
+                print("Run {}, {}, valid {}\nlat/lon {}".format(
+                    run, param, cube.times(param=param)[index],
+                    " ".join("{:8.2f}".format(i) for i in lons)))
+                for lat, row in zip(lats, cube.time_slice(param=param,
+                                                          index=index)):
+                    print("{:7.2f} {}".format(
+                        lat, " ".join("{:8.4g}".format(i) for i in row)))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Reads the regional cubes of weather forecasts from ECMWF "
+                    "or GFS.")
+    parser.add_argument(
+        '-p',
+        '--provider',
+        type=str,
+        required=True,
+        choices=PROVIDERS,
+        help="Select forecast provider (mandatory)"
+    )
+    parser.add_argument(
+        '-r',
+        '--run',
+        type=str,
+        help="Forecast run (YYYYMMDDHHMM), default=latest"
+    )
+    parser.add_argument(
+        '-s',
+        '--parameter',
+        type=str,
+        help="Parameter, default=list all parameters"
+    )
+    parser.add_argument(
+        '-i',
+        '--index',
+        type=int,
+        help="Index of the step, default=summary of all steps"
+    )
+
+    main(
+        provider=parser.parse_args().provider,
+        run=parser.parse_args().run,
+        param=parser.parse_args().parameter,
+        index=parser.parse_args().index
+    )
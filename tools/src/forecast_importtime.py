@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""
+Guard of the start-up latency of the entry points of all applications: each
+entry point is imported in a fresh interpreter with "-X importtime", its
+cumulative import time is checked against a budget, and heavy modules must
+not be loaded on import, but on the code paths that need them only.
+"""
+
+import sys
+import subprocess
+import argparse
+# internal
+from forecast_aux import DATA_DIR
+
+# application directory: entry point, heavy modules permitted on import
+ENTRY_POINTS = {
+    "ecmwf-opendata": ("ecmwf_download", []),
+    "gfs": ("gfs_download", []),
+    "gfs-downsized": ("gfs_fc_engine", []),
+    "forecast-daemon": ("forecast_daemon", ["requests"])
+}
+HEAVY = ["pygrib", "scipy", "bs4", "requests", "multiurl", "ecmwf.opendata"]
+BUDGET = 300.  # cumulative import time per entry point [ms]
+
+
+def import_times(
+        directory: str,
+        module: str
+) -> dict[str, float]:
+    """
+    :param directory: application directory
+    :param module: entry point
+    :return: module: cumulative import time [ms] of all modules imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "import {}".format(module)],
+        cwd="{}/{}/src".format(DATA_DIR, directory),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode:
+        raise ImportError("{}: {}".format(module, result.stderr.strip()
+                                          .splitlines()[-1]))
+    times = dict()
+    # import time: self [us] | cumulative | imported package
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative) / 1000.
+
+    return times
+
+
+def main(
+        budget: float = BUDGET,
+        repeat: int = 3
+) -> None:
+    """
+    :param budget: cumulative import time per entry point [ms]
+    :param repeat: number of imports per entry point, the fastest counts
+    :return:
+    """
+    failures = 0
+    for directory, (module, permitted) in ENTRY_POINTS.items():
+        runs = [import_times(directory=directory, module=module)
+                for _ in range(repeat)]
+        fastest = min(i[module] for i in runs)
+        heavy = [i for i in HEAVY if i in runs[0] and i not in permitted]
+        passed = fastest <= budget and not heavy
+        failures += not passed
+        print("{:<16} {:>8.1f} ms {}{}".format(
+            module, fastest, "ok" if passed else "FAILED",
+            ", loads {}".format(", ".join(heavy)) if heavy else ""))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Checks the import time of the entry points of ECMWF, "
+                    "GFS, GFS-DOWNSIZED, and forecast-daemon.")
+    parser.add_argument(
+        '-b',
+        '--budget',
+        type=float,
+        default=BUDGET,
+        help="Cumulative import time per entry point [ms], default={}"
+        .format(BUDGET)
+    )
+    parser.add_argument(
+        '-n',
+        '--repeat',
+        type=int,
+        default=3,
+        help="Number of imports per entry point, the fastest counts, "
+             "default=3"
+    )
+
+    main(
+        budget=parser.parse_args().budget,
+        repeat=parser.parse_args().repeat
+    )
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+"""
+Resampling of forecast series of ECMWF, GFS, and GFS-DOWNSIZED onto a common
+time grid. GFS provides hourly steps up to 120 hrs and 3-hourly steps
+thereafter, ECMWF 3-hourly steps up to 144 hrs and 6-hourly thereafter.
+All series (providers times runs) are interpolated in a single vectorized
+operation into an aligned matrix, that is cached per (series, window) in
+tools/cache, a single file each, superseded ones are removed.
+"""
+
+import os
+import sys
+import hashlib
+import argparse
+import numpy as np
+from datetime import datetime, timezone
+# internal
+from forecast_aux import (PROVIDERS, DATA_DIR, provider_log_file,
+                          read_forecast)
+
+CACHE_DIR = "{}/tools/cache".format(DATA_DIR)
+INTERVAL = 3600  # default spacing of the time grid [s]
+
+# in-process cache of aligned matrices, key of the request: (version, result)
+_ALIGNED: dict = dict()
+
+
+def to_epoch(times: list[str]) -> np.ndarray:
+    """
+    convert datetime strings to seconds since epoch without a Python loop
+    :param times: format YYYYMMDDHHMM
+    :return: int64 array
+    """
+    a = np.asarray(times, dtype=np.int64)
+    dt = ((a // 10 ** 8 - 1970).astype('datetime64[Y]')
+          + (a // 10 ** 6 % 100 - 1).astype('timedelta64[M]'))
+    dt = (dt.astype('datetime64[D]')
+          + (a // 10 ** 4 % 100 - 1).astype('timedelta64[D]')
+          + (a // 100 % 100).astype('timedelta64[h]')
+          + (a % 100).astype('timedelta64[m]'))
+
+    return dt.astype('datetime64[s]').astype(np.int64)
+
+
+def to_datetimestr(seconds: int) -> str:
+    """
+    :param seconds: seconds since epoch
+    :return: format YYYYMMDDHHMM
+    """
+    return datetime.fromtimestamp(int(seconds), tz=timezone.utc) \
+        .strftime("%Y%m%d%H%M")
+
+
+def interpolate(
+        grid: np.ndarray,
+        series: list[tuple[np.ndarray, np.ndarray]]
+) -> np.ndarray:
+    """
+    interpolate ragged series onto a common grid in one np.interp call. Each
+    series is shifted by its index times an offset beyond the total time span,
+    such that the concatenation is monotonic.
+    :param grid: common time grid [s]
+    :param series: list of (times [s], values)
+    :return: matrix of shape (len(series), len(grid)), NaN outside each series
+    """
+    if not series:
+        return np.empty((0, len(grid)))
+    lengths = np.array([len(t) for t, _ in series])
+    times = np.concatenate([t for t, _ in series]).astype(np.float64)
+    values = np.concatenate([v for _, v in series]).astype(np.float64)
+    origin = min(times.min(), grid[0])
+    offset = max(times.max(), grid[-1]) - origin + 1.
+    index = np.repeat(np.arange(len(series)), lengths)
+    order = np.lexsort((times, index))  # sort times within each series
+    shifted = times[order] - origin + index[order] * offset
+    queries = (grid[np.newaxis, :] - origin
+               + np.arange(len(series))[:, np.newaxis] * offset)
+    matrix = np.interp(queries.ravel(), shifted, values[order]) \
+        .reshape(len(series), len(grid))
+    # no extrapolation beyond the first and last validity time of a series
+    ends = np.cumsum(lengths)
+    first = times[order][ends - lengths][:, np.newaxis]
+    last = times[order][ends - 1][:, np.newaxis]
+    matrix[(grid[np.newaxis, :] < first) | (grid[np.newaxis, :] > last)] = np.nan
+
+    return matrix
+
+
+def aligned(
+        selection: list[tuple[str, str]],
+        date_from: str = None,
+        date_to: str = None,
+        runs: int = None,
+        interval: int = INTERVAL
+) -> tuple[np.ndarray, list[str], np.ndarray]:
+    """
+    aligned matrix of all runs of the selected provider parameters on a common
+    time grid. Cached per selection and window, invalidated as soon as one of
+    the forecast.json files changes.
+    :param selection: list of (provider, parameter)
+    :param date_from: start of the window, format YYYYMMDDHH[MM]
+    :param date_to: end of the window, format YYYYMMDDHH[MM]
+    :param runs: consider the last number of runs per provider only
+    :param interval: spacing of the time grid [s]
+    :return: grid [s], labels "provider|parameter|run", matrix
+    """
+    providers = sorted({p for p, _ in selection})
+    versions = list()
+    for provider in providers:
+        stat = os.stat(provider_log_file(provider=provider))
+        versions.append((provider, stat.st_mtime_ns, stat.st_size))
+    # order of the selection is that of the labels
+    request = hashlib.sha1(repr((tuple(selection), date_from, date_to, runs,
+                                 interval)).encode("utf-8")).hexdigest()
+    version = hashlib.sha1(repr(versions).encode("utf-8")).hexdigest()
+    if request in _ALIGNED and _ALIGNED[request][0] == version:
+        return _ALIGNED[request][1]
+    cache_file = "{}/resample_{}_{}.npz".format(CACHE_DIR, request, version)
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as cached:
+            _ALIGNED[request] = (version, (cached['grid'],
+                                           cached['labels'].tolist(),
+                                           cached['matrix']))
+        return _ALIGNED[request][1]
+
+    labels = list()
+    series = list()
+    forecasts = {p: read_forecast(provider=p) for p in providers}
+    for provider, param in selection:
+        issue_dates = sorted(forecasts[provider].keys())
+        if runs:
+            issue_dates = issue_dates[-runs:]
+        for issue_date in issue_dates:
+            values = forecasts[provider][issue_date].get(param)
+            if not values or not values['time']:
+                continue
+            labels.append("{}|{}|{}".format(provider, param, issue_date))
+            series.append((to_epoch(values['time']),
+                           np.asarray(values['value'], dtype=np.float64)))
+    if not series:
+        raise LookupError("No forecast series found for {}".format(selection))
+
+    lower = to_epoch([date_from.ljust(12, "0")])[0] if date_from \
+        else min(t[0] for t, _ in series)
+    upper = to_epoch([date_to.ljust(12, "0")])[0] if date_to \
+        else max(t[-1] for t, _ in series)
+    # grid aligned to multiples of interval
+    grid = np.arange(lower - lower % interval, upper + 1, interval,
+                     dtype=np.int64)
+    matrix = interpolate(grid=grid, series=series)
+    # disregard runs without any value within the window
+    valid = ~np.all(np.isnan(matrix), axis=1)
+    labels = [label for label, v in zip(labels, valid) if v]
+    matrix = matrix[valid]
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    np.savez_compressed(cache_file,
+                        grid=grid,
+                        labels=np.array(labels),
+                        matrix=matrix)
+    prune(request=request, keep=os.path.basename(cache_file))
+    _ALIGNED[request] = (version, (grid, labels, matrix))
+
+    return _ALIGNED[request][1]
+
+
+def prune(
+        request: str,
+        keep: str
+) -> None:
+    """
+    remove the cache files of the request superseded by a change of a
+    forecast.json, and those of a single key of request and version, named
+    before
+    :param request: key of the request
+    :param keep: name of the current cache file
+    :return:
+    """
+    for name in os.listdir(CACHE_DIR):
+        if not (name.startswith("resample_") and name.endswith(".npz")) \
+                or name == keep:
+            continue
+        key = name[len("resample_"):-len(".npz")]
+        if key.startswith(request + "_") or "_" not in key:
+            os.remove("{}/{}".format(CACHE_DIR, name))
+
+
+def main(
+        selection: list[tuple[str, str]],
+        date_from: str = None,
+        date_to: str = None,
+        runs: int = None,
+        interval: int = INTERVAL
+) -> None:
+    """
+    print a summary of the aligned matrix
+    :param selection: list of (provider, parameter)
+    :param date_from: start of the window, format YYYYMMDDHH[MM]
+    :param date_to: end of the window, format YYYYMMDDHH[MM]
+    :param runs: consider the last number of runs per provider only
+    :param interval: spacing of the time grid [s]
+    :return:
+    """
+    grid, labels, matrix = aligned(selection=selection,
+                                   date_from=date_from,
+                                   date_to=date_to,
+                                   runs=runs,
+                                   interval=interval)
+    print("Time grid: {} - {}, {} entries every {} s".format(
+        to_datetimestr(grid[0]), to_datetimestr(grid[-1]), len(grid),
+        interval))
+    for label, row in zip(labels, matrix):
+        print("{}: {} values, mean {:.4g}".format(
+            label, np.count_nonzero(~np.isnan(row)), np.nanmean(row)))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Resamples forecasts of ECMWF and GFS onto a common time "
+                    "grid.")
+    parser.add_argument(
+        '-s',
+        '--series',
+        type=str,
+        action="append",
+        required=True,
+        help="Provider and parameter, e.g. \"ECMWF:2 metre temperature\", "
+             "repeat for several series (mandatory)"
+    )
+    parser.add_argument(
+        '-f',
+        '--from_datetimestr',
+        type=str,
+        help="Start of the time grid (YYYYMMDDHH), default=first validity time"
+    )
+    parser.add_argument(
+        '-t',
+        '--to_datetimestr',
+        type=str,
+        help="End of the time grid (YYYYMMDDHH), default=last validity time"
+    )
+    parser.add_argument(
+        '-n',
+        '--runs',
+        type=int,
+        help="Last number of forecast runs per provider, default=all"
+    )
+    parser.add_argument(
+        '-i',
+        '--interval',
+        type=int,
+        default=1,
+        help="Spacing of the time grid in hours, default=1"
+    )
+    args = parser.parse_args()
+
+    series_selected = list()
+    for item in args.series:
+        provider_selected, _, param_selected = item.partition(":")
+        if provider_selected not in PROVIDERS or not param_selected:
+            parser.error("Invalid series '{}'".format(item))
+        series_selected.append((provider_selected, param_selected))
+
+    main(
+        selection=series_selected,
+        date_from=args.from_datetimestr,
+        date_to=args.to_datetimestr,
+        runs=args.runs,
+        interval=args.interval * 3600
+    )
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""
+Subscriber of the "run ready" events of ECMWF, GFS, and GFS-DOWNSIZED, i.e.
+instead of polling forecast.json. A Unix datagram socket is bound in
+data/events of each provider, the ingest sends a JSON datagram per committed
+forecast run to all sockets found there. For the event see ecmwf_notify of
+ecmwf-opendata.
+"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+import selectors
+# internal
+from forecast_aux import PROVIDERS, DATA_DIR, read_forecast
+
+
+def event_dir(provider: str) -> str:
+    """
+    location of the sockets of the subscribers of the provider
+    :param provider: weather forecast provider ECMWF | GFS | GFS-DOWNSIZED
+    :return:
+    """
+    if provider not in PROVIDERS:
+        raise NotImplementedError("Wrong provider!")
+
+    return "{}/{}/data/events".format(DATA_DIR, PROVIDERS[provider])
+
+
+class Subscriber(object):
+    """
+    sockets of a subscriber, one per provider, removed on close
+    """
+
+    def __init__(
+            self,
+            providers: list[str],
+            name: str = None
+    ):
+        """
+        :param providers: weather forecast providers
+        :param name: of the sockets, default=process id
+        """
+        self.selector = selectors.DefaultSelector()
+        self.paths = list()
+        for provider in providers:
+            directory = event_dir(provider=provider)
+            os.makedirs(directory, exist_ok=True)
+            path = "{}/{}.sock".format(directory, name or os.getpid())
+            if os.path.exists(path):
+                os.remove(path)  # left over by a subscriber killed
+            receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            receiver.bind(path)
+            os.chmod(path, 0o666)  # docker owner is root, anyone can send
+            self.selector.register(receiver, selectors.EVENT_READ)
+            self.paths.append(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for key in list(self.selector.get_map().values()):
+            self.selector.unregister(key.fileobj)
+            key.fileobj.close()
+        self.selector.close()
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def events(self, timeout: float = None):
+        """
+        :param timeout: [s], default=wait forever
+        :return: generator of events, ends on timeout
+        """
+        while True:
+            ready = self.selector.select(timeout=timeout)
+            if not ready:
+                return
+            for key, _ in ready:
+                yield json.loads(key.fileobj.recv(1 << 20))
+
+
+def main(
+        providers: list[str],
+        read: bool = False,
+        timeout: float = None
+) -> None:
+    """
+    print the events as they arrive
+    :param providers: weather forecast providers
+    :param read: print the parameters of the new run read from forecast.json
+    :param timeout: [s], default=wait forever
+    :return:
+    """
+    with Subscriber(providers=providers) as subscriber:
+        print("Subscribed to {}".format(", ".join(providers)))
+        try:
+            for event in subscriber.events(timeout=timeout):
+                print("{provider} run {run} ready: {start} - {end}, "
+                      "{0} parameter(s)".format(len(event['parameters']),
+                                                **event))
+                if read:
+                    forecast = read_forecast(provider=event['provider'])
+                    for key, entry in sorted(
+                            forecast.get(event['run'], dict()).items()):
+                        print("  {} [{}]: {} value(s)".format(
+                            key, entry['unit'], len(entry['value'])))
+        except KeyboardInterrupt:
+            pass
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Subscribes to the events of new forecast runs of ECMWF "
+                    "or GFS.")
+    parser.add_argument(
+        '-p',
+        '--provider',
+        type=str,
+        nargs="+",
+        choices=PROVIDERS,
+        default=list(PROVIDERS),
+        help="Select forecast providers, default=all"
+    )
+    parser.add_argument(
+        '-r',
+        '--read',
+        action="store_true",
+        help="Print the parameters of each new run from forecast.json"
+    )
+    parser.add_argument(
+        '-t',
+        '--timeout',
+        type=float,
+        help="Exit after <timeout> seconds without event, default=never"
+    )
+
+    main(
+        providers=parser.parse_args().provider,
+        read=parser.parse_args().read,
+        timeout=parser.parse_args().timeout
+    )
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+"""
+Verification of the forecasts in forecast.json against on-site observations of
+the radiometer and weather station (PWV, temperature, pressure, humidity, and
+wind). Observations are ingested from CSV or InfluxDB line protocol files into
+a time-indexed store. Forecasts are joined to observations in bulk by a sorted
+merge, bias and RMSE are accumulated per provider, parameter, and lead time.
+Only forecast runs not verified before are processed.
+
+Mapping of observations to forecast parameters: tools/data/verification.json
+"""
+
+import os
+import sys
+import csv
+import json
+import argparse
+import numpy as np
+from datetime import datetime, timezone
+# internal
+from forecast_aux import PROVIDERS, DATA_DIR, read_forecast
+from forecast_resample import to_epoch
+
+VERIFY_DIR = "{}/tools/data".format(DATA_DIR)
+CONFIG_FILE = "{}/verification.json".format(VERIFY_DIR)
+OBSERVATION_FILE = "{}/observations.npz".format(VERIFY_DIR)
+SCORE_FILE = "{}/scores.json".format(VERIFY_DIR)
+
+
+def parse_time(value: str) -> int:
+    """
+    :param value: YYYYMMDDHHMM, epoch seconds, or ISO 8601 (UTC if naive)
+    :return: seconds since epoch
+    """
+    value = value.strip()
+    if value.isdigit() and len(value) == 12:
+        return int(to_epoch([value])[0])
+    try:
+        return int(float(value))
+    except ValueError:
+        dt = datetime.fromisoformat(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp())
+
+
+def read_csv(observation_file: str) -> dict[str, list]:
+    """
+    CSV with header, first column time, further columns one quantity each
+    :param observation_file:
+    :return: quantity: list of (seconds, value)
+    """
+    result = dict()
+    with open(observation_file, "r", newline="") as csv_handle:
+        reader = csv.reader(csv_handle)
+        header = [i.strip() for i in next(reader)]
+        for row in reader:
+            if not row:
+                continue
+            t = parse_time(row[0])
+            for quantity, value in zip(header[1:], row[1:]):
+                if value.strip() == "":
+                    continue
+                result.setdefault(quantity, list()).append((t, float(value)))
+
+    return result
+
+
+def read_line_protocol(observation_file: str) -> dict[str, list]:
+    """
+    measurement[,tag=value] field=value[,field=value] timestamp[ns]
+    :param observation_file:
+    :return: quantity: list of (seconds, value)
+    """
+    result = dict()
+    with open(observation_file, "r") as lp_handle:
+        for line in lp_handle:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                _, fields, timestamp = line.split(" ")
+            except ValueError:
+                print("Line without timestamp disregarded: {}".format(line))
+                continue
+            t = int(timestamp) // 10 ** 9
+            for field in fields.split(","):
+                quantity, _, value = field.partition("=")
+                try:
+                    value = float(value.rstrip("i"))  # i: integer field
+                except ValueError:
+                    continue  # string or boolean field
+                result.setdefault(quantity, list()).append((t, value))
+
+    return result
+
+
+def read_observations() -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """
+    :return: quantity: (sorted seconds, values)
+    """
+    if not os.path.exists(OBSERVATION_FILE):
+        return dict()
+    with np.load(OBSERVATION_FILE) as store:
+        return {k[:-5]: (store[k], store[k[:-5] + ".value"])
+                for k in store.files if k.endswith(".time")}
+
+
+def ingest(
+        observation_file: str,
+        fmt: str = None
+) -> None:
+    """
+    merge observations into the time-indexed store, later values of identical
+    timestamps supersede former ones
+    :param observation_file: CSV or line protocol file
+    :param fmt: csv | lp, derived from file extension if None
+    :return:
+    """
+    fmt = fmt or ("csv" if observation_file.endswith(".csv") else "lp")
+    new = read_csv(observation_file) if fmt == "csv" \
+        else read_line_protocol(observation_file)
+
+    store = read_observations()
+    for quantity, entries in new.items():
+        times, values = store.get(quantity, (np.empty(0, np.int64),
+                                             np.empty(0, np.float64)))
+        times = np.concatenate([times, np.array([i[0] for i in entries],
+                                                dtype=np.int64)])
+        values = np.concatenate([values, np.array([i[1] for i in entries],
+                                                  dtype=np.float64)])
+        # stable sort, keep last of duplicates
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+        keep = np.append(times[1:] != times[:-1], True)
+        store[quantity] = (times[keep], values[keep])
+        print("Observations '{}': {} ingested, {} stored".format(
+            quantity, len(entries), np.count_nonzero(keep)))
+
+    os.makedirs(VERIFY_DIR, exist_ok=True)
+    arrays = dict()
+    for quantity, (times, values) in store.items():
+        arrays[quantity + ".time"] = times
+        arrays[quantity + ".value"] = values
+    np.savez(OBSERVATION_FILE, **arrays)
+
+
+def match(
+        obs_times: np.ndarray,
+        times: np.ndarray,
+        tolerance: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    nearest observation of each forecast time by a sorted merge
+    :param obs_times: sorted observation times [s]
+    :param times: forecast validity times [s]
+    :param tolerance: max. time difference [s]
+    :return: index into observations, mask of valid matches
+    """
+    right = np.clip(np.searchsorted(obs_times, times), 0, len(obs_times) - 1)
+    left = np.clip(right - 1, 0, len(obs_times) - 1)
+    nearest = np.where(np.abs(obs_times[left] - times)
+                       <= np.abs(obs_times[right] - times), left, right)
+
+    return nearest, np.abs(obs_times[nearest] - times) <= tolerance
+
+
+def verify(providers: list[str]) -> dict:
+    """
+    score all forecast runs not verified before, whose validity times are
+    entirely covered by observations
+    :param providers: weather forecast providers
+    :return: scores
+    """
+    with open(CONFIG_FILE, "r") as config_handle:
+        config = json.load(config_handle)
+    observations = read_observations()
+    scores = json.load(open(SCORE_FILE, "r")) \
+        if os.path.exists(SCORE_FILE) else {"runs": {}, "scores": {}}
+
+    for provider in providers:
+        try:
+            forecast = read_forecast(provider=provider)
+        except FileNotFoundError:
+            print("No forecast.json for provider {}. Skipping ...".format(
+                provider))
+            continue
+        for pair in config['pairs']:
+            param = pair['forecast'].get(provider)
+            if not param or pair['observation'] not in observations:
+                continue
+            obs_times, obs_values = observations[pair['observation']]
+            obs_values = obs_values * pair.get('scale', 1.) \
+                + pair.get('offset', 0.)
+            done = scores['runs'].setdefault(provider, {}) \
+                .setdefault(param, list())
+
+            # collect all new runs, join them at once
+            times, values, leads, verified = list(), list(), list(), list()
+            for issue_date in sorted(forecast.keys()):
+                series = forecast[issue_date].get(param)
+                if issue_date in done or not series:
+                    continue
+                t = to_epoch(series['time'])
+                if t.max() > obs_times[-1]:
+                    continue  # observations not yet available
+                times.append(t)
+                values.append(np.asarray(series['value'], dtype=np.float64))
+                leads.append((t - to_epoch([issue_date])[0]) // 3600)
+                verified.append(issue_date)
+            if not verified:
+                continue
+            times = np.concatenate(times)
+            values = np.concatenate(values)
+            leads = np.concatenate(leads)
+
+            nearest, valid = match(obs_times=obs_times,
+                                   times=times,
+                                   tolerance=config['tolerance'])
+            # a single NaN would spoil the statistics of its lead time for good
+            valid &= ~np.isnan(values) & ~np.isnan(obs_values[nearest])
+            error = values[valid] - obs_values[nearest[valid]]
+            leads = leads[valid]
+
+            # sufficient statistics per lead time: n, sum, sum of squares
+            stats = scores['scores'].setdefault(provider, {}) \
+                .setdefault(param, dict())
+            size = int(leads.max()) + 1 if len(leads) else 0
+            n = np.bincount(leads, minlength=size)
+            s = np.bincount(leads, weights=error, minlength=size)
+            ss = np.bincount(leads, weights=error ** 2, minlength=size)
+            for lead in np.flatnonzero(n):
+                entry = stats.setdefault(str(lead), [0, 0., 0.])
+                entry[0] += int(n[lead])
+                entry[1] += float(s[lead])
+                entry[2] += float(ss[lead])
+            done.extend(verified)
+            print("Provider {}, Parameter {}: {} run(s), {} pairs verified"
+                  .format(provider, param, len(verified), len(error)))
+
+    os.makedirs(VERIFY_DIR, exist_ok=True)
+    with open(SCORE_FILE, "w") as score_handle:
+        json.dump(scores, score_handle, indent=2, sort_keys=True)
+
+    return scores
+
+
+def main(
+        observation_file: str = None,
+        fmt: str = None,
+        providers: list[str] = None
+) -> None:
+    """
+    ingest observations, if provided, verify new forecast runs, and print bias
+    and RMSE per provider, parameter, and lead time
+    :param observation_file: CSV or line protocol file
+    :param fmt: csv | lp, derived from file extension if None
+    :param providers: weather forecast providers, default=all
+    :return:
+    """
+    if observation_file:
+        ingest(observation_file=observation_file, fmt=fmt)
+    scores = verify(providers=providers or list(PROVIDERS))
+
+    for provider, params in scores['scores'].items():
+        for param, stats in params.items():
+            print("\n{} - {}\n{:>8} {:>8} {:>12} {:>12}".format(
+                provider, param, "Lead [h]", "N", "Bias", "RMSE"))
+            for lead in sorted(stats, key=int):
+                n, s, ss = stats[lead]
+                print("{:>8} {:>8} {:>12.4g} {:>12.4g}".format(
+                    lead, n, s / n, np.sqrt(ss / n)))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Verifies downloaded weather forecasts from ECMWF or GFS "
+                    "against on-site observations.")
+    parser.add_argument(
+        '-i',
+        '--ingest',
+        type=str,
+        help="Observation file (CSV or line protocol) to be ingested prior to "
+             "verification"
+    )
+    parser.add_argument(
+        '-f',
+        '--format',
+        type=str,
+        choices=["csv", "lp"],
+        help="Format of the observation file, default=file extension"
+    )
+    parser.add_argument(
+        '-p',
+        '--provider',
+        type=str,
+        nargs="+",
+        choices=PROVIDERS,
+        help="Select forecast provider(s), default=all"
+    )
+
+    main(
+        observation_file=parser.parse_args().ingest,
+        fmt=parser.parse_args().format,
+        providers=parser.parse_args().provider
+    )
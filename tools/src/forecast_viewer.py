@@ -16,9 +16,9 @@ from datetime import datetime, timezone
 from matplotlib.backend_bases import (KeyEvent, PickEvent, MouseButton,
                                       MouseEvent)
 from matplotlib.figure import Figure
+# internal
+from forecast_aux import provider_log_file
 
-# data directory relative to source
-DATA_DIR = "{}/../../".format(os.path.dirname(os.path.realpath(__file__)))
 PICKRADIUS = 5  # Points. How close the click needs to be to trigger an event.
 
 
@@ -121,17 +121,7 @@ def main(
 
     dict_fig: dict = dict()
 
-    match provider:
-        case "ECMWF":
-            log_file = "{}/ecmwf-opendata/data/forecast.json".format(DATA_DIR)
-        case  "GFS":
-            log_file = "{}/gfs/data/forecast.json".format(DATA_DIR)
-        case "GFS-DOWNSIZED":
-            log_file = "{}/gfs-downsized/data/forecast.json".format(DATA_DIR)
-        case _:
-           raise NotImplementedError("Wrong provider!")
-
-    dict_x = read_log(log_file=log_file)
+    dict_x = read_log(log_file=provider_log_file(provider=provider))
 
     after = datetimestr if datetimestr else datetime.strftime(
         datetime.now(timezone.utc), '%Y%m%d%H%M'
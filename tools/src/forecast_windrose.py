@@ -16,6 +16,7 @@ import numpy as np
 import math
 from matplotlib import colormaps
 from matplotlib import animation
+from matplotlib.container import BarContainer
 from datetime import datetime
 
 # data directory relative to source
@@ -26,6 +27,13 @@ DATA_DIR = "{}/../../".format(
 COLOR_MAP = 'jet'
 V_MAX = 20.  # max abs. windspeed on windrose
 TITLE = "{} Windspeed [m/s] and (from) Direction [°] at {}"
+TITLE_CLIMATOLOGY = "{} Wind Climatology [%] at {}"
+REGEX_DATETIME = re.compile(
+    r"^(20[234][0-9])(0?[1-9]|1[012])(0[1-9]|[12]\d|3[01])(00|06|12|18)$"
+)
+SECTORS = 16  # number of direction sectors, centered on north
+SPEED_CLASSES = [0., 2., 4., 6., 8., 10., 15., 20.]  # lower bounds [m/s]
+CACHE_DIR = "{}/tools/cache".format(DATA_DIR)
 
 
 def read_json(json_file: str) -> dict:
@@ -42,27 +50,12 @@ def read_json(json_file: str) -> dict:
     return res
 
 
-def main(
-        provider: str,
-        datetimestr: str = None,
-        video: bool = False
-) -> None:
+def provider_settings(provider: str) -> tuple[str, str, str, str]:
     """
-    plots forecasts after datetime string (YYYYMMDDHH), default=current date
+    files and wind component keys of the forecast provider
     :param provider: weather forecast provider ECMWF | GFS
-    :param datetimestr: format YYYYMMDDHH
-    :param video: if video is downloaded to mp4 
-    :return:
+    :return: forecast file, parameter file, u key, v key
     """
-    signal.signal(signal.SIGINT, signal.SIG_DFL)
-
-    regex_datetime = re.compile(
-        r"^(20[234][0-9])(0?[1-9]|1[012])(0[1-9]|[12]\d|3[01])(00|06|12|18)$"
-    )
-    if datetimestr:
-        if not re.match(regex_datetime, datetimestr):
-            raise ValueError("Invalid Date/Time provided.")
-
     if provider == "ECMWF":
         forecast_file = "{}/ecmwf-opendata/data/forecast.json".format(DATA_DIR)
         parameter_file = "{}/ecmwf-opendata/data/parameter.json".format(DATA_DIR)
@@ -76,6 +69,130 @@ def main(
     else:
         raise NotImplementedError("Wrong provider!")
 
+    return forecast_file, parameter_file, u_key, v_key
+
+
+def check_datetimestr(datetimestr: str) -> None:
+    """
+    validate datetime string (YYYYMMDDHH)
+    :param datetimestr: format YYYYMMDDHH
+    :return:
+    """
+    if datetimestr:
+        if not re.match(REGEX_DATETIME, datetimestr):
+            raise ValueError("Invalid Date/Time provided.")
+
+
+def wind(
+        u: list,
+        v: list
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    windspeed and (from) direction of wind components
+    :param u: u wind components
+    :param v: v wind components
+    :return: absolute windspeeds, directions in radians [0, 2pi[
+    """
+    u = np.asarray(u, dtype=float)
+    v = np.asarray(v, dtype=float)
+
+    return np.hypot(u, v), (np.pi + np.atan2(u, v)) % (2 * np.pi)
+
+
+def bin_wind(
+        v_abs: np.ndarray,
+        v_dir: np.ndarray
+) -> np.ndarray:
+    """
+    frequencies of direction sectors times speed classes
+    :param v_abs: absolute windspeeds
+    :param v_dir: wind (from) directions in radians
+    :return: counts of shape (SECTORS, len(SPEED_CLASSES))
+    """
+    counts, _, _ = np.histogram2d(
+        # shift by half a sector, such that sector 0 is centered on 0°
+        (v_dir + np.pi / SECTORS) % (2 * np.pi),
+        v_abs,
+        bins=(np.linspace(0., 2 * np.pi, SECTORS + 1),
+              SPEED_CLASSES + [np.inf])
+    )
+
+    return counts
+
+
+def read_cache(cache_file: str) -> dict:
+    """
+    read histogram cache per run, reset if binning has changed
+    :param cache_file: location of the cache file
+    :return:
+    """
+    bins = {"sectors": SECTORS, "speed_classes": SPEED_CLASSES}
+    if os.path.exists(cache_file):
+        cache = read_json(json_file=cache_file)
+        if cache.get('bins') == bins:
+            return cache
+
+    return {"bins": bins, "runs": dict()}
+
+
+def write_cache(
+        cache_file: str,
+        cache: dict
+) -> None:
+    """
+    write histogram cache atomically, i.e. never a partial file read
+    :param cache_file: location of the cache file
+    :param cache: see read_cache()
+    :return:
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(cache_file + ".tmp", "w") as cache_handle:
+        json.dump(cache, cache_handle)
+    os.replace(cache_file + ".tmp", cache_file)
+
+
+def create_bars(
+        ax: plt.Axes,
+        v_dir: np.ndarray,
+        v_abs: np.ndarray,
+        colors: np.ndarray
+) -> BarContainer:
+    """
+    draw all windspeed bars on the polar axes in a single call
+    :param ax: polar axes
+    :param v_dir: wind (from) directions in radians
+    :param v_abs: absolute windspeeds
+    :param colors: RGBA colors, one per bar
+    :return: container of the bars
+    """
+    return ax.bar(
+        x=v_dir,
+        height=v_abs,
+        width=np.pi / 16,
+        bottom=0.0,
+        color=colors,
+        alpha=0.5
+    )
+
+
+def main(
+        provider: str,
+        datetimestr: str = None,
+        video: bool = False
+) -> None:
+    """
+    plots forecasts after datetime string (YYYYMMDDHH), default=current date
+    :param provider: weather forecast provider ECMWF | GFS
+    :param datetimestr: format YYYYMMDDHH
+    :param video: if video is downloaded to mp4 
+    :return:
+    """
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    check_datetimestr(datetimestr)
+    forecast_file, parameter_file, u_key, v_key = \
+        provider_settings(provider)
+
     dict_x = read_json(json_file=forecast_file)
     location = read_json(json_file=parameter_file)["geo_coordinates"]["location"]
 
@@ -95,37 +212,46 @@ def main(
     except IndexError:
         raise IndexError("Forecast date/time not found in forecast.json!")
 
-    v_abs = (np.sqrt(np.power(u, 2) + np.power(v, 2)))
+    v_abs, v_dir = wind(u=u, v=v)
     v_abs_max = max(v_abs)  # ToDo max be used
     number_entries = len(v_abs)
-    v_dir = (np.pi + np.atan2(u, v)) % (2 * np.pi)
+    # one vectorized colormap lookup for all windspeeds
+    colors = colormaps[COLOR_MAP](v_abs / V_MAX)
+    labels = [str(datetime.strptime(i, '%Y%m%d%H%M')) for i in time]
 
     fig = plt.figure(figsize=(8, 8))
     # initialize settings
     ax = plt.subplot(projection='polar')
     ax.set_rlim(0, math.ceil(V_MAX + 0.5))
     fig.suptitle(TITLE.format(provider, location))
+    # artists are created once and updated in place for each frame
+    bars = create_bars(ax=ax, v_dir=v_dir, v_abs=v_abs, colors=colors)
+    # blitting redraws the axes bbox only, hence the timestamp lives inside
+    label = ax.text(0., 1., "", transform=ax.transAxes,
+                    ha="left", va="top", animated=True)
+    for bar in bars:
+        bar.set_animated(True)
+        bar.set_visible(False)
+
+    def init():
+        for bar in bars:
+            bar.set_visible(False)
+        label.set_text("")
+        return *bars, label
 
     def animate(i):
-        if not video and i == number_entries - 1:
-            ax.clear()
-        fig.suptitle(TITLE.format(provider, location))
-        ax.set_title(datetime.strptime(time[i], '%Y%m%d%H%M'))
-        ax.set_rlim(0, math.ceil(V_MAX + 0.5))
-        ax.bar(
-            x=v_dir[i],
-            height=v_abs[i],
-            width=np.pi / 16,
-            bottom=0.0,
-            color=colormaps[COLOR_MAP](v_abs[i] / V_MAX),
-            alpha=0.5
-        )
+        if i == 0:  # restart of the loop, wipe all previous bars
+            init()
+        bars[i].set_visible(True)
+        label.set_text(labels[i])
+        return *bars, label
 
     anim = animation.FuncAnimation(
         fig,
         animate,
+        init_func=init,
         repeat=(not video),
-        blit=False,
+        blit=True,
         frames=range(number_entries),
         interval=250  # msec
     )
@@ -139,6 +265,109 @@ def main(
     sys.exit(0)
 
 
+def climatology(
+        provider: str,
+        runs: int = None,
+        from_datetimestr: str = None,
+        to_datetimestr: str = None
+) -> None:
+    """
+    plots the distribution of windspeed and direction across several forecast
+    runs as stacked windrose. Histograms are cached per run, hence only runs
+    not binned before are processed.
+    :param provider: weather forecast provider ECMWF | GFS
+    :param runs: consider the last number of runs only
+    :param from_datetimestr: first run considered, format YYYYMMDDHH
+    :param to_datetimestr: last run considered, format YYYYMMDDHH
+    :return:
+    """
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    check_datetimestr(from_datetimestr)
+    check_datetimestr(to_datetimestr)
+    forecast_file, parameter_file, u_key, v_key = \
+        provider_settings(provider)
+
+    dict_x = read_json(json_file=forecast_file)
+    location = read_json(json_file=parameter_file)["geo_coordinates"]["location"]
+
+    issue_dates = [
+        k for k in sorted(dict_x.keys())
+        if (not from_datetimestr or k >= from_datetimestr + "00")
+        and (not to_datetimestr or k <= to_datetimestr + "00")
+    ]
+    if runs:
+        issue_dates = issue_dates[-runs:]
+
+    cache_file = "{}/windrose_{}.json".format(CACHE_DIR, provider.lower())
+    cache = read_cache(cache_file=cache_file)
+
+    selected = list()
+    for issue_date in issue_dates:
+        try:
+            u = dict_x[issue_date][u_key]['value']
+            v = dict_x[issue_date][v_key]['value']
+        except KeyError:
+            print("Disregarded Forecast - Issue Date: {}, wind forecast data "
+                  "not found".format(issue_date))
+            continue
+        cached = cache['runs'].get(issue_date)
+        # runs may grow, e.g. GFS updates forecast.json file by file
+        if not cached or cached['entries'] != len(u):
+            cache['runs'][issue_date] = {
+                "entries": len(u),
+                "counts": bin_wind(*wind(u=u, v=v)).tolist()
+            }
+            print("Issue Date: {} binned".format(issue_date))
+        selected.append(issue_date)
+
+    if not selected:
+        raise IndexError("Forecast date/time not found in forecast.json!")
+
+    # runs no longer in forecast.json, e.g. dropped by the retention policy
+    for issue_date in list(cache['runs']):
+        if issue_date not in dict_x:
+            del cache['runs'][issue_date]
+    write_cache(cache_file=cache_file, cache=cache)
+
+    # totals over all runs, shape (SECTORS, len(SPEED_CLASSES))
+    counts = np.sum(
+        [cache['runs'][issue_date]['counts'] for issue_date in selected],
+        axis=0
+    )
+    if not counts.sum():  # e.g. runs without any valid wind data
+        print("No wind data in {} forecast(s) issued {} - {}. Nothing to "
+              "plot.".format(len(selected), selected[0][:-2],
+                             selected[-1][:-2]))
+        return
+    frequencies = 100. * counts / counts.sum()
+
+    fig = plt.figure(figsize=(8, 8))
+    ax = plt.subplot(projection='polar')
+    fig.suptitle(TITLE_CLIMATOLOGY.format(provider, location))
+    ax.set_title("{} Forecast(s) issued {} - {}".format(
+        len(selected), selected[0][:-2], selected[-1][:-2]))
+    colors = colormaps[COLOR_MAP](np.linspace(0., 1., len(SPEED_CLASSES)))
+    theta = np.linspace(0., 2 * np.pi, SECTORS, endpoint=False)
+    bottom = np.zeros(SECTORS)
+    for i, lower in enumerate(SPEED_CLASSES):
+        ax.bar(
+            x=theta,
+            height=frequencies[:, i],
+            width=2 * np.pi / SECTORS,
+            bottom=bottom,
+            color=colors[i],
+            edgecolor="white",
+            label="{:g}-{:g} m/s".format(lower, SPEED_CLASSES[i + 1])
+            if i + 1 < len(SPEED_CLASSES) else ">{:g} m/s".format(lower)
+        )
+        bottom += frequencies[:, i]
+    fig.legend(loc='lower right')
+
+    plt.show()
+    sys.exit(0)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Plots downloaded weather forecasts from ECMWF or GFS.")
@@ -163,9 +392,44 @@ if __name__ == "__main__":
         help="Store video on tools/plots/plot.mp4, default=No",
         action='store_true'
     )
-
-    main(
-        provider=parser.parse_args().provider,
-        datetimestr=parser.parse_args().datetimestr,
-        video=parser.parse_args().video,
+    parser.add_argument(
+        '-c',
+        '--climatology',
+        help="Windrose of all forecasts selected by -n, -f, and -t, "
+             "default=No",
+        action='store_true'
+    )
+    parser.add_argument(
+        '-n',
+        '--runs',
+        type=int,
+        help="Climatology of the last number of forecasts, default=all"
+    )
+    parser.add_argument(
+        '-f',
+        '--from_datetimestr',
+        type=str,
+        help="Climatology of forecasts issued from datetime string "
+             "(YYYYMMDDHH), default=first"
     )
+    parser.add_argument(
+        '-t',
+        '--to_datetimestr',
+        type=str,
+        help="Climatology of forecasts issued until datetime string "
+             "(YYYYMMDDHH), default=last"
+    )
+
+    if parser.parse_args().climatology:
+        climatology(
+            provider=parser.parse_args().provider,
+            runs=parser.parse_args().runs,
+            from_datetimestr=parser.parse_args().from_datetimestr,
+            to_datetimestr=parser.parse_args().to_datetimestr
+        )
+    else:
+        main(
+            provider=parser.parse_args().provider,
+            datetimestr=parser.parse_args().datetimestr,
+            video=parser.parse_args().video,
+        )